@@ -1,20 +1,59 @@
 import os
 import torch
-import sumo
 import random
-import importlib
 import datetime
 import numpy as np
-from tqdm import tqdm
-import gymnasium as gym
 import torch.optim as optim
 import torch.nn.functional as F
+from contextlib import nullcontext
 from collections import namedtuple
-from models.base import BaseModel
+from models.base import BaseModel, model_kwargs
+from utils.runtime import ThreadPolicy
+from utils.lazy import lazy_import, make_env
+from utils.registry import MODELS, NOISES
+from utils.optuna_callbacks import TrialEvaluationCallback
+from utils.action_repeat import step_repeated
+from utils.spaces import is_pixel_space, stack_space, observation_dtype
+from buffers.replay import ReplayBuffer
+from buffers.history import ObservationHistory, HistoryReplayBuffer
 
-import wandb
 from typing import Literal, Dict, Any, Optional, NamedTuple
 
+# Only loaded when logging is enabled
+wandb = lazy_import("wandb")
+# Loaded once an environment is created
+gym = lazy_import("gymnasium")
+# Only loaded when learning data parallel
+dist = lazy_import("torch.distributed")
+
+# The modules of the other optional features (shared and served replays,
+# prefetching, warm-up workers, checkpoints, adaptive evaluation) are
+# imported by the code paths which enable them.
+
+# Runtime options of BaseAgent, shared by every agent. The agents forward
+# them to BaseAgent as keyword arguments, so a new option is only added
+# here and to the signature of BaseAgent.
+BASE_AGENT_OPTIONS = {
+    'mixed_precision': None,
+    'thread_policy': None,
+    'warm_up_cache_dir': None,
+    'warm_up_workers': 1,
+    'warm_up_mode': 'online',
+    'checkpoint_keep_top_k': 3,
+    'snapshot_freq_episodes': None,
+    'quantized_inference': False,
+    'quantize_sync_interval': None,
+    'adaptive_evaluation': False,
+    'eval_min_episodes': 5,
+    'eval_ci_tolerance': 0.05,
+    'eval_num_envs': 8,
+    'history_length': 1,
+    'action_repeat': 1,
+    'shared_replay': False,
+    'replay_server': None,
+    'prefetch_depth': 2
+}
+
 BASE_AGENT_DEFAULT_PARAMS = {
     'env_id': "BipedalWalker-v3",
     'render': False,
@@ -33,9 +72,31 @@ BASE_AGENT_DEFAULT_PARAMS = {
     'critic': 'SimpleCritic',
     'critic_params': {'SimpleCritic': {'hidden_size': 256}},
     'actor': 'SimpleActor',
-    'actor_params': {'SimpleCritic': {'hidden_size': 256}}
+    'actor_params': {'SimpleCritic': {'hidden_size': 256}},
+    **BASE_AGENT_OPTIONS
 }
 
+# Transition stored in the replay buffer. Defined at module level so that
+# it can be pickled.
+Transition = namedtuple('Transition', ['state', 
+                                       'action', 
+                                       'n_step_reward', 
+                                       'n_step_next_state', 
+                                       'terminated', 
+                                       'returns'])
+
+def transition_spec(observation_space: "gym.spaces.Box",
+                    action_space: "gym.spaces.Box") -> dict:
+    """Shape and dtype of the fields of the stored transitions.
+    """
+    observation = (observation_space.shape, observation_dtype(observation_space))
+    return {'state': observation,
+            'action': (action_space.shape, np.float32),
+            'n_step_reward': ((), np.float32),
+            'n_step_next_state': observation,
+            'terminated': ((), bool),
+            'returns': ((), np.float32)}
+
 class BaseAgent:
 
     def __init__(self,
@@ -56,14 +117,34 @@ class BaseAgent:
                  critic_params: dict,
                  actor: BaseModel,
                  actor_params: dict,
-                 logger_title: Optional[str] = None):
+                 logger_title: Optional[str] = None,
+                 mixed_precision: Optional[Literal['bf16']] = None,
+                 thread_policy: Optional[dict] = None,
+                 data_parallel: bool = False,
+                 replay: Optional["ShardedSampler"] = None,
+                 warm_up_cache_dir: Optional[str] = None,
+                 warm_up_workers: int = 1,
+                 warm_up_mode: Literal['online', 'random', 'noise'] = 'online',
+                 checkpoint_keep_top_k: int = 3,
+                 snapshot_freq_episodes: Optional[int] = None,
+                 quantized_inference: bool = False,
+                 quantize_sync_interval: Optional[int] = None,
+                 adaptive_evaluation: bool = False,
+                 eval_min_episodes: int = 5,
+                 eval_ci_tolerance: float = 0.05,
+                 eval_num_envs: int = 8,
+                 history_length: int = 1,
+                 action_repeat: int = 1,
+                 shared_replay: bool = False,
+                 replay_server: Optional[dict] = None,
+                 prefetch_depth: int = 2):
         # Hyper_parameters much have hparam in the variable name.
         self._hparam_seed = seed
         self.__env_str = env_id
         if render:
-            self.__env = gym.make(self.__env_str, render_mode="human")
+            self.__env = make_env(self.__env_str, render_mode="human")
         else:
-            self.__env = gym.make(self.__env_str)
+            self.__env = make_env(self.__env_str)
         # Set the seed of the pseudo-random generators
         # (python, numpy, pytorch, gym, action_space)
         # Seed python RNG
@@ -80,6 +161,47 @@ class BaseAgent:
         self._hparam_gamma = gamma
         self._hparam_n_step = n_step
         self._hparam_normalize_observations = normalize_observations
+        # Frames are stored as uint8 and scaled by the encoder of the networks
+        self._pixel_observations = is_pixel_space(self.env.observation_space)
+        if self._pixel_observations and data_parallel:
+            raise NotImplementedError("Pixel observations are not supported with data parallel learning.")
+        # The networks see the last history_length observations, stacked along
+        # their last axis. The replay stores every observation once.
+        if history_length < 1:
+            raise ValueError("history_length must be >= 1.")
+        if history_length > 1 and (warm_up_mode != 'online' or warm_up_cache_dir is not None):
+            raise NotImplementedError("Observation history requires the 'online' warm-up mode.")
+        self._hparam_history_length = history_length
+        self._observation_space = stack_space(self.env.observation_space, history_length)
+        # Every action is applied for action_repeat environment steps. The
+        # transitions, and the steps counted by learn, are the decisions.
+        if action_repeat < 1:
+            raise ValueError("action_repeat must be >= 1.")
+        if action_repeat > 1 and (warm_up_mode != 'online' or warm_up_cache_dir is not None):
+            raise NotImplementedError("Action repeat requires the 'online' warm-up mode.")
+        self._hparam_action_repeat = action_repeat
+        # Replay in shared memory, which the warm-up workers write to directly
+        if shared_replay and (data_parallel or history_length > 1):
+            raise NotImplementedError("The shared replay supports neither data parallel learning nor observation history.")
+        self._hparam_shared_replay = shared_replay
+        # Replay in a table of replay_server.py, given as {'socket': path} and
+        # optionally a 'table' name. By default, the runs whose stored
+        # transitions are interchangeable share a table.
+        if replay_server is not None:
+            if shared_replay:
+                raise ValueError("The shared replay and the replay server are exclusive.")
+            if data_parallel or history_length > 1 or snapshot_freq_episodes is not None:
+                raise NotImplementedError("The replay server supports neither data parallel learning, "
+                                          "observation history nor training snapshots.")
+        self._replay_server = replay_server
+
+        # Batches of the updates sampled in a background thread, at most
+        # prefetch_depth ahead. Sampled synchronously with 0, and for phases
+        # of a single update, which leave nothing to overlap with.
+        if prefetch_depth < 0:
+            raise ValueError("prefetch_depth must be >= 0.")
+        self._prefetch_depth = prefetch_depth
+        self._prefetcher = None
         self._hparam_num_test_episodes = num_test_episodes
         self._enable_wandb_logging = enable_wandb_logging
         self._hparam_num_training_episodes = num_training_episodes
@@ -89,30 +211,92 @@ class BaseAgent:
         noise_params = exploration_noise_params[exploration_noise_type]
         for param in noise_params:
             setattr(self, '_hparam_exploration_noise_' + param, noise_params[param])
-        module = importlib.import_module("utils.noise")
-        self._action_noise = getattr(module, exploration_noise_type)(**noise_params)
+        # The noise process draws from its own generator, seeded with the agent
+        self._action_noise = NOISES.get(exploration_noise_type)(**noise_params,
+                                                                rng=np.random.default_rng(self._hparam_seed))
 
         # Load Critic module
         self._hparam_critic_module = critic
         critic_params_local = critic_params[critic]
         for param in critic_params_local:
             setattr(self, '_hparam_critic_' + param, critic_params_local[param])
-        module = importlib.import_module("models.models")        
-        self._critic_module = getattr(module, critic)
+        self._critic_module = MODELS.get(critic)
         self._critic_params = critic_params_local
+        self._critic_model_params = model_kwargs(critic_params_local)
 
         # Load Actor module
         self._hparam_actor_module = actor
         actor_params_local = actor_params[actor]
         for param in actor_params_local:
             setattr(self, '_hparam_actor_' + param, actor_params_local[param])
-        module = importlib.import_module("models.models")        
-        self._actor_module = getattr(module, actor)
+        self._actor_module = MODELS.get(actor)
         self._actor_params = actor_params_local
+        self._actor_model_params = model_kwargs(actor_params_local)
 
         self._device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
+        # Mixed precision mode of the updates. The weights, optimizer state
+        # and target networks always stay in float32.
+        if mixed_precision not in (None, 'bf16'):
+            raise ValueError("Invalid mixed precision mode {}.".format(mixed_precision))
+        self._hparam_mixed_precision = mixed_precision
+
+        # Threading and core affinity of the process
+        self._thread_policy = ThreadPolicy.from_params(thread_policy)
+        self._thread_policy.apply()
+
+        # Data parallel learning. Requires an initialized process group, and
+        # the replay shared by the learners, see agents.distributed.
+        self._data_parallel = data_parallel
+        if self._data_parallel and not dist.is_initialized():
+            raise RuntimeError("Data parallel learning requires an initialized process group.")
+        if self._data_parallel and replay is None:
+            raise ValueError("Data parallel learning requires the replay shared by the learners.")
+        self._shared_learner_replay = replay
+
+        # Warm-up phase. 'online' runs the warm-up steps through the training
+        # loop, 'random' and 'noise' collect them without any network in a pool
+        # of worker processes before the loop starts. The cache only holds
+        # network-free warm-up data, so it implies the 'random' mode by default.
+        if warm_up_mode not in ('online', 'random', 'noise'):
+            raise ValueError("Invalid warm-up mode {}.".format(warm_up_mode))
+        if warm_up_cache_dir is not None and warm_up_mode == 'online':
+            warm_up_mode = 'random'
+        self._hparam_warm_up_mode = warm_up_mode
+        self._warm_up_workers = warm_up_workers
+        self._warm_up_cache = None
+        if warm_up_cache_dir is not None:
+            from buffers.warmup import WarmUpCache
+            self._warm_up_cache = WarmUpCache(cache_dir=warm_up_cache_dir,
+                                              num_workers=warm_up_workers)
+
         self._max_mean_test_reward = -float("inf")
+        self._checkpoint_prefix = None
+        self._checkpoint_keep_top_k = checkpoint_keep_top_k
+        self._checkpoint_manager = None
+
+        # Full training snapshots to resume from
+        if snapshot_freq_episodes is not None and self._data_parallel:
+            raise NotImplementedError("Training snapshots are not supported with data parallel learning.")
+        self._snapshot_freq_episodes = snapshot_freq_episodes
+        self._snapshot_writer = None
+
+        # Action selection with an int8 copy of the actor, refreshed every
+        # quantize_sync_interval update phases, or at the end of every episode
+        # if None. Created by the agents with their actor.
+        self._hparam_quantized_inference = quantized_inference
+        self._hparam_quantize_sync_interval = quantize_sync_interval
+        self._quantized_actor = None
+
+        # Adaptive evaluation runs between eval_min_episodes and num_test_episodes
+        # episodes, in batches of eval_num_envs environments, see
+        # BatchedEvaluator.run_adaptive.
+        self._hparam_adaptive_evaluation = adaptive_evaluation
+        self._hparam_eval_min_episodes = eval_min_episodes
+        self._hparam_eval_ci_tolerance = eval_ci_tolerance
+        self._hparam_eval_num_envs = eval_num_envs
+        self._evaluator = None
+        self._last_eval_num_episodes = 0
 
         # Set up wandb Logging
         if self.is_wandb_logging_enabled:
@@ -142,8 +326,18 @@ class BaseAgent:
         return self.__env_str
     
     @property
-    def env(self) -> gym.Env:
+    def env(self) -> "gym.Env":
         return self.__env
+
+    @property
+    def observation_space(self) -> "gym.spaces.Box":
+        """Space of the (stacked) observations fed to the networks.
+        """
+        return self._observation_space
+
+    @property
+    def history_length(self) -> int:
+        return self._hparam_history_length
     
     @property
     def device(self):
@@ -157,6 +351,16 @@ class BaseAgent:
     def gamma(self):
         return self._hparam_gamma
     
+    @property
+    def action_repeat(self) -> int:
+        return self._hparam_action_repeat
+
+    @property
+    def decision_gamma(self) -> float:
+        """Discount between two decisions, i.e. over action_repeat steps.
+        """
+        return self.gamma**self.action_repeat
+
     @property
     def n_step(self):
         return self._hparam_n_step
@@ -169,14 +373,79 @@ class BaseAgent:
     def max_mean_test_reward(self) -> float:
         return self._max_mean_test_reward
     
+    @property
+    def replay(self):
+        """Replay buffer of the agent.
+        """
+        raise NotImplementedError()
+
     @property
     def warm_up_iters(self):
         return self._hparam_warm_up_iters
 
+    @property
+    def is_data_parallel(self) -> bool:
+        return self._data_parallel
+
+    @property
+    def world_size(self) -> int:
+        return dist.get_world_size() if self.is_data_parallel else 1
+
+    @property
+    def is_main_process(self) -> bool:
+        return not self.is_data_parallel or dist.get_rank() == 0
+
+    def autocast(self):
+        """Returns the autocast context under which the forward passes of an update run.
+        """
+        return torch.autocast(device_type=self.device.type,
+                              dtype=torch.bfloat16,
+                              enabled=self._hparam_mixed_precision == 'bf16')
+
+    def _wrap_data_parallel(self,
+                            module: torch.nn.Module) -> torch.nn.Module:
+        """Wraps a network in DistributedDataParallel when learning data parallel.
+        The returned module must be used for the forward passes of the updates.
+        """
+        if self.is_data_parallel:
+            from torch.nn.parallel import DistributedDataParallel
+            return DistributedDataParallel(module)
+        return module
+
+    def _no_sync(self,
+                 module: torch.nn.Module):
+        """Context in which the gradients of the module are not all-reduced.
+        """
+        if self.is_data_parallel:
+            return module.no_sync()
+        return nullcontext()
+
+    def _shard_batch_size(self,
+                          batch_size: int) -> int:
+        """Number of samples each process draws for an update.
+        """
+        return max(1, batch_size // self.world_size)
+
+    def _broadcast_command(self,
+                           command: Optional[str] = None,
+                           payload: Any = None):
+        """Sends a command from the main process to the learner processes.
+        """
+        objects = [(command, payload)]
+        dist.broadcast_object_list(objects, src=0)
+        return objects[0]
+
+    def is_update_step(self,
+                       step: int) -> bool:
+        """Whether the networks are updated at the given step.
+        """
+        return False
 
     def get_agent_arguments(self,
                             local_dict: dict,
                             default_dict: dict):
+        # The options forwarded to BaseAgent come in the kwargs of the agents
+        local_dict = dict(local_dict, **local_dict.get('kwargs', {}))
         args_dict = {}
         for key in local_dict:
             if key in default_dict.keys():
@@ -209,6 +478,90 @@ class BaseAgent:
             raise RuntimeError("Detected Normalized vector having value less than zero.")
         """
         return normalized_obs
+
+    def _actor_kwargs(self, critic: BaseModel) -> dict:
+        """Arguments of an actor network. Actors running on the encoder of
+        the critic get the encoder of ``critic``.
+        """
+        kwargs = {
+            'observation_type': self.observation_space,
+            'action_type': self.env.action_space
+        }
+        kwargs.update(self._actor_model_params)
+        if getattr(self._actor_module, 'shares_critic_encoder', False):
+            kwargs['encoder'] = critic.encoder
+        return kwargs
+
+    def _make_replay(self, replay_size: int) -> ReplayBuffer:
+        """Experience replay of the agents. With an observation history, the
+        stacked observations are rebuilt from single observations at sampling.
+        """
+        if self._shared_learner_replay is not None:
+            return self._shared_learner_replay
+        if self._replay_server is not None:
+            from utils.replay_client import ReplayClient
+            return ReplayClient(self._replay_server['socket'],
+                                table=self._replay_server.get('table', self._replay_table_name()),
+                                maxsize=replay_size,
+                                transition_type=Transition)
+        if self._hparam_shared_replay:
+            from buffers.shared import SharedReplayBuffer
+            return SharedReplayBuffer(maxsize=replay_size,
+                                      spec=self._transition_spec(),
+                                      transition_type=Transition)
+        if self.history_length == 1:
+            return ReplayBuffer(maxsize=replay_size)
+        return HistoryReplayBuffer(maxsize=replay_size,
+                                   history_length=self.history_length,
+                                   n_step=self._hparam_n_step,
+                                   transition_type=Transition)
+
+    def _replay_table_name(self) -> str:
+        """Default replay server table, named after everything the stored
+        transitions depend on.
+        """
+        return "{}/n_step={}/gamma={}/normalize={}/action_repeat={}".format(self.env_id,
+                                                                           self._hparam_n_step,
+                                                                           self._hparam_gamma,
+                                                                           self._hparam_normalize_observations,
+                                                                           self.action_repeat)
+
+    def _transition_spec(self) -> dict:
+        return transition_spec(self.env.observation_space, self.env.action_space)
+
+    def _sample_batches(self,
+                        num_batches: int,
+                        batch_size: int):
+        """Batches of an update phase as tensors on the device, or None
+        while the replay is empty. See ``buffers.prefetch.BatchPrefetcher``.
+        """
+        from buffers.prefetch import BatchPrefetcher, batch_to_tensors
+        # A single batch is sampled before its update either way, so handing
+        # it over from the thread would only add latency.
+        if self._prefetch_depth > 0 and num_batches > 1:
+            if self._prefetcher is None:
+                self._prefetcher = BatchPrefetcher(self.replay, self.device, queue_depth=self._prefetch_depth)
+            yield from self._prefetcher.batches(num_batches, batch_size)
+            return
+        for _ in range(num_batches):
+            num_samples, batch = self.replay.sample_batch(batch_size)
+            yield batch_to_tensors(batch, self.device) if num_samples > 0 else None
+
+    def _close_prefetcher(self):
+        if self._prefetcher is not None:
+            self._prefetcher.close()
+            self._prefetcher = None
+
+    def process_observation(self, obs: np.array) -> np.array:
+        """Observation as stored in the replay and fed to the networks: float32
+        and normalized if enabled, or the raw uint8 frame for pixel observations.
+        """
+        if self._pixel_observations:
+            return obs
+        obs = obs.astype(np.float32)
+        if self._hparam_normalize_observations:
+            obs = self.normalize_observation(obs)
+        return obs
     
     def _post_process_action(self, action):
         """
@@ -243,6 +596,7 @@ class BaseAgent:
         # define which metrics will be plotted against it
         wandb.define_metric("reward/*", step_metric="episode")
         wandb.define_metric("episode_length/*", step_metric="episode")
+        wandb.define_metric("episodes/*", step_metric="episode")
 
     def learn_start_callback(self,):
         """Learn Start callback. Called at the start of learn function once.
@@ -265,12 +619,52 @@ class BaseAgent:
         """
         pass
 
+    def learn_warm_up_callback(self,
+                               transitions: Transition) -> None:
+        """Warm-up callback. Called once with the bulk loaded warm-up transitions,
+        given as a Transition of arrays.
+        """
+        pass
+
     def learn_start_episode_callback(self,
                                      episode):
         """Start of Episode callback. Called at the start of every episode.
         """
         pass
 
+    @property
+    def last_eval_num_episodes(self) -> int:
+        """Number of episodes used by the last evaluation.
+        """
+        return self._last_eval_num_episodes
+
+    def adaptive_evaluate(self) -> (float, float):
+        """Evaluates with a number of episodes adapted to the spread of the
+        rewards and to the best mean reward so far.
+
+        Every evaluation uses the same seed set, so that the comparisons
+        with the best mean reward are paired.
+        """
+        if self._evaluator is None:
+            from utils.evaluation import BatchedEvaluator
+            self._evaluator = BatchedEvaluator(self.env_id,
+                                               num_envs=self._hparam_eval_num_envs,
+                                               history_length=self.history_length,
+                                               action_repeat=self.action_repeat,
+                                               observation_fn=self.process_observation)
+
+        def policy_fn(obs: np.array) -> np.array:
+            return self._post_process_action(self.get_action(obs, mode='eval'))
+
+        first_seed = self._hparam_seed + 1000000
+        rewards, lengths = self._evaluator.run_adaptive(policy_fn,
+                                                        seeds=list(range(first_seed, first_seed + self._hparam_num_test_episodes)),
+                                                        min_episodes=self._hparam_eval_min_episodes,
+                                                        ci_tolerance=self._hparam_eval_ci_tolerance,
+                                                        best_mean=self.max_mean_test_reward)
+        self._last_eval_num_episodes = len(rewards)
+        return np.mean(rewards), np.mean(lengths)
+
     def learn_evaluate_callback(self,
                                 num_episodes: int,
                                 render: bool = False) -> (float, float):
@@ -279,15 +673,14 @@ class BaseAgent:
         eval_episode_reward = []
         eval_episode_length = []
         test_env = self.env
+        history = ObservationHistory(self.history_length)
         
         for _ in range(num_episodes):
             
             self.learn_start_episode_callback(_+1)
 
             state, info = test_env.reset()
-            state = state.astype(np.float32)
-            if self._hparam_normalize_observations:
-                state = self.normalize_observation(state)
+            state = history.reset(self.process_observation(state))
 
             done = False
             cum_reward = 0
@@ -306,11 +699,12 @@ class BaseAgent:
                 action = self._post_process_action(action=action)
                 
                 # Perform the action in the environment
-                next_state, reward, terminated, truncated, info = test_env.step(action[0])
-                next_state = next_state.astype(np.float32)
-                if self._hparam_normalize_observations:
-                    next_state = self.normalize_observation(next_state)
+                next_state, reward, _, terminated, truncated, info, num_steps = step_repeated(test_env,
+                                                                                             action[0],
+                                                                                             self.action_repeat)
+                next_state = history.push(self.process_observation(next_state))
                 cum_reward += reward
+                ep_length += num_steps - 1
 
                 if terminated or truncated:
                     eval_episode_reward.append(cum_reward)
@@ -326,9 +720,10 @@ class BaseAgent:
         
         eval_episode_reward = np.array(eval_episode_reward)
         eval_episode_length = np.array(eval_episode_length)
+        self._last_eval_num_episodes = num_episodes
         return np.mean(eval_episode_reward), np.mean(eval_episode_length)
 
-    def __calculate_n_step_returns(self, 
+    def _calculate_n_step_returns(self, 
                                    episode: list,
                                    n_step: int,
                                    gamma: float):
@@ -341,14 +736,6 @@ class BaseAgent:
             n_step (int): number of future steps to consider.
             gamma (float)[0-1]: Discount factor
         """
-        Transition = namedtuple('Transition', ['state', 
-                                               'action', 
-                                               'n_step_reward', 
-                                               'n_step_next_state', 
-                                               'terminated', 
-                                               'returns'])
-        
-
         assert n_step > 0, "n-step must be > 1."
         assert gamma > 0 and gamma <= 1 , "gamma must be between (0, 1]."
 
@@ -384,19 +771,118 @@ class BaseAgent:
         buffer_transitions.reverse()
         return buffer_transitions
 
-    def learn(self):
+    def __learn_data_parallel_worker(self):
+        """Learner loop of the non-main processes. The main process collects the
+        experience into the replay shared by the learners and broadcasts the
+        update steps, so every process runs the same number of updates.
+        """
+        while True:
+            command, payload = self._broadcast_command()
+            if command == "step":
+                self.learn_step_callback(step=payload,
+                                         transition_tuple=None)
+            elif command == "stop":
+                break
+
+    def __learn_warm_up(self):
+        """Inserts warm_up_iters network-free transitions in the replay, either
+        from the cache or streamed chunk by chunk from the worker pool.
+        """
+        from buffers.warmup import n_step_transitions, iter_warm_up_chunks, write_warm_up_chunks
+        # The workers write to the shared replay, bypassing learn_warm_up_callback
+        if self._hparam_shared_replay and self._warm_up_cache is None and self.warm_up_iters <= self.replay.maxsize:
+            normalize = self._hparam_normalize_observations and not self._pixel_observations
+            write_warm_up_chunks(self.replay,
+                                 self.env_id,
+                                 seed=self._hparam_seed,
+                                 num_steps=self.warm_up_iters,
+                                 num_workers=self._warm_up_workers,
+                                 n_step=self._hparam_n_step,
+                                 gamma=self._hparam_gamma,
+                                 policy=self._hparam_warm_up_mode,
+                                 observation_bounds=(self.env.observation_space.low,
+                                                     self.env.observation_space.high) if normalize else None)
+            return
+
+        if self._warm_up_cache is not None:
+            chunks = [self._warm_up_cache.load_or_collect(self.env_id,
+                                                          seed=self._hparam_seed,
+                                                          num_steps=self.warm_up_iters,
+                                                          policy=self._hparam_warm_up_mode)]
+        else:
+            chunks = iter_warm_up_chunks(self.env_id,
+                                         seed=self._hparam_seed,
+                                         num_steps=self.warm_up_iters,
+                                         num_workers=self._warm_up_workers,
+                                         policy=self._hparam_warm_up_mode)
+
+        for data in chunks:
+            warm_up_transitions = n_step_transitions(data,
+                                                     Transition,
+                                                     n_step=self._hparam_n_step,
+                                                     gamma=self._hparam_gamma,
+                                                     normalize_fn=self.normalize_observation if self._hparam_normalize_observations and not self._pixel_observations else None)
+            self.learn_warm_up_callback(warm_up_transitions)
+
+    def learn(self,
+              eval_callback: Optional[TrialEvaluationCallback] = None,
+              max_steps: Optional[int] = None,
+              evaluation_freq_steps: Optional[int] = None,
+              resume: Optional[str] = None):
+        """Trains the agent.
+
+        Args:
+            eval_callback (TrialEvaluationCallback): Receives the mean reward of
+                every evaluation. Learning stops once it prunes the trial.
+            max_steps (int): Budget of steps. The episode running
+                when the budget is used up is truncated and learning stops.
+            evaluation_freq_steps (int): Evaluate at the end of the first episode
+                after every multiple of this many steps (and at the end of the
+                budget) instead of every evaluation_freq_episodes episodes.
+            resume (str): Snapshot directory of a previous run of the same
+                configuration. Learning continues from its latest snapshot.
+
+        With action repeat, the steps (also those of warm_up_iters and of the
+        update frequency) are decisions of action_repeat environment steps.
+        """
 
         self.learn_start_callback()
+
+        if not self.is_main_process:
+            self.__learn_data_parallel_worker()
+            return
         
         # Initialize variables
+        start_episode = 0
         total_steps_count = 0
+        next_evaluation_step = evaluation_freq_steps
+        budget_exhausted = False
+        pruned = False
 
-        for episode in tqdm(range(0, self._hparam_num_training_episodes)):
+        if resume is not None:
+            if self.is_data_parallel:
+                raise NotImplementedError("Resuming is not supported with data parallel learning.")
+            counters = self.load_training_snapshot(resume)
+            start_episode = counters['episode']
+            total_steps_count = counters['total_steps_count']
+            next_evaluation_step = counters['next_evaluation_step']
+
+        # Bulk load the warm-up transitions instead of collecting them step by step
+        elif self._hparam_warm_up_mode != 'online' and self.warm_up_iters > 0:
+            self.__learn_warm_up()
+            total_steps_count = self.warm_up_iters
+
+        history = ObservationHistory(self.history_length)
+
+        from tqdm import tqdm
+        for episode in tqdm(range(start_episode, self._hparam_num_training_episodes),
+                            initial=start_episode,
+                            total=self._hparam_num_training_episodes):
             
+            # The replay gets the single observations, the networks their history
             state, info = self.env.reset()
-            state = state.astype(np.float32)
-            if self._hparam_normalize_observations:
-                state = self.normalize_observation(state)
+            state = self.process_observation(state)
+            stacked_state = history.reset(state)
             
             episode_sum_reward = 0
             episode_length = 0
@@ -415,27 +901,35 @@ class BaseAgent:
                     }, commit=False)
                 
                 # Get an action to execute
-                action = self.get_action(state,
+                action = self.get_action(stacked_state,
                                          mode="train")
                 action = self._post_process_action(action=action)
 
-                # Perform the action in the environment
-                next_state, reward, terminated, truncated, info = self.env.step(action[0])
-                next_state = next_state.astype(np.float32)
+                # Perform the action in the environment. The transition
+                # reward is discounted within the repeat.
+                next_state, reward, discounted_reward, terminated, truncated, info, num_steps = step_repeated(self.env,
+                                                                                                             action[0],
+                                                                                                             self.action_repeat,
+                                                                                                             gamma=self._hparam_gamma)
+                next_state = self.process_observation(next_state)
+                stacked_state = history.push(next_state)
                 episode_sum_reward += reward
-
-                if self._hparam_normalize_observations:
-                    next_state = self.normalize_observation(next_state)
+                episode_length += num_steps - 1
 
                 # Transition tuple
-                t = (state, action[0], reward, next_state, terminated)
+                t = (state, action[0], discounted_reward, next_state, terminated)
 
 
+                if self.is_data_parallel and self.is_update_step(total_steps_count):
+                    self._broadcast_command("step", total_steps_count)
                 self.learn_step_callback(step=total_steps_count,
                                            transition_tuple=t)
                 epsiode_transitions.append(t)
 
-                if truncated or terminated:  
+                # The step budget truncates the episode
+                budget_exhausted = max_steps is not None and total_steps_count >= max_steps
+
+                if truncated or terminated or budget_exhausted:  
                     done = True
                 
                 state = next_state
@@ -443,50 +937,116 @@ class BaseAgent:
             #print("Episode: {} Train Cum Reward: {:.2f} Last Mean Test Cum Reward: Total Steps: {}.".format(episode+1, episode_sum_reward, total_steps_count))
             
             # Calculate n-step returns from the transitions
-            buffer_transitions = self.__calculate_n_step_returns(episode=epsiode_transitions,
+            buffer_transitions = self._calculate_n_step_returns(episode=epsiode_transitions,
                                                                  n_step=self._hparam_n_step,
-                                                                 gamma=self._hparam_gamma)
+                                                                 gamma=self.decision_gamma)
             self.learn_episode_callback(episode + 1, 
                                           episode_sum_reward,
                                           episode_length,
                                           buffer_transitions)
             
             # Evaluate agent performance
-            if (episode + 1) % self._hparam_evaluation_freq_episodes == 0:
-                eval_mean_reward, eval_mean_ep_length = self.learn_evaluate_callback(self._hparam_num_test_episodes)
-                
-                if self.is_wandb_logging_enabled:
-                    self.writer.log({
-                        "reward/eval": eval_mean_reward,
-                        "episode_length/eval": eval_mean_ep_length
-                    }, commit=False)
-                
-                # Save the model checkpoint
-                if eval_mean_reward > self.max_mean_test_reward:
-                    
-                    self._max_mean_test_reward = eval_mean_reward
-                    if self.is_wandb_logging_enabled:
-                        prefix = "checkpoints/{}/{}/".format(self.__class__.__name__, wandb.run._run_id)
-                    else:
-                        prefix = "checkpoints/{}/".format(self.__class__.__name__)
-                    
-                    if not os.path.exists(prefix):
-                        os.makedirs(prefix)
-                    
-                    check_point_name = self.env_id.replace("/", "_") + "_" + self.__class__.__name__ + "_{}_episode_".format(episode+1) + "{:.2f}_mean_reward_checkpoint.pkt".format(eval_mean_reward)
-                    self.save_checkpoint(prefix + check_point_name)
-                    
-                    if self.is_wandb_logging_enabled:
-                        self.log_artifact(name=check_point_name,
-                                          filepath=prefix + check_point_name,
-                                          type="model",
-                                          metadata={"mean_test_reward": eval_mean_reward})
+            if evaluation_freq_steps is None:
+                evaluate = (episode + 1) % self._hparam_evaluation_freq_episodes == 0
+            else:
+                evaluate = total_steps_count >= next_evaluation_step or budget_exhausted
+                while next_evaluation_step <= total_steps_count:
+                    next_evaluation_step += evaluation_freq_steps
+
+            if evaluate:
+                eval_mean_reward = self._evaluate_and_checkpoint(episode + 1)
+                if eval_callback is not None:
+                    # Steps are the resource of the multi-fidelity pruners
+                    eval_callback.step(eval_mean_reward,
+                                       step=None if evaluation_freq_steps is None else total_steps_count)
+                    pruned = eval_callback.is_pruned
 
             if self.is_wandb_logging_enabled:
                 self.writer.log({"reward/train": episode_sum_reward,
                                  "episode_length/train": episode_length,
                                  "epsiode": episode+1}, commit=True)
+
+            # Snapshots are taken between episodes, where the environment
+            # state is fully determined by its random generator.
+            if self._snapshot_freq_episodes is not None \
+                and (episode + 1) % self._snapshot_freq_episodes == 0:
+                self.save_training_snapshot({'episode': episode + 1,
+                                             'total_steps_count': total_steps_count,
+                                             'next_evaluation_step': next_evaluation_step})
+
+            if pruned or budget_exhausted:
+                break
+
+        # Release the learner processes
+        if self.is_data_parallel:
+            self._broadcast_command("stop")
+
+        # Stop the sampling thread and wait for the pending checkpoints
+        self._close_prefetcher()
+        if self._checkpoint_manager is not None:
+            self._checkpoint_manager.flush()
     
+    @property
+    def checkpoint_prefix(self) -> str:
+        """Directory the checkpoints of the run are written to.
+        """
+        if self._checkpoint_prefix is not None:
+            return self._checkpoint_prefix
+        if self.is_wandb_logging_enabled:
+            return "checkpoints/{}/{}/".format(self.__class__.__name__, wandb.run._run_id)
+        return "checkpoints/{}/".format(self.__class__.__name__)
+
+    @property
+    def checkpoint_manager(self) -> "CheckpointManager":
+        """Background writer of the checkpoints of the run, created on first use.
+        """
+        if self._checkpoint_manager is None or self._checkpoint_manager.directory != self.checkpoint_prefix:
+            from utils.checkpoint import CheckpointManager
+            log_artifact_fn = None
+            if self.is_wandb_logging_enabled:
+                log_artifact_fn = lambda name, path, metadata: self.log_artifact(name=name,
+                                                                                 filepath=path,
+                                                                                 type="model",
+                                                                                 metadata=metadata)
+            self._checkpoint_manager = CheckpointManager(directory=self.checkpoint_prefix,
+                                                         keep_top_k=self._checkpoint_keep_top_k,
+                                                         log_artifact_fn=log_artifact_fn)
+        return self._checkpoint_manager
+
+    def _evaluate_and_checkpoint(self,
+                                 episode: int) -> float:
+        """Evaluates the agent and queues a checkpoint. The checkpoint is logged
+        as an artifact on a new best mean reward.
+
+        Args:
+            episode (int): Number of training episodes completed.
+        """
+        if self._hparam_adaptive_evaluation:
+            eval_mean_reward, eval_mean_ep_length = self.adaptive_evaluate()
+        else:
+            eval_mean_reward, eval_mean_ep_length = self.learn_evaluate_callback(self._hparam_num_test_episodes)
+        
+        if self.is_wandb_logging_enabled:
+            self.writer.log({
+                "reward/eval": eval_mean_reward,
+                "episode_length/eval": eval_mean_ep_length,
+                "episodes/eval": self.last_eval_num_episodes
+            }, commit=False)
+        
+        # Save the model checkpoint. Only the top-k and the latest are kept.
+        is_best = eval_mean_reward > self.max_mean_test_reward
+        if is_best:
+            self._max_mean_test_reward = eval_mean_reward
+
+        check_point_name = self.env_id.replace("/", "_") + "_" + self.__class__.__name__ + "_{}_episode_".format(episode) + "{:.2f}_mean_reward_checkpoint.pkt".format(eval_mean_reward)
+        self.checkpoint_manager.save(name=check_point_name,
+                                     state=self.checkpoint_state(),
+                                     score=eval_mean_reward,
+                                     metadata={"mean_test_reward": eval_mean_reward},
+                                     log_artifact=is_best)
+        
+        return eval_mean_reward
+
     def log_artifact(self,
                      name: str,
                      filepath: str, 
@@ -507,10 +1067,103 @@ class BaseAgent:
         """
         raise NotImplementedError()
 
+    @property
+    def snapshot_dir(self) -> str:
+        """Directory the training snapshots of the run are written to.
+        """
+        return self.checkpoint_prefix + "resume/"
+
+    def training_state(self) -> dict:
+        """Networks, target networks and optimizers saved in the training snapshots.
+        """
+        raise NotImplementedError()
+
+    def load_training_state(self, state: dict):
+        """Restores the output of ``training_state``.
+        """
+        raise NotImplementedError()
+
+    def save_training_snapshot(self, counters: dict):
+        """Saves everything needed to continue learning bit-for-bit: the
+        training state, the replay, the exploration noise, the random
+        generators, the loop counters and the best evaluation reward.
+
+        Args:
+            counters (dict): Loop counters of ``learn``.
+        """
+        if self._snapshot_writer is None or self._snapshot_writer.directory != self.snapshot_dir:
+            from utils.checkpoint import TrainingSnapshotWriter
+            self._snapshot_writer = TrainingSnapshotWriter(self.snapshot_dir)
+
+        rng = {'python': random.getstate(),
+               'numpy': np.random.get_state(),
+               'torch': torch.get_rng_state(),
+               'env': self.env.np_random.bit_generator.state,
+               'action_space': self.env.action_space.np_random.bit_generator.state}
+        if torch.cuda.is_available():
+            rng['cuda'] = torch.cuda.get_rng_state_all()
+
+        state = {'agent': self.training_state(),
+                 'action_noise': self._action_noise,
+                 'rng': rng,
+                 'counters': counters,
+                 'max_mean_test_reward': self._max_mean_test_reward}
+        self._snapshot_writer.save(name="snapshot_episode_{}".format(counters['episode']),
+                                   state=state,
+                                   replay_state=self.replay.state_dict(),
+                                   columns=self.replay.columns)
+
+    def load_training_snapshot(self, directory: str) -> dict:
+        """Restores the latest snapshot of a directory.
+
+        Returns:
+            The loop counters of ``learn``.
+        """
+        from utils.checkpoint import load_training_snapshot
+        state, columns = load_training_snapshot(directory, map_location=self.device)
+
+        self.load_training_state(state['agent'])
+        self.replay.load_state_dict(state['replay'], columns, Transition)
+        self._action_noise = state['action_noise']
+        self._max_mean_test_reward = state['max_mean_test_reward']
+
+        rng = state['rng']
+        random.setstate(rng['python'])
+        np.random.set_state(rng['numpy'])
+        torch.set_rng_state(rng['torch'])
+        if 'cuda' in rng and torch.cuda.is_available():
+            torch.cuda.set_rng_state_all(rng['cuda'])
+        self.env.np_random.bit_generator.state = rng['env']
+        self.env.action_space.np_random.bit_generator.state = rng['action_space']
+
+        print("Resumed from {} at episode {}.".format(directory, state['counters']['episode']))
+        return state['counters']
+
+    def checkpoint_state(self) -> dict:
+        """State of the trainer saved in the checkpoints.
+        """
+        raise NotImplementedError()
+
+    def policy_state(self) -> dict:
+        """Everything but the actor weights needed to run the policy, see
+        ``agents.policy.Policy``. Plain python types only, so that checkpoints
+        can be loaded with ``weights_only=True``.
+        """
+        return {'env_id': self.env_id,
+                'actor': self._hparam_actor_module,
+                'actor_params': self._actor_model_params,
+                'observation_low': self.observation_space.low.tolist(),
+                'observation_high': self.observation_space.high.tolist(),
+                'history_length': self.history_length,
+                'action_repeat': self.action_repeat,
+                'action_low': self.env.action_space.low.tolist(),
+                'action_high': self.env.action_space.high.tolist(),
+                'normalize_observations': self._hparam_normalize_observations and not self._pixel_observations}
+
     def save_checkpoint(self, path: str):
-        """Method to save the state of the trainer.
+        """Method to save the state of the trainer synchronously.
 
         Args:
             path (str): Path to save the checkpoint.
         """
-        raise NotImplementedError()
\ No newline at end of file
+        torch.save(self.checkpoint_state(), path)
\ No newline at end of file
@@ -1,24 +1,23 @@
-import optuna
 from typing import Literal, Dict, Any, Optional
 
 import torch
 import random
 import datetime
 import numpy as np
-from tqdm import tqdm
-import gymnasium as gym
-from gymnasium import Env
 import torch.optim as optim
 import torch.nn.functional as F
 from collections import namedtuple
 
 from models.base import BaseModel
-from buffers.replay import ReplayBuffer
-import wandb
+from models.quantization import QuantizedActor
 
+from utils.lazy import lazy_import
 from utils.optuna_callbacks import TrialEvaluationCallback
 
-from agents.base import BaseAgent
+from agents.base import BaseAgent, BASE_AGENT_OPTIONS
+
+optuna = lazy_import("optuna")
+wandb = lazy_import("wandb")
 
 
 DDPG_DEFAULT_PARAMS = {
@@ -45,16 +44,16 @@ DDPG_DEFAULT_PARAMS = {
     'enable_wandb_logging': True,
     'logger_title': 'test_logger',
     'exploration_noise_type': 'NormalNoise',
-    'exploration_noise_params': {'NormalNoise': {'mu': 0.0, 'sigma': 0.3}}
+    'exploration_noise_params': {'NormalNoise': {'mu': 0.0, 'sigma': 0.3}},
+    **BASE_AGENT_OPTIONS
 }
 
-def sample_ddpg_params(op_trial: optuna.Trial) -> Dict[str, Any]:
+def sample_ddpg_params(op_trial: "optuna.Trial") -> Dict[str, Any]:
 
     """Sampler for DDPG hyperparameters."""
     replay_size = op_trial.suggest_int("replay_size", int(10e3), int(10e5))
-    polyak = 1 - op_trial.suggest_float("polyak", 0.00001, 0.1),
-    actor_critic_hidden_size = op_trial.suggest_int("actor_critic_hidden_size", 32, 512)
-    activation = op_trial.suggest_categorical("activation", ['relu', 'tanh'])
+    polyak = 1 - op_trial.suggest_float("polyak", 0.00001, 0.1)
+    hidden_size = op_trial.suggest_int("hidden_size", 32, 512)
     update_batch_size = op_trial.suggest_int('update_batch_size', 64, 256)
     update_frequency = op_trial.suggest_int('update_frequency', 1, int(20e3))
     update_iterations = op_trial.suggest_int('update_iterations', 1, 20)
@@ -69,18 +68,18 @@ def sample_ddpg_params(op_trial: optuna.Trial) -> Dict[str, Any]:
     return {
         'replay_size': replay_size,
         'polyak': polyak,
-        'actor_critic_hidden_size': actor_critic_hidden_size,
-        'activation': activation,
         'update_batch_size': update_batch_size,
         'update_frequency': update_frequency,
         'update_iterations': update_iterations,
         'gamma': gamma,
-        'critic_lr': critic_lr,
-        'actor_lr': actor_lr,
-        'critic_loss': critic_loss,
-        'exploration_noise_scale': exploration_noise_scale,
         'warm_up_iters': warm_up_iters,
-        'max_gradient_norm': max_gradient_norm
+        'max_gradient_norm': max_gradient_norm,
+        'actor': 'SimpleActor',
+        'actor_params': {'SimpleActor': {'hidden_size': hidden_size, 'lr': actor_lr}},
+        'critic': 'SimpleCritic',
+        'critic_params': {'SimpleCritic': {'hidden_size': hidden_size, 'lr': critic_lr, 'loss_fn': critic_loss}},
+        'exploration_noise_type': 'NormalNoise',
+        'exploration_noise_params': {'NormalNoise': {'mu': 0.0, 'sigma': exploration_noise_scale}}
     }
 
 class DDPG(BaseAgent):
@@ -109,7 +108,9 @@ class DDPG(BaseAgent):
                  critic_params: dict,
                  actor: BaseModel,
                  actor_params: dict,
-                 logger_title: Optional[str] = None):
+                 logger_title: Optional[str] = None,
+                 # Options of BaseAgent, see BASE_AGENT_OPTIONS
+                 **kwargs):
         
         # Store the object arguments. Required for loading checkpoint
         self.__agent_args = self.get_agent_arguments(locals(),DDPG_DEFAULT_PARAMS)
@@ -130,7 +131,8 @@ class DDPG(BaseAgent):
                          critic_params,
                          actor,
                          actor_params,
-                         logger_title)
+                         logger_title,
+                         **kwargs)
 
         # Hyper_parameters much have hparam in the variable name.
         self._hparam_polyak = polyak
@@ -152,33 +154,40 @@ class DDPG(BaseAgent):
             self.set_wandb_logging_metrics()
 
         # Experience Replay
-        self.__exp_replay = ReplayBuffer(maxsize=replay_size)
+        self.__exp_replay = self._make_replay(replay_size)
 
         # Critic Networks
         critic_params = {
-            'observation_type': self.env.observation_space,
+            'observation_type': self.observation_space,
             'action_type': self.env.action_space
         }
-        critic_params.update(self._critic_params)
+        critic_params.update(self._critic_model_params)
         self.__critic = self._critic_module(**critic_params) .to(self.device)
         self.__critic_target = self._critic_module(**critic_params) .to(self.device)
         self.__critic_optimizer = optim.Adam(self.critic.parameters(),
-                                             lr=critic_params['lr'])
+                                             lr=self._critic_params['lr'])
         
         # Actor Networks
-        actor_params = {
-            'observation_type': self.env.observation_space,
-            'action_type': self.env.action_space
-        }
-        actor_params.update(self._actor_params)
-        self.__actor = self._actor_module(**actor_params).to(self.device)
-        self.__actor_target = self._actor_module(**actor_params).to(self.device)
-        self.__actor_optimizer = optim.Adam(self.actor.parameters(),
-                                            lr=actor_params['lr'])
+        self.__actor = self._actor_module(**self._actor_kwargs(self.critic)).to(self.device)
+        self.__actor_target = self._actor_module(**self._actor_kwargs(self.critic_target)).to(self.device)
+        self.__actor_optimizer = optim.Adam(self.actor.trainable_parameters(),
+                                            lr=self._actor_params['lr'])
 
         # Initialize target and primary weights to same values.
         self.critic.load_state_dict(self.critic_target.state_dict())
         self.actor.load_state_dict(self.actor_target.state_dict())
+
+        # Networks used for the forward passes of the updates. Wrapping broadcasts
+        # the weights of the main process, so the targets are synced afterwards.
+        self.__critic_learner = self._wrap_data_parallel(self.critic)
+        self.__actor_learner = self._wrap_data_parallel(self.actor)
+        self.critic_target.load_state_dict(self.critic.state_dict())
+        self.actor_target.load_state_dict(self.actor.state_dict())
+
+        # Int8 actor for action selection
+        if self._hparam_quantized_inference:
+            self._quantized_actor = QuantizedActor(self.actor,
+                                                   sync_interval=self._hparam_quantize_sync_interval)
         
     @property
     def critic(self):
@@ -196,6 +205,10 @@ class DDPG(BaseAgent):
     def actor_target(self):
         return self.__actor_target
     
+    @property
+    def replay(self):
+        return self.__exp_replay
+
     @property
     def critic_optimizer(self):
         return self.__critic_optimizer
@@ -216,12 +229,12 @@ class DDPG(BaseAgent):
         
     def actor_soft_update(self,
                           polyak: float):
-        for param, target_param in zip(self.actor.parameters(), self.actor_target.parameters()):
+        for param, target_param in zip(self.actor.trainable_parameters(), self.actor_target.trainable_parameters()):
             target_param.data.copy_( polyak * target_param.data + (1 - polyak) * param.data )
 
     def actor_hard_update(self,
                           polyak: float):
-        for param, target_param in zip(self.actor.parameters(), self.actor_target.parameters()):
+        for param, target_param in zip(self.actor.trainable_parameters(), self.actor_target.trainable_parameters()):
             target_param.data.copy_( param.data )
     
     def set_wandb_logging_metrics(self) -> None:
@@ -234,10 +247,17 @@ class DDPG(BaseAgent):
         wandb.define_metric("returns/estimated", step_metric="step")
         wandb.define_metric("returns/true_returns", step_metric="step")
 
+    def learn_warm_up_callback(self, transitions) -> None:
+
+        # Bulk insert the warm-up transitions into the replay buffer
+        self.__exp_replay.add_batch(transitions)
+
     def learn_episode_callback(self, episode: int, cum_reward: float, episode_length: int, n_step_transition_tuple: list) -> None:
         
         # Add the episode to the replay buffer
         self.__exp_replay.add_epsiode(n_step_transition_tuple)
+        if self._quantized_actor is not None:
+            self._quantized_actor.end_episode()
             
         # log the current replay size
         if self.is_wandb_logging_enabled:
@@ -253,34 +273,19 @@ class DDPG(BaseAgent):
         returns_estimated = []
         returns_true = []
 
-        for _ in range(0, self._hparam_update_iterations):
+        # Batches of transitions from the replay, sampled ahead of the updates
+        for batch in self._sample_batches(self._hparam_update_iterations, batch_size):
 
-            # Sample a batch of transitions from the replay
-            num_samples, samples = self.__exp_replay.sample(batch_size)
+            if batch is not None:
 
-            if num_samples > 0:
-
-                states = []
-                actions = []
-                rewards = []
-                next_states = []
-                dones = []
-                returns = []
-
-                for sample in samples:
-                    states.append(sample.state)
-                    actions.append(sample.action)
-                    rewards.append(sample.n_step_reward)
-                    next_states.append(sample.n_step_next_state)
-                    dones.append(sample.terminated)
-                    returns.append(sample.returns)
-                
-                states = torch.Tensor(np.array(states)).to(self.device)
-                actions = torch.Tensor(np.array(actions)).to(self.device)
-                rewards = torch.Tensor(np.array(rewards)).to(self.device)
-                next_states = torch.Tensor(np.array(next_states)).to(self.device)
-                dones = torch.Tensor(1 - np.array(dones)).to(self.device)
-                returns = torch.Tensor(np.array(returns)).to(self.device)
+                # The replay stores float32 columns, so the batch is wrapped without copies.
+                # Frames are transferred as uint8 and scaled by the encoder on the device.
+                states = batch.state
+                actions = batch.action
+                rewards = batch.n_step_reward
+                next_states = batch.n_step_next_state
+                dones = 1.0 - batch.terminated
+                returns = batch.returns
 
                 # ------------------ Update Critic Network -------------------- #
 
@@ -288,13 +293,15 @@ class DDPG(BaseAgent):
                 Q_s = None
                 self.critic_target.eval()
                 self.actor_target.eval()
-                with torch.no_grad():
-                    Q_s = self.critic_target(next_states, self.actor_target(next_states))
+                with self.autocast(), torch.no_grad():
+                    Q_s = self.critic_target(next_states, self.actor_target(next_states)).float()
                 self.critic_target.train()
                 self.actor_target.train()
 
-                target = rewards + (self.gamma**self.n_step) * dones * Q_s.squeeze(dim=1)
-                Q = self.critic(states, actions).squeeze(dim=1)
+                target = rewards + (self.decision_gamma**self.n_step) * dones * Q_s.squeeze(dim=1)
+                with self.autocast():
+                    Q = self.__critic_learner(states, actions).squeeze(dim=1)
+                Q = Q.float()
 
                 if self._critic_params['loss_fn'] == 'mse':
                     critic_loss = F.mse_loss(Q, target)
@@ -311,11 +318,13 @@ class DDPG(BaseAgent):
                 self.critic_optimizer.step()
 
                 # ------------------ Update Actor Network -------------------- #
-                actor_loss = -self.critic(states, self.actor(states)).mean()
+                # The critic gradients of the actor loss are discarded, skip their all-reduce
+                with self.autocast(), self._no_sync(self.__critic_learner):
+                    actor_loss = -self.__critic_learner(states, self.__actor_learner(states)).float().mean()
                 self.actor_optimizer.zero_grad()
                 actor_loss.backward()
                 # Clip the gradients
-                torch.nn.utils.clip_grad_norm_(self.actor.parameters(), self._hparam_max_gradient_norm)
+                torch.nn.utils.clip_grad_norm_(self.actor.trainable_parameters(), self._hparam_max_gradient_norm)
                 # Update gradients
                 self.actor_optimizer.step()
                 
@@ -340,14 +349,21 @@ class DDPG(BaseAgent):
         return critic_loss.mean(), actor_losses.mean(), returns_estimated.mean(), returns_true.mean() 
 
 
+    def is_update_step(self,
+                       step: int) -> bool:
+        return step % self._hparam_update_frequency == 0 \
+            and step > self.warm_up_iters
+
     def learn_step_callback(self, 
                               step: int,
                               transition_tuple: tuple) -> None:
         """Step callback. Called at every step.
         """
-        if step % self._hparam_update_frequency == 0 \
-            and step > self.warm_up_iters:
-            critic_loss, actor_loss, returns_est, returns_true = self.__train_step(batch_size=self._hparam_update_batch_size)
+        if self.is_update_step(step):
+            with self._thread_policy.update():
+                critic_loss, actor_loss, returns_est, returns_true = self.__train_step(batch_size=self._shard_batch_size(self._hparam_update_batch_size))
+            if self._quantized_actor is not None:
+                self._quantized_actor.step()
 
             if self.is_wandb_logging_enabled:
                 self.writer.log({
@@ -359,6 +375,12 @@ class DDPG(BaseAgent):
 
     def learn_start_callback(self):
         self._action_noise.reset(self.env.action_space.shape[0])
+        if self._thread_policy.is_auto_tune_enabled:
+            self._thread_policy.tune(self.actor,
+                                     self.critic,
+                                     observation_space=self.observation_space,
+                                     batch_size=self._hparam_update_batch_size,
+                                     device=self.device)
 
     def learn_start_episode_callback(self, 
                                      episode):
@@ -372,10 +394,13 @@ class DDPG(BaseAgent):
         # Get the actions prediction from the actor network
         actions_torch = None
         
-        with torch.no_grad():
-            self.actor.eval()
-            actions_torch = self.actor(torch.from_numpy(state).to(self.device))
-            self.actor.train()
+        with self._thread_policy.inference(), torch.no_grad():
+            if self._quantized_actor is not None:
+                actions_torch = self._quantized_actor(torch.from_numpy(state))
+            else:
+                self.actor.eval()
+                actions_torch = self.actor(torch.from_numpy(state).to(self.device))
+                self.actor.train()
         actions = actions_torch.cpu().numpy()
         
         # Add noise if we are in training mode only
@@ -398,14 +423,38 @@ class DDPG(BaseAgent):
         self.actor.load_state_dict(state["actor"])
         self.actor_optimizer.load_state_dict(state["actor_optimizer"])
         hyper_params = state["hyper_params"]
+        if self._quantized_actor is not None:
+            self._quantized_actor.refresh()
         print("Loaded checkpoint: {}".format(path))
 
-    def save_checkpoint(self, path: str):
-        torch.save({
+    def training_state(self) -> dict:
+        state = self.checkpoint_state()
+        state["critic_target"] = self.critic_target.state_dict()
+        state["actor_target"] = self.actor_target.state_dict()
+        if self._quantized_actor is not None:
+            state["quantized_actor"] = self._quantized_actor.state_dict()
+        return state
+
+    def load_training_state(self, state: dict):
+        self.critic.load_state_dict(state["critic"])
+        self.critic_target.load_state_dict(state["critic_target"])
+        self.critic_optimizer.load_state_dict(state["critic_optimizer"])
+        self.actor.load_state_dict(state["actor"])
+        self.actor_target.load_state_dict(state["actor_target"])
+        self.actor_optimizer.load_state_dict(state["actor_optimizer"])
+        if self._quantized_actor is not None:
+            if "quantized_actor" in state:
+                self._quantized_actor.load_state_dict(state["quantized_actor"])
+            else:
+                self._quantized_actor.refresh()
+
+    def checkpoint_state(self) -> dict:
+        return {
             "critic": self.critic.state_dict(),
             "actor": self.actor.state_dict(),
             "critic_optimizer": self.critic_optimizer.state_dict(),
             "actor_optimizer": self.actor_optimizer.state_dict(),
             "hyper_params": self.__agent_args,
             "algo": "DDPG",
-        }, path)
+            "policy": self.policy_state(),
+        }
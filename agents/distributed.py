@@ -0,0 +1,87 @@
+import os
+import torch.distributed as dist
+import torch.multiprocessing as mp
+from typing import Literal
+
+from buffers.shared import SharedReplayBuffer, ShardedSampler
+
+def _data_parallel_worker(rank: int,
+                          algo: Literal['DDPG', 'TD3'],
+                          params: dict,
+                          replay: SharedReplayBuffer,
+                          world_size: int,
+                          master_addr: str,
+                          master_port: int):
+
+    os.environ['MASTER_ADDR'] = master_addr
+    os.environ['MASTER_PORT'] = str(master_port)
+    dist.init_process_group("gloo", rank=rank, world_size=world_size)
+
+    params = params.copy()
+    params['data_parallel'] = True
+    # Every process samples its shard of the same batch from the shared replay
+    params['replay'] = ShardedSampler(replay, rank, world_size, seed=params['seed'])
+    # The other random generators, e.g. of the target noise, differ between processes
+    params['seed'] = params['seed'] + rank
+    # Only the main process collects experience, evaluates and logs.
+    if rank != 0:
+        params['enable_wandb_logging'] = False
+
+    # Split the cores between the learner processes.
+    if params.get('thread_policy') is None:
+        num_cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+        params['thread_policy'] = {'update_threads': max(1, num_cores // world_size)}
+
+    if algo == "DDPG":
+        from agents.ddpg import DDPG
+        agent = DDPG(**params)
+    elif algo == "TD3":
+        from agents.td3 import TD3
+        agent = TD3(**params)
+    else:
+        raise NotImplementedError()
+
+    try:
+        agent.learn()
+    finally:
+        dist.destroy_process_group()
+        replay.close()
+
+def launch_data_parallel(algo: Literal['DDPG', 'TD3'],
+                         params: dict,
+                         world_size: int,
+                         master_addr: str = "127.0.0.1",
+                         master_port: int = 29500):
+    """Trains an agent with ``world_size`` CPU learner processes on this machine.
+
+    The main process (rank 0) interacts with the environment and writes the
+    transitions to a single replay in shared memory, mapped by every process,
+    and broadcasts the update steps. On every update each process samples its
+    shard of ``update_batch_size // world_size`` transitions of the same
+    batch, the gradients are averaged with DistributedDataParallel over gloo
+    and the identical optimizer steps keep the online and target networks in
+    sync.
+
+    Args:
+        algo (str): Algorithm to train.
+        params (dict): Parameters of the agent.
+        world_size (int): Number of learner processes.
+        master_addr (str): Address of the rendezvous.
+        master_port (int): Port of the rendezvous.
+    """
+    from agents.base import Transition, transition_spec
+    from utils.lazy import make_env
+
+    env = make_env(params['env_id'])
+    replay = SharedReplayBuffer(maxsize=params['replay_size'],
+                                spec=transition_spec(env.observation_space, env.action_space),
+                                transition_type=Transition,
+                                context="spawn")
+    env.close()
+    try:
+        mp.spawn(_data_parallel_worker,
+                 args=(algo, params, replay, world_size, master_addr, master_port),
+                 nprocs=world_size,
+                 join=True)
+    finally:
+        replay.close()
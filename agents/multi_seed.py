@@ -0,0 +1,418 @@
+import copy
+import torch
+import numpy as np
+from tqdm import tqdm
+import torch.optim as optim
+import torch.nn.functional as F
+from typing import List, Dict, Optional, Tuple
+from torch.func import stack_module_state, functional_call, vmap
+
+from agents.base import BaseAgent
+from agents.ddpg import DDPG
+from agents.td3 import TD3
+
+class MultiSeedAgents:
+    """Trains K independent agents, one per seed, in a single process.
+
+    Every seed keeps its own environment, replay buffer and exploration noise,
+    and draws its replay indices from its own generator, seeded as the global
+    numpy generator of a separate run. The weights of the K copies of every
+    network are stacked along a leading seed dimension and the forward/backward
+    passes run once for all seeds with ``torch.func.vmap``. Adam is
+    element-wise and the gradient norm is clipped per seed, so each slice
+    follows the same update rule as a separate run. Before evaluating and
+    checkpointing a seed, its slice is copied back into the networks and
+    optimizers of its own agent, so checkpoints have the same format and
+    content as separate runs.
+
+    Subclasses give the agent class, its networks and the update step.
+
+    Args:
+        params (dict): Parameters of the agents.
+        seeds (list[int]): One agent is trained for every seed.
+    """
+
+    agent_class = BaseAgent
+
+    def __init__(self,
+                 params: dict,
+                 seeds: List[int]):
+
+        params = params.copy()
+        # A process holds a single wandb run.
+        params['enable_wandb_logging'] = False
+
+        self.__seeds = seeds
+        self.__agents = []
+        for seed in seeds:
+            agent_params = params.copy()
+            agent_params['seed'] = seed
+            agent = self.agent_class(**agent_params)
+            agent._checkpoint_prefix = "checkpoints/{}/seed_{}/".format(agent.__class__.__name__, seed)
+            self.__agents.append(agent)
+        self.__rngs = [np.random.RandomState(seed) for seed in seeds]
+
+        agent = self.__agents[0]
+        self._device = agent.device
+        self._hparams = agent.get_hyper_parameters()
+        # The stacked actor and critic would each get a copy of the shared encoder
+        if agent._pixel_observations:
+            raise NotImplementedError("Multi-seed training does not support pixel observations.")
+        if agent.history_length > 1:
+            raise NotImplementedError("Multi-seed training does not support observation history.")
+        if agent.action_repeat > 1:
+            raise NotImplementedError("Multi-seed training does not support action repeat.")
+        if agent._hparam_warm_up_mode != 'online':
+            raise NotImplementedError("Multi-seed training only supports the 'online' warm-up mode.")
+        if agent._snapshot_freq_episodes is not None:
+            raise NotImplementedError("Multi-seed training does not support training snapshots.")
+        if agent._hparam_quantized_inference:
+            raise NotImplementedError("Multi-seed training does not support quantized inference.")
+        # The seeds would share the default table
+        if agent._replay_server is not None:
+            raise NotImplementedError("Multi-seed training does not support the replay server.")
+
+        # Stacked online and target networks, by name
+        self.__bases = {}
+        self.__params = {}
+        self.__buffers = {}
+        self.__target_params = {}
+        self.__optimizers = {}
+        networks = [self._networks(seed_agent) for seed_agent in self.agents]
+        for name, (module, target, optimizer) in networks[0].items():
+            self.__bases[name] = copy.deepcopy(module)
+            self.__params[name], self.__buffers[name] = stack_module_state([n[name][0] for n in networks])
+            self.__target_params[name], _ = stack_module_state([n[name][1] for n in networks])
+            for param in self.__target_params[name].values():
+                param.requires_grad_(False)
+            self.__optimizers[name] = optim.Adam(self.__params[name].values(),
+                                                 lr=optimizer.param_groups[0]['lr'])
+
+    @property
+    def agents(self) -> List[BaseAgent]:
+        return self.__agents
+
+    @property
+    def seeds(self) -> List[int]:
+        return self.__seeds
+
+    def _networks(self,
+                  agent: BaseAgent) -> Dict[str, Tuple[torch.nn.Module, torch.nn.Module, optim.Optimizer]]:
+        """Online network, target network and optimizer of an agent, by name.
+        """
+        raise NotImplementedError()
+
+    def _train_step(self, batch_size: int):
+        """Runs the update iterations of an update step for all the seeds.
+        """
+        raise NotImplementedError()
+
+    def _forward(self,
+                 name: str,
+                 *inputs: torch.Tensor,
+                 target: bool = False,
+                 indices: Optional[List[int]] = None) -> torch.Tensor:
+        """Forward pass of the stacked network ``name``, or of its target
+        network, for inputs with a leading seed dimension. ``indices`` selects
+        the seeds.
+        """
+        params = self.__target_params[name] if target else self.__params[name]
+        buffers = self.__buffers[name]
+        if indices is not None:
+            params = {key: param[indices] for key, param in params.items()}
+            buffers = {key: buffer[indices] for key, buffer in buffers.items()}
+        base = self.__bases[name]
+
+        def forward(p, b, *x):
+            return functional_call(base, (p, b), x)
+        return vmap(forward)(params, buffers, *inputs)
+
+    def __clip_grad_norm(self,
+                         params: Dict[str, torch.Tensor],
+                         max_norm: float):
+        """Clips the gradient norm of every seed separately.
+        """
+        grads = [param.grad for param in params.values() if param.grad is not None]
+        norms = torch.stack([grad.reshape(grad.shape[0], -1).pow(2).sum(dim=1) for grad in grads]).sum(dim=0).sqrt()
+        clip_coef = (max_norm / (norms + 1e-6)).clamp(max=1.0)
+        for grad in grads:
+            grad.mul_(clip_coef.view(-1, *([1] * (grad.dim() - 1))))
+
+    def _optimize(self,
+                  name: str,
+                  loss: torch.Tensor):
+        """Gradient step of the stacked network ``name`` on a loss summed
+        over the seeds, with the gradient norm clipped per seed.
+        """
+        self.__optimizers[name].zero_grad()
+        loss.backward()
+        self.__clip_grad_norm(self.__params[name], self._hparams['max_gradient_norm'])
+        self.__optimizers[name].step()
+
+    def _soft_update(self, name: str):
+        polyak = self._hparams['polyak']
+        with torch.no_grad():
+            for key, param in self.__params[name].items():
+                self.__target_params[name][key].mul_(polyak).add_(param, alpha=1 - polyak)
+
+    def _critic_loss(self,
+                     Q: torch.Tensor,
+                     target: torch.Tensor) -> torch.Tensor:
+        loss_fn = self._hparams['critic_loss_fn']
+        if loss_fn == 'mse':
+            loss = F.mse_loss(Q, target, reduction='none')
+        elif loss_fn == 'hubber':
+            loss = F.huber_loss(Q, target, delta=1.0, reduction='none')
+        else:
+            raise NotImplementedError("Loss {} is not implemented yet.".format(loss_fn))
+        # Mean over the batch of every seed, summed so that the seeds do not interact
+        return loss.mean(dim=1).sum()
+
+    def _sample(self, batch_size: int) -> Optional[Tuple[torch.Tensor, ...]]:
+        """Stacked batches of every seed, each sampled from its own replay:
+        states, actions, rewards, next states and (1 - terminated).
+        """
+        batch_size = min([batch_size] + [a.replay.replay_size for a in self.agents])
+        if batch_size == 0:
+            return None
+        batches = [a.replay.sample_batch(batch_size, rng=rng)[1] for a, rng in zip(self.agents, self.__rngs)]
+        return (torch.from_numpy(np.stack([b.state for b in batches])).to(self._device),
+                torch.from_numpy(np.stack([b.action for b in batches])).to(self._device),
+                torch.from_numpy(np.stack([b.n_step_reward for b in batches])).to(self._device),
+                torch.from_numpy(np.stack([b.n_step_next_state for b in batches])).to(self._device),
+                1.0 - torch.from_numpy(np.stack([b.terminated for b in batches])).to(self._device, dtype=torch.float32))
+
+    def __get_actions(self,
+                      states: List[np.array],
+                      indices: List[int]) -> np.array:
+        """Batched action selection for the given seeds.
+        """
+        agent = self.agents[0]
+        states_torch = torch.from_numpy(np.stack(states)).to(self._device)
+        with agent._thread_policy.inference(), torch.no_grad():
+            actions = self._forward('actor', states_torch, indices=indices).cpu().numpy()
+
+        for row, index in enumerate(indices):
+            seed_agent = self.agents[index]
+            actions[row] += seed_agent._action_noise.sample()
+            actions[row] = np.clip(actions[row],
+                                   a_min=seed_agent.env.action_space.low,
+                                   a_max=seed_agent.env.action_space.high)
+        return actions
+
+    def __sync_optimizer(self,
+                         stacked_optimizer: optim.Optimizer,
+                         stacked_params: Dict[str, torch.Tensor],
+                         optimizer: optim.Optimizer,
+                         module: torch.nn.Module,
+                         index: int):
+        for name, param in module.named_parameters():
+            stacked_state = stacked_optimizer.state.get(stacked_params[name])
+            if not stacked_state:
+                continue
+            optimizer.state[param] = {key: value.clone() if key == 'step' else value[index].clone()
+                                      for key, value in stacked_state.items()}
+
+    def sync_agent(self,
+                   index: int) -> BaseAgent:
+        """Copies the weights and optimizer state of a seed into its agent.
+        """
+        agent = self.agents[index]
+        for name, (module, target, optimizer) in self._networks(agent).items():
+            with torch.no_grad():
+                for key, param in module.named_parameters():
+                    param.copy_(self.__params[name][key][index])
+                for key, param in target.named_parameters():
+                    param.copy_(self.__target_params[name][key][index])
+            self.__sync_optimizer(self.__optimizers[name], self.__params[name], optimizer, module, index)
+        return agent
+
+    def learn(self,
+              max_steps: Optional[int] = None) -> Dict[int, float]:
+        """Trains all the seeds in lockstep.
+
+        Args:
+            max_steps (int): Budget of steps of every seed. The episodes
+                running when the budget is used up are truncated and
+                learning stops.
+
+        Returns:
+            Best mean evaluation reward of every seed.
+        """
+        for agent in self.agents:
+            agent.learn_start_callback()
+
+        agent = self.agents[0]
+        num_seeds = len(self.agents)
+        num_episodes = agent._hparam_num_training_episodes
+
+        episodes = [0] * num_seeds
+        states = [None] * num_seeds
+        episode_transitions = [None] * num_seeds
+        episode_sum_rewards = [0] * num_seeds
+        total_steps_count = 0
+        budget_exhausted = False
+
+        progress = tqdm(total=num_episodes * num_seeds)
+        while min(episodes) < num_episodes and not budget_exhausted:
+
+            # Start new episodes
+            for index, seed_agent in enumerate(self.agents):
+                if states[index] is None and episodes[index] < num_episodes:
+                    seed_agent.learn_start_episode_callback(episodes[index] + 1)
+                    state, info = seed_agent.env.reset()
+                    states[index] = seed_agent.process_observation(state)
+                    episode_transitions[index] = []
+                    episode_sum_rewards[index] = 0
+
+            total_steps_count += 1
+            budget_exhausted = max_steps is not None and total_steps_count >= max_steps
+            active = [index for index in range(num_seeds) if states[index] is not None]
+            actions = self.__get_actions([states[index] for index in active], active)
+
+            ended = []
+            for row, index in enumerate(active):
+                seed_agent = self.agents[index]
+                action = seed_agent._post_process_action(action=actions[row])
+                next_state, reward, terminated, truncated, info = seed_agent.env.step(action[0])
+                next_state = seed_agent.process_observation(next_state)
+                episode_sum_rewards[index] += reward
+                episode_transitions[index].append((states[index], action[0], reward, next_state, terminated))
+                states[index] = next_state
+                if terminated or truncated or budget_exhausted:
+                    ended.append(index)
+
+            # One batched update for all the seeds. As in a separate run, it
+            # happens before the episodes ending at this step enter the replays.
+            if agent.is_update_step(total_steps_count):
+                with agent._thread_policy.update():
+                    self._train_step(batch_size=self._hparams['update_batch_size'])
+
+            for index in ended:
+                seed_agent = self.agents[index]
+                episodes[index] += 1
+                buffer_transitions = seed_agent._calculate_n_step_returns(episode=episode_transitions[index],
+                                                                          n_step=seed_agent.n_step,
+                                                                          gamma=seed_agent.gamma)
+                seed_agent.learn_episode_callback(episodes[index],
+                                                  episode_sum_rewards[index],
+                                                  len(episode_transitions[index]),
+                                                  buffer_transitions)
+                states[index] = None
+                progress.update(1)
+
+                if episodes[index] % seed_agent._hparam_evaluation_freq_episodes == 0:
+                    self.sync_agent(index)._evaluate_and_checkpoint(episodes[index])
+
+                # The agent keeps the state of its last episode
+                if episodes[index] == num_episodes or budget_exhausted:
+                    self.sync_agent(index)
+
+        progress.close()
+        for seed_agent in self.agents:
+            if seed_agent._checkpoint_manager is not None:
+                seed_agent._checkpoint_manager.flush()
+        return {seed: seed_agent.max_mean_test_reward for seed, seed_agent in zip(self.seeds, self.agents)}
+
+class MultiSeedDDPG(MultiSeedAgents):
+    """Multi-seed training of ``DDPG`` agents, see ``MultiSeedAgents``.
+    """
+
+    agent_class = DDPG
+
+    def _networks(self, agent: DDPG):
+        return {'critic': (agent.critic, agent.critic_target, agent.critic_optimizer),
+                'actor': (agent.actor, agent.actor_target, agent.actor_optimizer)}
+
+    def _train_step(self, batch_size: int):
+
+        agent = self.agents[0]
+        discount = agent.decision_gamma**agent.n_step
+
+        for _ in range(0, self._hparams['update_iterations']):
+
+            # Every seed samples from its own replay
+            batch = self._sample(batch_size)
+            if batch is None:
+                return
+            states, actions, rewards, next_states, dones = batch
+
+            # ------------------ Update Critic Network -------------------- #
+            with agent.autocast(), torch.no_grad():
+                next_actions = self._forward('actor', next_states, target=True)
+                Q_s = self._forward('critic', next_states, next_actions, target=True).float()
+
+            target = rewards + discount * dones * Q_s.squeeze(dim=2)
+            with agent.autocast():
+                Q = self._forward('critic', states, actions).squeeze(dim=2)
+            self._optimize('critic', self._critic_loss(Q.float(), target))
+
+            # ------------------ Update Actor Network -------------------- #
+            with agent.autocast():
+                policy_actions = self._forward('actor', states)
+                actor_loss = -self._forward('critic', states, policy_actions).float().mean(dim=(1, 2)).sum()
+            self._optimize('actor', actor_loss)
+
+            # Update target network weight
+            self._soft_update('critic')
+            self._soft_update('actor')
+
+class MultiSeedTD3(MultiSeedAgents):
+    """Multi-seed training of ``TD3`` agents, see ``MultiSeedAgents``. The
+    target policy noise is drawn for all the seeds at once from the torch
+    generator, so it differs from the noise of separate runs.
+    """
+
+    agent_class = TD3
+
+    def _networks(self, agent: TD3):
+        return {'critic_first': (agent.critic_first, agent.critic_first_target, agent.critic_optimizer_first),
+                'critic_second': (agent.critic_second, agent.critic_second_target, agent.critic_optimizer_second),
+                'actor': (agent.actor, agent.actor_target, agent.actor_optimizer)}
+
+    def _train_step(self, batch_size: int):
+
+        agent = self.agents[0]
+        discount = agent.decision_gamma**agent.n_step
+        action_low = torch.as_tensor(agent.env.action_space.low, dtype=torch.float32, device=self._device)
+        action_high = torch.as_tensor(agent.env.action_space.high, dtype=torch.float32, device=self._device)
+
+        for iteration in range(0, self._hparams['update_iterations']):
+
+            # Every seed samples from its own replay
+            batch = self._sample(batch_size)
+            if batch is None:
+                return
+            states, actions, rewards, next_states, dones = batch
+
+            # ------------------ Update Critic Networks -------------------- #
+            with agent.autocast(), torch.no_grad():
+                next_actions = self._forward('actor', next_states, target=True).float()
+            target_noise = torch.normal(mean=0.0,
+                                        std=self._hparams['target_noise'],
+                                        size=next_actions.size()).clip(min=-self._hparams['target_noise_clip'],
+                                                                       max=self._hparams['target_noise_clip'])
+            next_actions = (next_actions + target_noise.to(self._device)).clip(min=action_low, max=action_high)
+
+            with agent.autocast(), torch.no_grad():
+                q_next_first = self._forward('critic_first', next_states, next_actions, target=True).float()
+                q_next_second = self._forward('critic_second', next_states, next_actions, target=True).float()
+
+            target = rewards + discount * dones * torch.minimum(q_next_first, q_next_second).squeeze(dim=2)
+            with agent.autocast():
+                Q_first = self._forward('critic_first', states, actions).squeeze(dim=2)
+                Q_second = self._forward('critic_second', states, actions).squeeze(dim=2)
+            self._optimize('critic_first', self._critic_loss(Q_first.float(), target))
+            self._optimize('critic_second', self._critic_loss(Q_second.float(), target))
+
+            # ------------------ Update Actor Network -------------------- #
+            if (iteration + 1) % self._hparams['policy_delay'] == 0:
+                with agent.autocast():
+                    policy_actions = self._forward('actor', states)
+                    actor_loss = -self._forward('critic_first', states, policy_actions).float().mean(dim=(1, 2)).sum()
+                self._optimize('actor', actor_loss)
+
+                # Update target network weights
+                self._soft_update('critic_first')
+                self._soft_update('critic_second')
+                self._soft_update('actor')
@@ -0,0 +1,188 @@
+import torch
+import pickle
+import numpy as np
+from gymnasium.spaces import Box
+from typing import Optional, List, Tuple
+from utils.lazy import make_env
+from utils.registry import MODELS
+from models.base import model_kwargs
+from utils.spaces import as_stored_observation
+from buffers.history import ObservationHistory
+from utils.action_repeat import step_repeated
+
+def load_checkpoint_file(path: str,
+                         weights_only: bool = False) -> dict:
+    """Loads a checkpoint on CPU, memory mapped where supported so that only
+    the tensors which are used are read from disk.
+
+    Args:
+        path (str): Path of the checkpoint.
+        weights_only (bool): Never unpickle arbitrary objects, e.g. for
+            checkpoints which are not trusted. Checkpoints which hold such
+            objects fail to load.
+    """
+    try:
+        return torch.load(path, map_location="cpu", mmap=True, weights_only=True)
+    except (TypeError, RuntimeError, pickle.UnpicklingError):
+        if weights_only:
+            raise
+        # Older torch versions, legacy serialization format or pickled objects
+        return torch.load(path, map_location="cpu", weights_only=False)
+
+class Policy:
+    """Inference-only policy built from the actor of a DDPG/TD3 checkpoint.
+
+    Unlike reconstructing the agent, no critic, target network, optimizer
+    or replay buffer is created and the training dependencies are not
+    imported.
+
+    Args:
+        actor (torch.nn.Module): Actor network.
+        env_id (str): Environment the policy was trained on.
+        observation_low (np.array): Lower bound of the observations.
+        observation_high (np.array): Upper bound of the observations.
+        normalize_observations (bool): Normalize the observations with the bounds.
+        history_length (int): Number of observations stacked along the last
+            axis of the actor inputs. The bounds are those of the stacks.
+        action_repeat (int): Environment steps every action is applied for.
+    """
+
+    def __init__(self,
+                 actor: torch.nn.Module,
+                 env_id: str,
+                 observation_low: np.array,
+                 observation_high: np.array,
+                 normalize_observations: bool,
+                 history_length: int = 1,
+                 action_repeat: int = 1):
+        self.__actor = actor.eval()
+        self.__env_id = env_id
+        self.__observation_low = np.asarray(observation_low, dtype=np.float32)
+        self.__observation_scale = np.asarray(observation_high, dtype=np.float32) - self.__observation_low
+        self.__normalize_observations = normalize_observations
+        self.__history_length = history_length
+        self.__action_repeat = action_repeat
+
+    @classmethod
+    def load(cls,
+             path: str,
+             quantize: bool = False,
+             weights_only: bool = False):
+        """Builds the policy from a checkpoint.
+
+        Checkpoints which predate the ``policy`` entry are supported through
+        their hyper-parameters and the spaces of the environment.
+
+        Args:
+            path (str): Path of the checkpoint.
+            quantize (bool): Run an int8 dynamically quantized copy of the actor.
+            weights_only (bool): See ``load_checkpoint_file``.
+        """
+        state = load_checkpoint_file(path, weights_only=weights_only)
+
+        if "policy" in state:
+            policy = state["policy"]
+        else:
+            hyper_params = state["hyper_params"]
+            env = make_env(hyper_params["env_id"])
+            policy = {'env_id': hyper_params["env_id"],
+                      'actor': hyper_params["actor"],
+                      'actor_params': hyper_params["actor_params"][hyper_params["actor"]],
+                      'observation_low': env.observation_space.low,
+                      'observation_high': env.observation_space.high,
+                      'action_low': env.action_space.low,
+                      'action_high': env.action_space.high,
+                      'normalize_observations': hyper_params["normalize_observations"]}
+            env.close()
+
+        observation_type = Box(low=np.asarray(policy['observation_low'], dtype=np.float32),
+                               high=np.asarray(policy['observation_high'], dtype=np.float32))
+        action_type = Box(low=np.asarray(policy['action_low'], dtype=np.float32),
+                          high=np.asarray(policy['action_high'], dtype=np.float32))
+        actor = MODELS.get(policy['actor'])(observation_type=observation_type,
+                                            action_type=action_type,
+                                            **model_kwargs(policy['actor_params']))
+        actor.load_state_dict(state["actor"])
+        if quantize:
+            from models.quantization import quantize_actor
+            actor = quantize_actor(actor)
+
+        return cls(actor=actor,
+                   env_id=policy['env_id'],
+                   observation_low=policy['observation_low'],
+                   observation_high=policy['observation_high'],
+                   normalize_observations=policy['normalize_observations'],
+                   history_length=policy.get('history_length', 1),
+                   action_repeat=policy.get('action_repeat', 1))
+
+    @property
+    def actor(self) -> torch.nn.Module:
+        return self.__actor
+
+    @property
+    def env_id(self) -> str:
+        return self.__env_id
+
+    @property
+    def observation_low(self) -> np.array:
+        return self.__observation_low
+
+    @property
+    def observation_scale(self) -> np.array:
+        return self.__observation_scale
+
+    @property
+    def normalize_observations(self) -> bool:
+        return self.__normalize_observations
+
+    @property
+    def history_length(self) -> int:
+        return self.__history_length
+
+    @property
+    def action_repeat(self) -> int:
+        return self.__action_repeat
+
+    def normalize_observation(self, obs: np.array) -> np.array:
+        return np.divide(obs - self.__observation_low, self.__observation_scale)
+
+    def __call__(self, obs: np.array) -> np.array:
+        """Deterministic actions of a single or a batch of (stacked) observations.
+        """
+        obs = as_stored_observation(obs)
+        if self.__normalize_observations:
+            obs = self.normalize_observation(obs).astype(np.float32)
+        with torch.inference_mode():
+            return self.__actor(torch.from_numpy(obs)).numpy()
+
+    def play(self,
+             num_episodes: int,
+             render: bool = False,
+             seed: Optional[int] = None) -> List[Tuple[float, int]]:
+        """Runs the policy in its environment.
+
+        Returns:
+            Cumulative reward and length of every episode.
+        """
+        env = make_env(self.env_id, render_mode="human" if render else None)
+        history = ObservationHistory(self.history_length)
+        results = []
+        for episode in range(num_episodes):
+            state, info = env.reset(seed=None if seed is None else seed + episode)
+            state = history.reset(state)
+            done = False
+            cum_reward = 0
+            ep_length = 0
+            while not done:
+                action = self(state)
+                state, reward, _, terminated, truncated, info, num_steps = step_repeated(env, action[0], self.action_repeat)
+                state = history.push(state)
+                cum_reward += reward
+                ep_length += num_steps
+                done = terminated or truncated
+            results.append((cum_reward, ep_length))
+            print("Episode: {}, Cum Reward {}, Episode Length: {}".format(episode + 1,
+                                                                          cum_reward,
+                                                                          ep_length))
+        env.close()
+        return results
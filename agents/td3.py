@@ -1,13 +1,15 @@
 from typing import Literal
-from agents.base import BaseAgent
-from buffers.replay import ReplayBuffer
+from agents.base import BaseAgent, BASE_AGENT_OPTIONS
+from models.quantization import QuantizedActor
 import torch.optim as optim
 import numpy as np
 import torch
 import torch.nn.functional as F
-import wandb
+from utils.lazy import lazy_import
 from typing import Optional
 
+wandb = lazy_import("wandb")
+
 TD3_DEFAULT_PARAMS = {
     'env_id': "BipedalWalker-v3",
     'seed': 258,
@@ -36,7 +38,12 @@ TD3_DEFAULT_PARAMS = {
     'enable_wandb_logging': False,
     'logger_title': 'test_logger',
     'exploration_noise_type': 'NormalNoise',
-    'exploration_noise_params': {'NormalNoise': {'mu': 0.0, 'sigma': 0.3}}
+    'exploration_noise_params': {'NormalNoise': {'mu': 0.0, 'sigma': 0.3}},
+    'critic': 'MLPCritic',
+    'critic_params': None,
+    'actor': 'MLPActor',
+    'actor_params': None,
+    **BASE_AGENT_OPTIONS
 }
 
 class TD3(BaseAgent):
@@ -67,21 +74,40 @@ class TD3(BaseAgent):
                  enable_wandb_logging: bool, 
                  exploration_noise_type: Literal['NormalNoise', 'OUNoise'],
                  exploration_noise_params: dict,
-                 logger_title: Optional[str] = None):
-        
-        super().__init__(env_id, 
-                         seed, 
-                         gamma, 
-                         n_step, 
-                         num_training_episodes, 
-                         num_test_episodes,
-                         warm_up_iters,
-                         evaluation_freq_episodes,
-                         normalize_observations,
-                         enable_wandb_logging,
-                         exploration_noise_type,
-                         exploration_noise_params,
-                         logger_title)
+                 logger_title: Optional[str] = None,
+                 critic: str = 'MLPCritic',
+                 critic_params: Optional[dict] = None,
+                 actor: str = 'MLPActor',
+                 actor_params: Optional[dict] = None,
+                 # Options of BaseAgent, see BASE_AGENT_OPTIONS
+                 **kwargs):
+
+        # Without explicit model params, the networks are sized by the shared
+        # hidden size and activation of the TD3 params.
+        if critic_params is None:
+            critic_params = {critic: {'hidden_size': actor_critic_hidden_size, 'activation': activation}}
+        if actor_params is None:
+            actor_params = {actor: {'hidden_size': actor_critic_hidden_size, 'activation': activation}}
+
+        super().__init__(env_id=env_id,
+                         render=False,
+                         seed=seed,
+                         gamma=gamma,
+                         n_step=n_step,
+                         num_training_episodes=num_training_episodes,
+                         num_test_episodes=num_test_episodes,
+                         warm_up_iters=warm_up_iters,
+                         evaluation_freq_episodes=evaluation_freq_episodes,
+                         normalize_observations=normalize_observations,
+                         enable_wandb_logging=enable_wandb_logging,
+                         exploration_noise_type=exploration_noise_type,
+                         exploration_noise_params=exploration_noise_params,
+                         critic=critic,
+                         critic_params=critic_params,
+                         actor=actor,
+                         actor_params=actor_params,
+                         logger_title=logger_title,
+                         **kwargs)
     
         # Store the object arguments. Required for loading checkpoint
         self.__agent_args = self.get_agent_arguments(locals(), TD3_DEFAULT_PARAMS)
@@ -115,30 +141,28 @@ class TD3(BaseAgent):
             self.set_wandb_logging_metrics()
         
         # Experience Replay
-        self.__exp_replay = ReplayBuffer(maxsize=replay_size)
+        self.__exp_replay = self._make_replay(replay_size)
 
         # Critic Networks
-        self.__critic_first, self.__critic_first_target, self.__critic_first_optimizer = self.__build_critic(observation_dims=self.env.observation_space.shape[0],
-                                                                                                             action_dims=self.env.action_space.shape[0],
-                                                                                                             hidden_size=actor_critic_hidden_size,
-                                                                                                             activation=activation,
-                                                                                                             device=self.device,
-                                                                                                             critic_lr=self.__hparam_critic_lr)
-        
-        self.__critic_second, self.__critic_second_target, self.__critic_second_optimizer = self.__build_critic(observation_dims=self.env.observation_space.shape[0],
-                                                                                                                action_dims=self.env.action_space.shape[0],
-                                                                                                                hidden_size=actor_critic_hidden_size,
-                                                                                                                activation=activation,
-                                                                                                                device=self.device,
-                                                                                                                critic_lr=self.__hparam_critic_lr)
-
-        # Actor Network
-        self.__actor, self.__actor_target, self.__actor_optimizer = self.__build_actor(observation_dims=self.env.observation_space.shape[0],
-                                                                                       action_dims=self.env.action_space.shape[0],
-                                                                                       hidden_size=actor_critic_hidden_size,
-                                                                                       activation=activation,
-                                                                                       device=self.device,
-                                                                                       actor_lr=self.__hparam_actor_lr)
+        self.__critic_first, self.__critic_first_target, self.__critic_first_optimizer = self.__build_critic(critic_lr=self.__hparam_critic_lr)
+        self.__critic_second, self.__critic_second_target, self.__critic_second_optimizer = self.__build_critic(critic_lr=self.__hparam_critic_lr)
+
+        # Actor Network, on the encoder of the first critic for pixel observations
+        self.__actor, self.__actor_target, self.__actor_optimizer = self.__build_actor(actor_lr=self.__hparam_actor_lr)
+
+        # Networks used for the forward passes of the updates. Wrapping broadcasts
+        # the weights of the main process, so the targets are synced afterwards.
+        self.__critic_first_learner = self._wrap_data_parallel(self.critic_first)
+        self.__critic_second_learner = self._wrap_data_parallel(self.critic_second)
+        self.__actor_learner = self._wrap_data_parallel(self.actor)
+        self.critic_first_target.load_state_dict(self.critic_first.state_dict())
+        self.critic_second_target.load_state_dict(self.critic_second.state_dict())
+        self.actor_target.load_state_dict(self.actor.state_dict())
+
+        # Int8 actor for action selection
+        if self._hparam_quantized_inference:
+            self._quantized_actor = QuantizedActor(self.actor,
+                                                   sync_interval=self._hparam_quantize_sync_interval)
     
     @property
     def critic_first(self):
@@ -164,6 +188,10 @@ class TD3(BaseAgent):
     def critic_optimizer_second(self):
         return self.__critic_second_optimizer
 
+    @property
+    def replay(self):
+        return self.__exp_replay
+
     @property
     def actor_optimizer(self):
         return self.__actor_optimizer
@@ -176,24 +204,17 @@ class TD3(BaseAgent):
     def actor_target(self):
         return self.__actor_target
     
-    def __build_critic(self, 
-                       observation_dims: int,
-                       action_dims: int,
-                       hidden_size: int,
-                       activation: str,
-                       device: str,
+    def __build_critic(self,
                        critic_lr: float):
-        
-        critic       = Critic(observation_dims,
-                              action_dims,
-                              hidden_size,
-                              activation).to(device)
-
-        critic_targ  = Critic(observation_dims,
-                              action_dims,
-                              hidden_size,
-                              activation).to(device)
-        
+
+        critic_params = {
+            'observation_type': self.observation_space,
+            'action_type': self.env.action_space
+        }
+        critic_params.update(self._critic_model_params)
+        critic       = self._critic_module(**critic_params).to(self.device)
+        critic_targ  = self._critic_module(**critic_params).to(self.device)
+
         optimizer = optim.Adam(critic.parameters(),
                                lr=critic_lr)
 
@@ -201,27 +222,15 @@ class TD3(BaseAgent):
         return critic, critic_targ, optimizer
 
 
-    def __build_actor(self, 
-                      observation_dims: int,
-                      action_dims: int,
-                      hidden_size: int,
-                      activation: str,
-                      device: str,
+    def __build_actor(self,
                       actor_lr: float):
-    
-        actor       = Actor(observation_dims,
-                             action_dims,
-                             hidden_size,
-                             activation).to(device)
 
-        actor_targ  = Actor(observation_dims,
-                             action_dims,
-                             hidden_size,
-                             activation).to(device)
+        actor       = self._actor_module(**self._actor_kwargs(self.critic_first)).to(self.device)
+        actor_targ  = self._actor_module(**self._actor_kwargs(self.critic_first_target)).to(self.device)
 
-        optimizer = optim.Adam(actor.parameters(),
+        optimizer = optim.Adam(actor.trainable_parameters(),
                                lr=actor_lr)
-        
+
         actor.load_state_dict(actor_targ.state_dict())
         return actor, actor_targ, optimizer
     
@@ -238,7 +247,7 @@ class TD3(BaseAgent):
     
     def actor_soft_update(self,
                           polyak: float):
-        for param, target_param in zip(self.actor.parameters(), self.actor_target.parameters()):
+        for param, target_param in zip(self.actor.trainable_parameters(), self.actor_target.trainable_parameters()):
             target_param.data.copy_( polyak * target_param.data + (1 - polyak) * param.data )
     
     def set_wandb_logging_metrics(self) -> None:            
@@ -253,10 +262,17 @@ class TD3(BaseAgent):
         wandb.define_metric("returns/estimated_second", step_metric="step")
         wandb.define_metric("returns/true_returns", step_metric="step")
     
+    def learn_warm_up_callback(self, transitions) -> None:
+
+        # Bulk insert the warm-up transitions into the replay buffer
+        self.__exp_replay.add_batch(transitions)
+
     def learn_episode_callback(self, episode: int, cum_reward: float, episode_length: int, n_step_transition_tuple: list) -> None:
         
         # Add the episode to the replay buffer
         self.__exp_replay.add_epsiode(n_step_transition_tuple)
+        if self._quantized_actor is not None:
+            self._quantized_actor.end_episode()
             
         # log the current replay size
         if self.is_wandb_logging_enabled:
@@ -267,6 +283,12 @@ class TD3(BaseAgent):
         
     def learn_start_callback(self):
         self._action_noise.reset(self.env.action_space.shape[0])
+        if self._thread_policy.is_auto_tune_enabled:
+            self._thread_policy.tune(self.actor,
+                                     self.critic_first,
+                                     observation_space=self.observation_space,
+                                     batch_size=self.__hparam_update_batch_size,
+                                     device=self.device)
 
     def learn_start_episode_callback(self, 
                                      episode):
@@ -280,10 +302,13 @@ class TD3(BaseAgent):
         # Get the actions prediction from the actor network
         actions_torch = None
         
-        with torch.no_grad():
-            self.actor.eval()
-            actions_torch = self.actor(torch.from_numpy(state).to(self.device))
-            self.actor.train()
+        with self._thread_policy.inference(), torch.no_grad():
+            if self._quantized_actor is not None:
+                actions_torch = self._quantized_actor(torch.from_numpy(state))
+            else:
+                self.actor.eval()
+                actions_torch = self.actor(torch.from_numpy(state).to(self.device))
+                self.actor.train()
         actions = actions_torch.cpu().numpy()
         
         # Add noise if we are in training mode only
@@ -305,42 +330,26 @@ class TD3(BaseAgent):
         returns_true = []
         actor_losses = []
 
-        for _ in range(0, self.__hparam_update_iterations):
-
-            # Sample a batch of transitions from the replay
-            num_samples, samples = self.__exp_replay.sample(batch_size)
-
-            if num_samples > 0:
+        # Batches of transitions from the replay, sampled ahead of the updates
+        for _, batch in enumerate(self._sample_batches(self.__hparam_update_iterations, batch_size)):
 
-                states = []
-                actions = []
-                rewards = []
-                next_states = []
-                dones = []
-                returns = []
+            if batch is not None:
 
-                for sample in samples:
-                    states.append(sample.state)
-                    actions.append(sample.action)
-                    rewards.append(sample.n_step_reward)
-                    next_states.append(sample.n_step_next_state)
-                    dones.append(sample.terminated)
-                    returns.append(sample.returns)
-                
-                states = torch.Tensor(np.array(states)).to(self.device)
-                actions = torch.Tensor(np.array(actions)).to(self.device)
-                rewards = torch.Tensor(np.array(rewards)).to(self.device)
-                next_states = torch.Tensor(np.array(next_states)).to(self.device)
-                dones = torch.Tensor(1 - np.array(dones)).to(self.device)
-                returns = torch.Tensor(np.array(returns)).to(self.device)
+                # The replay stores float32 columns, so the batch is wrapped without copies
+                states = batch.state
+                actions = batch.action
+                rewards = batch.n_step_reward
+                next_states = batch.n_step_next_state
+                dones = 1.0 - batch.terminated
+                returns = batch.returns
 
                 # ------------------ Update Critic Network -------------------- #
 
                 # Get next state action
                 actions_next = None
                 self.actor_target.eval()
-                with torch.no_grad():
-                    actions_next = self.actor_target(next_states).detach()
+                with self.autocast(), torch.no_grad():
+                    actions_next = self.actor_target(next_states).detach().float()
                 self.actor_target.train()
                 target_noise = torch.normal(mean=0.0, 
                                             std=self.__hparam_target_noise,
@@ -355,17 +364,20 @@ class TD3(BaseAgent):
                 # Get Q_s
                 self.critic_first_target.eval()
                 self.critic_second_target.eval()
-                with torch.no_grad():
-                    q_next_first = self.critic_first_target(next_states, actions_next)
-                    q_next_second = self.critic_second_target(next_states, actions_next)
+                with self.autocast(), torch.no_grad():
+                    q_next_first = self.critic_first_target(next_states, actions_next).float()
+                    q_next_second = self.critic_second_target(next_states, actions_next).float()
                 self.critic_first_target.train()
                 self.critic_second_target.train()
 
                 q_next = torch.minimum(q_next_first, q_next_second)
-                target = rewards + (self.gamma**self.n_step) * dones * q_next.squeeze(dim=1)
+                target = rewards + (self.decision_gamma**self.n_step) * dones * q_next.squeeze(dim=1)
                 
-                Q_first = self.critic_first(states, actions).squeeze(dim=1)
-                Q_second = self.critic_second(states, actions).squeeze(dim=1)
+                with self.autocast():
+                    Q_first = self.__critic_first_learner(states, actions).squeeze(dim=1)
+                    Q_second = self.__critic_second_learner(states, actions).squeeze(dim=1)
+                Q_first = Q_first.float()
+                Q_second = Q_second.float()
 
                 if self.__hparam_critic_loss_fn == 'mse':
                     critic_loss_first = F.mse_loss(Q_first, target)
@@ -401,11 +413,13 @@ class TD3(BaseAgent):
                 if (_ + 1) % self.__hparam_policy_delay == 0:
 
                     # Update actor
-                    actor_loss = -self.critic_first(states, self.actor(states)).mean()
+                    # The critic gradients of the actor loss are discarded, skip their all-reduce
+                    with self.autocast(), self._no_sync(self.__critic_first_learner):
+                        actor_loss = -self.__critic_first_learner(states, self.__actor_learner(states)).float().mean()
                     self.actor_optimizer.zero_grad()
                     actor_loss.backward()
                     # Clip the gradients
-                    torch.nn.utils.clip_grad_norm_(self.actor.parameters(), self.__hparam_max_gradient_norm)
+                    torch.nn.utils.clip_grad_norm_(self.actor.trainable_parameters(), self.__hparam_max_gradient_norm)
                     # Update gradients
                     self.actor_optimizer.step()
 
@@ -425,14 +439,21 @@ class TD3(BaseAgent):
         
         return critic_first_losses.mean(), critic_second_losses.mean(), returns_estimated_first.mean(), returns_estimated_second.mean(), actor_losses.mean(), returns_true.mean()
     
+    def is_update_step(self,
+                       step: int) -> bool:
+        return step % self.__hparam_update_frequency == 0 \
+            and step > self.warm_up_iters
+
     def learn_step_callback(self, 
                               step: int,
                               transition_tuple: tuple) -> None:
         """Step callback. Called at every step.
         """
-        if step % self.__hparam_update_frequency == 0 \
-            and step > self.warm_up_iters:
-            critic_loss_first, critic_loss_second, returns_est_first, returns_est_second, actor_loss, returns_true = self.__train_step(batch_size=self.__hparam_update_batch_size)
+        if self.is_update_step(step):
+            with self._thread_policy.update():
+                critic_loss_first, critic_loss_second, returns_est_first, returns_est_second, actor_loss, returns_true = self.__train_step(batch_size=self._shard_batch_size(self.__hparam_update_batch_size))
+            if self._quantized_actor is not None:
+                self._quantized_actor.step()
 
             if self.is_wandb_logging_enabled:
                 self.writer.log({
@@ -455,12 +476,38 @@ class TD3(BaseAgent):
         self.actor.load_state_dict(state["actor"])
         self.actor_optimizer.load_state_dict(state["actor_optimizer"])
         hyper_params = state["hyper_params"]
+        if self._quantized_actor is not None:
+            self._quantized_actor.refresh()
         print("Loaded checkpoint: {}".format(path))
 
 
-    def save_checkpoint(self, path: str):
-        print(self.__agent_args)
-        torch.save({
+    def training_state(self) -> dict:
+        state = self.checkpoint_state()
+        state["critic_first_target"] = self.critic_first_target.state_dict()
+        state["critic_second_target"] = self.critic_second_target.state_dict()
+        state["actor_target"] = self.actor_target.state_dict()
+        if self._quantized_actor is not None:
+            state["quantized_actor"] = self._quantized_actor.state_dict()
+        return state
+
+    def load_training_state(self, state: dict):
+        self.critic_first.load_state_dict(state["critic_first"])
+        self.critic_first_target.load_state_dict(state["critic_first_target"])
+        self.critic_optimizer_first.load_state_dict(state["first_critic_optimizer"])
+        self.critic_second.load_state_dict(state["critic_second"])
+        self.critic_second_target.load_state_dict(state["critic_second_target"])
+        self.critic_optimizer_second.load_state_dict(state["second_critic_optimizer"])
+        self.actor.load_state_dict(state["actor"])
+        self.actor_target.load_state_dict(state["actor_target"])
+        self.actor_optimizer.load_state_dict(state["actor_optimizer"])
+        if self._quantized_actor is not None:
+            if "quantized_actor" in state:
+                self._quantized_actor.load_state_dict(state["quantized_actor"])
+            else:
+                self._quantized_actor.refresh()
+
+    def checkpoint_state(self) -> dict:
+        return {
             "critic_first": self.critic_first.state_dict(),
             "critic_second": self.critic_second.state_dict(),
             "actor": self.actor.state_dict(),
@@ -469,4 +516,5 @@ class TD3(BaseAgent):
             "actor_optimizer": self.actor_optimizer.state_dict(),
             "hyper_params": self.__agent_args,
             "algo": "TD3",
-        }, path)
\ No newline at end of file
+            "policy": self.policy_state(),
+        }
\ No newline at end of file
@@ -0,0 +1,78 @@
+import time
+import argparse
+import numpy as np
+
+from agents.base import Transition
+from agents.ddpg import DDPG
+from agents.td3 import TD3
+from hyperparams.params import PARAMS
+
+def make_agent(env_id: str,
+               algo: str,
+               mixed_precision,
+               **overrides):
+    params = PARAMS[env_id][algo].copy()
+    params['enable_wandb_logging'] = False
+    params['mixed_precision'] = mixed_precision
+    params.update(overrides)
+    if algo == "DDPG":
+        return DDPG(**params)
+    return TD3(**params)
+
+def fill_replay(agent,
+                num_transitions: int):
+    """Fills the replay of the agent with random transitions.
+    """
+    obs_space = agent.env.observation_space
+    act_space = agent.env.action_space
+    transitions = [Transition(state=obs_space.sample().astype(np.float32),
+                              action=act_space.sample(),
+                              n_step_reward=np.random.randn(),
+                              n_step_next_state=obs_space.sample().astype(np.float32),
+                              terminated=False,
+                              returns=np.random.randn()) for _ in range(num_transitions)]
+    agent.learn_episode_callback(0, 0.0, num_transitions, transitions)
+
+def updates_per_second(agent,
+                       num_calls: int):
+    """Measures the throughput of the update step of the agent.
+    """
+    hyper_params = agent.get_hyper_parameters()
+    update_frequency = hyper_params['update_frequency']
+    step = update_frequency * (agent.warm_up_iters // update_frequency + 1)
+    
+    # Warm up the kernels before timing
+    agent.learn_step_callback(step=step, transition_tuple=None)
+    
+    start = time.perf_counter()
+    for _ in range(num_calls):
+        agent.learn_step_callback(step=step, transition_tuple=None)
+    elapsed = time.perf_counter() - start
+    return num_calls * hyper_params['update_iterations'] / elapsed
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--env-ids", type=str, nargs="+", default=["Pendulum-v1", "HalfCheetah-v4"], help="Presets to benchmark.")
+    parser.add_argument("--algo", type=str, default="DDPG", choices=["DDPG", "TD3"], help="Algorithm to benchmark.")
+    parser.add_argument("--num-calls", type=int, default=200, help="Number of update calls to time.")
+    parser.add_argument("--train-episodes", type=int, default=0, help="If > 0, also train for this many episodes and report the final reward.")
+    args = parser.parse_args()
+
+    print("{:<20} {:<8} {:>12} {:>14}".format("env", "mode", "updates/sec", "final reward"))
+    for env_id in args.env_ids:
+        for mode in [None, 'bf16']:
+            agent = make_agent(env_id, args.algo, mode)
+            fill_replay(agent, num_transitions=10 * agent.get_hyper_parameters()['update_batch_size'])
+            ups = updates_per_second(agent, args.num_calls)
+
+            final_reward = float("nan")
+            if args.train_episodes > 0:
+                agent = make_agent(env_id, 
+                                   args.algo, 
+                                   mode,
+                                   num_training_episodes=args.train_episodes)
+                agent.learn()
+                final_reward = agent.max_mean_test_reward
+
+            print("{:<20} {:<8} {:>12.1f} {:>14.2f}".format(env_id, str(mode or 'fp32'), ups, final_reward))
@@ -0,0 +1,61 @@
+import time
+import argparse
+import numpy as np
+
+from agents.base import Transition
+from buffers.replay import ReplayBuffer
+from buffers.history import HistoryReplayBuffer, ObservationHistory
+
+def fill(replay: ReplayBuffer,
+         shape: tuple,
+         dtype: type,
+         history_length: int,
+         num_episodes: int,
+         episode_length: int):
+    """Adds random episodes, with stacked states unless the replay stacks them itself.
+    """
+    stacked = not isinstance(replay, HistoryReplayBuffer)
+    for _ in range(num_episodes):
+        observations = np.random.randint(0, 255, size=(episode_length + 1,) + shape).astype(dtype)
+        if stacked:
+            history = ObservationHistory(history_length)
+            observations = np.stack([history.reset(observations[0])] + [history.push(obs) for obs in observations[1:]])
+        replay.add_epsiode([Transition(state=observations[t],
+                                       action=np.zeros(1, dtype=np.float32),
+                                       n_step_reward=0.0,
+                                       n_step_next_state=observations[t + 1],
+                                       terminated=False,
+                                       returns=0.0) for t in range(episode_length)])
+
+def samples_per_second(replay: ReplayBuffer,
+                       batch_size: int,
+                       num_calls: int) -> float:
+    start = time.perf_counter()
+    for _ in range(num_calls):
+        replay.sample_batch(batch_size)
+    return num_calls * batch_size / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--history-length", type=int, default=4, help="Number of stacked observations.")
+    parser.add_argument("--pixels", action="store_true", help="84x84x1 uint8 frames instead of 24 float observations.")
+    parser.add_argument("--num-episodes", type=int, default=50, help="Episodes added to the replay.")
+    parser.add_argument("--episode-length", type=int, default=200, help="Steps per episode.")
+    parser.add_argument("--batch-size", type=int, default=256, help="Batch size of the samples.")
+    parser.add_argument("--num-calls", type=int, default=200, help="Number of batches to time.")
+    args = parser.parse_args()
+
+    shape, dtype = ((84, 84, 1), np.uint8) if args.pixels else ((24,), np.float32)
+    maxsize = args.num_episodes * (args.episode_length + 1)
+
+    print("{:<16} {:>12} {:>14}".format("replay", "MB", "samples/sec"))
+    for name, replay in [("stacked", ReplayBuffer(maxsize=maxsize)),
+                         ("single copy", HistoryReplayBuffer(maxsize=maxsize,
+                                                             history_length=args.history_length,
+                                                             n_step=1,
+                                                             transition_type=Transition))]:
+        fill(replay, shape, dtype, args.history_length, args.num_episodes, args.episode_length)
+        size = sum(column.nbytes for column in replay.columns.values()) / 2**20
+        print("{:<16} {:>12.1f} {:>14.0f}".format(name, size, samples_per_second(replay, args.batch_size, args.num_calls)))
@@ -0,0 +1,55 @@
+import time
+import torch
+import argparse
+import gymnasium as gym
+
+from utils.registry import MODELS
+
+# Critic configurations to compare, as (name, module, params)
+CONFIGS = [
+    ("SimpleCritic", "SimpleCritic", {}),
+    ("MLPCritic", "MLPCritic", {}),
+    ("MLPCritic layer_norm", "MLPCritic", {'layer_norm': True}),
+    ("MLPCritic 3 layers", "MLPCritic", {'num_hidden_layers': 3}),
+]
+
+def updates_per_second(critic: torch.nn.Module,
+                       states: torch.FloatTensor,
+                       actions: torch.FloatTensor,
+                       num_calls: int) -> float:
+    """Throughput of a forward and backward pass of the critic.
+    """
+    optimizer = torch.optim.Adam(critic.parameters(), lr=1e-4)
+    for i in range(num_calls + 10):
+        # The first calls warm up the kernels
+        if i == 10:
+            start = time.perf_counter()
+        loss = critic(states, actions).mean()
+        optimizer.zero_grad()
+        loss.backward()
+        optimizer.step()
+    return num_calls / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--env-id", type=str, default="Pendulum-v1", help="Environment giving the input dimensions.")
+    parser.add_argument("--hidden-size", type=int, default=256, help="Width of the hidden layers.")
+    parser.add_argument("--batch-size", type=int, default=256, help="Batch size of the updates.")
+    parser.add_argument("--num-calls", type=int, default=500, help="Number of updates to time.")
+    args = parser.parse_args()
+
+    env = gym.make(args.env_id)
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    states = torch.randn(args.batch_size, env.observation_space.shape[0], device=device)
+    actions = torch.randn(args.batch_size, env.action_space.shape[0], device=device)
+
+    print("{:<24} {:>10} {:>12}".format("critic", "params", "updates/sec"))
+    for name, module, params in CONFIGS:
+        critic = MODELS.get(module)(observation_type=env.observation_space,
+                                    action_type=env.action_space,
+                                    hidden_size=args.hidden_size,
+                                    **params).to(device)
+        num_params = sum(param.numel() for param in critic.parameters())
+        print("{:<24} {:>10} {:>12.1f}".format(name, num_params, updates_per_second(critic, states, actions, args.num_calls)))
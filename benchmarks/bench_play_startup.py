@@ -0,0 +1,80 @@
+import os
+import sys
+import time
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+
+# Time from interpreter start to the first action, in a fresh process so that
+# the imports are part of the measurement.
+AGENT_STARTUP = """
+import time, torch
+start = time.perf_counter()
+from agents.ddpg import DDPG
+from agents.td3 import TD3
+state = torch.load({path!r}, map_location="cpu", weights_only=False)
+hyperparams = state["hyper_params"]
+hyperparams["enable_wandb_logging"] = False
+agent = (DDPG if state["algo"] == "DDPG" else TD3)(**hyperparams)
+agent.load_checkpoint({path!r})
+obs, info = agent.env.reset(seed=0)
+agent.get_action(obs.astype("float32"), mode="eval")
+print(time.perf_counter() - start)
+"""
+
+POLICY_STARTUP = """
+import time
+start = time.perf_counter()
+import gymnasium as gym
+from agents.policy import Policy
+policy = Policy.load({path!r})
+env = gym.make(policy.env_id)
+obs, info = env.reset(seed=0)
+policy(obs)
+print(time.perf_counter() - start)
+"""
+
+def measure(code: str,
+            repeats: int) -> np.array:
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    times = []
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, "-c", code],
+                                cwd=root,
+                                capture_output=True,
+                                text=True,
+                                check=True).stdout
+        times.append(float(output.strip().splitlines()[-1]))
+    return np.array(times)
+
+def make_checkpoint(env_id: str,
+                    algo: str,
+                    path: str):
+    from benchmarks.bench_autocast import make_agent
+    agent = make_agent(env_id, algo, mixed_precision=None)
+    agent.save_checkpoint(path)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--checkpoint", type=str, default=None, help="Checkpoint to load. A fresh one is created by default.")
+    parser.add_argument("--env-id", type=str, default="Pendulum-v1", help="Environment of the fresh checkpoint.")
+    parser.add_argument("--algo", type=str, default="DDPG", choices=["DDPG", "TD3"], help="Algorithm of the fresh checkpoint.")
+    parser.add_argument("--repeats", type=int, default=5, help="Number of timed process starts.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = args.checkpoint
+        if path is None:
+            path = os.path.join(directory, "checkpoint.pkt")
+            make_checkpoint(args.env_id, args.algo, path)
+
+        agent_times = measure(AGENT_STARTUP.format(path=os.path.abspath(path)), args.repeats)
+        policy_times = measure(POLICY_STARTUP.format(path=os.path.abspath(path)), args.repeats)
+
+    print("Time to first action (median of {} runs)".format(args.repeats))
+    print("  agent:  {:.3f}s".format(np.median(agent_times)))
+    print("  policy: {:.3f}s ({:.1%} of agent)".format(np.median(policy_times),
+                                                     np.median(policy_times) / np.median(agent_times)))
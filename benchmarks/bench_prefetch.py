@@ -0,0 +1,73 @@
+import time
+import torch
+import argparse
+import numpy as np
+
+from agents.base import Transition
+from buffers.replay import ReplayBuffer
+from buffers.prefetch import BatchPrefetcher, batch_to_tensors
+
+def random_batch(num_rows: int, observation_dims: int, action_dims: int = 4) -> Transition:
+    return Transition(state=np.random.rand(num_rows, observation_dims).astype(np.float32),
+                      action=np.random.rand(num_rows, action_dims).astype(np.float32),
+                      n_step_reward=np.random.rand(num_rows).astype(np.float32),
+                      n_step_next_state=np.random.rand(num_rows, observation_dims).astype(np.float32),
+                      terminated=np.zeros(num_rows, dtype=bool),
+                      returns=np.random.rand(num_rows).astype(np.float32))
+
+def update_phase_seconds(replay: ReplayBuffer,
+                         network: torch.nn.Module,
+                         device: torch.device,
+                         queue_depth: int,
+                         num_phases: int,
+                         num_updates: int,
+                         batch_size: int) -> float:
+    """Time of ``num_phases`` update phases of ``num_updates`` gradient steps,
+    with the batches sampled in the loop or by a prefetcher.
+    """
+    optimizer = torch.optim.Adam(network.parameters())
+    prefetcher = BatchPrefetcher(replay, device, queue_depth) if queue_depth > 0 else None
+    start = time.perf_counter()
+    for _ in range(num_phases):
+        if prefetcher is not None:
+            batches = prefetcher.batches(num_updates, batch_size)
+        else:
+            batches = (batch_to_tensors(replay.sample_batch(batch_size)[1], device) for _ in range(num_updates))
+        for batch in batches:
+            loss = (network(batch.state).squeeze(-1) - batch.returns).pow(2).mean()
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+    seconds = time.perf_counter() - start
+    if prefetcher is not None:
+        prefetcher.close()
+    return seconds
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--observation-dims", type=int, nargs="+", default=[24, 1024], help="Observation sizes to compare.")
+    parser.add_argument("--queue-depths", type=int, nargs="+", default=[0, 2, 4], help="Prefetch depths, 0 samples in the loop.")
+    parser.add_argument("--num-rows", type=int, default=100000, help="Rows inserted in the replay.")
+    parser.add_argument("--num-phases", type=int, default=10, help="Update phases to time.")
+    parser.add_argument("--num-updates", type=int, default=50, help="Gradient steps per phase.")
+    parser.add_argument("--batch-size", type=int, default=256, help="Batch size of the updates.")
+    args = parser.parse_args()
+
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+    print("{:<10} {:>8} {:>12}".format("obs dims", "depth", "updates/s"))
+    for observation_dims in args.observation_dims:
+        replay = ReplayBuffer(maxsize=args.num_rows)
+        replay.add_batch(random_batch(args.num_rows, observation_dims))
+        network = torch.nn.Sequential(torch.nn.Linear(observation_dims, 256),
+                                      torch.nn.ReLU(),
+                                      torch.nn.Linear(256, 256),
+                                      torch.nn.ReLU(),
+                                      torch.nn.Linear(256, 1)).to(device)
+        for queue_depth in args.queue_depths:
+            seconds = update_phase_seconds(replay, network, device, queue_depth, args.num_phases, args.num_updates, args.batch_size)
+            print("{:<10} {:>8} {:>12.0f}".format(observation_dims, queue_depth, args.num_phases * args.num_updates / seconds))
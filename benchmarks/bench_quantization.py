@@ -0,0 +1,55 @@
+import time
+import torch
+import argparse
+import numpy as np
+import gymnasium as gym
+
+from models.models import SimpleActor
+from models.quantization import quantize_actor
+
+def latency_us(actor: torch.nn.Module,
+               obs: torch.FloatTensor,
+               num_calls: int) -> float:
+    """Median batch-1 latency in microseconds.
+    """
+    times = []
+    with torch.inference_mode():
+        for _ in range(10):
+            actor(obs[0])
+        for i in range(num_calls):
+            start = time.perf_counter()
+            actor(obs[i % len(obs)])
+            times.append(time.perf_counter() - start)
+    return np.median(times) * 1e6
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--env-id", type=str, default="BipedalWalker-v3", help="Environment of the observation/action spaces.")
+    parser.add_argument("--hidden-sizes", type=int, nargs="+", default=[256, 512, 1024, 2048], help="Hidden sizes to compare.")
+    parser.add_argument("--num-calls", type=int, default=2000, help="Timed calls per actor.")
+    args = parser.parse_args()
+
+    # Batch-1 inference, as in get_action
+    torch.set_num_threads(1)
+    env = gym.make(args.env_id)
+    obs = torch.from_numpy(np.random.rand(1000, env.observation_space.shape[0]).astype(np.float32))
+
+    print("{:>8} {:>12} {:>12} {:>8} {:>14} {:>14}".format("hidden", "fp32 (us)", "int8 (us)", "speedup", "max abs err", "mean abs err"))
+    for hidden_size in args.hidden_sizes:
+        actor = SimpleActor(observation_type=env.observation_space,
+                            action_type=env.action_space,
+                            hidden_size=hidden_size).eval()
+        quantized = quantize_actor(actor)
+
+        with torch.inference_mode():
+            error = (actor(obs) - quantized(obs)).abs()
+        fp32_latency = latency_us(actor, obs, args.num_calls)
+        int8_latency = latency_us(quantized, obs, args.num_calls)
+        print("{:>8} {:>12.1f} {:>12.1f} {:>7.2f}x {:>14.2e} {:>14.2e}".format(hidden_size,
+                                                                             fp32_latency,
+                                                                             int8_latency,
+                                                                             fp32_latency / int8_latency,
+                                                                             error.max().item(),
+                                                                             error.mean().item()))
@@ -0,0 +1,58 @@
+import os
+import time
+import argparse
+import tempfile
+import threading
+import numpy as np
+
+from agents.base import Transition
+from buffers.replay import ReplayBuffer
+from utils.replay_client import ReplayClient
+from replay_server import ReplayServer, ThreadingUnixServer, make_handler
+
+def random_batch(num_rows: int, observation_dims: int, action_dims: int = 4) -> Transition:
+    return Transition(state=np.random.rand(num_rows, observation_dims).astype(np.float32),
+                      action=np.random.rand(num_rows, action_dims).astype(np.float32),
+                      n_step_reward=np.random.rand(num_rows).astype(np.float32),
+                      n_step_next_state=np.random.rand(num_rows, observation_dims).astype(np.float32),
+                      terminated=np.zeros(num_rows, dtype=bool),
+                      returns=np.random.rand(num_rows).astype(np.float32))
+
+def samples_per_second(replay, batch_size: int, num_calls: int) -> float:
+    start = time.perf_counter()
+    for _ in range(num_calls):
+        replay.sample_batch(batch_size)
+    return num_calls / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--observation-dims", type=int, nargs="+", default=[24, 1024], help="Observation sizes to compare.")
+    parser.add_argument("--num-rows", type=int, default=100000, help="Rows inserted in the replay.")
+    parser.add_argument("--batch-size", type=int, default=256, help="Batch size of the samples.")
+    parser.add_argument("--num-calls", type=int, default=500, help="Number of batches to time.")
+    args = parser.parse_args()
+
+    socket_path = os.path.join(tempfile.mkdtemp(), "replay.sock")
+    server = ThreadingUnixServer(socket_path, make_handler(ReplayServer()))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    print("{:<10} {:>16} {:>16} {:>18}".format("obs dims", "local batches/s", "server batches/s", "server insert s"))
+    for observation_dims in args.observation_dims:
+        batch = random_batch(args.num_rows, observation_dims)
+        local = ReplayBuffer(maxsize=args.num_rows)
+        local.add_batch(batch)
+        client = ReplayClient(socket_path, table="bench_{}".format(observation_dims), maxsize=args.num_rows, transition_type=Transition)
+        start = time.perf_counter()
+        client.add_batch(batch)
+        insert_time = time.perf_counter() - start
+        print("{:<10} {:>16.0f} {:>16.0f} {:>18.3f}".format(observation_dims,
+                                                            samples_per_second(local, args.batch_size, args.num_calls),
+                                                            samples_per_second(client, args.batch_size, args.num_calls),
+                                                            insert_time))
+        client.close()
+
+    server.shutdown()
+    server.server_close()
+    os.remove(socket_path)
@@ -0,0 +1,112 @@
+import time
+import argparse
+import numpy as np
+import multiprocessing as mp
+
+from agents.base import Transition
+from buffers.replay import ReplayBuffer
+from buffers.shared import SharedReplayBuffer
+from buffers.warmup import iter_warm_up_chunks, write_warm_up_chunks, n_step_transitions
+
+def transition_spec(observation_dims: int, action_dims: int) -> dict:
+    return {'state': ((observation_dims,), np.float32),
+            'action': ((action_dims,), np.float32),
+            'n_step_reward': ((), np.float32),
+            'n_step_next_state': ((observation_dims,), np.float32),
+            'terminated': ((), bool),
+            'returns': ((), np.float32)}
+
+def random_batch(num_rows: int, observation_dims: int, action_dims: int) -> Transition:
+    return Transition(state=np.random.rand(num_rows, observation_dims).astype(np.float32),
+                      action=np.random.rand(num_rows, action_dims).astype(np.float32),
+                      n_step_reward=np.random.rand(num_rows).astype(np.float32),
+                      n_step_next_state=np.random.rand(num_rows, observation_dims).astype(np.float32),
+                      terminated=np.zeros(num_rows, dtype=bool),
+                      returns=np.random.rand(num_rows).astype(np.float32))
+
+def _queue_writer(queue: mp.Queue, num_batches: int, batch_rows: int, observation_dims: int, action_dims: int):
+    batch = random_batch(batch_rows, observation_dims, action_dims)
+    for _ in range(num_batches):
+        queue.put(batch)
+
+def _shared_writer(replay: SharedReplayBuffer, num_batches: int, batch_rows: int, observation_dims: int, action_dims: int):
+    batch = random_batch(batch_rows, observation_dims, action_dims)
+    for _ in range(num_batches):
+        replay.write(replay.reserve(batch_rows), batch)
+
+def rows_per_second(shared: bool,
+                    num_writers: int,
+                    num_batches: int,
+                    batch_rows: int,
+                    observation_dims: int,
+                    action_dims: int = 4) -> float:
+    """Rows per second reaching the learner's replay from ``num_writers``
+    collector processes, through a queue or written to shared memory.
+    """
+    maxsize = num_writers * num_batches * batch_rows
+    args = (num_batches, batch_rows, observation_dims, action_dims)
+    start = time.perf_counter()
+    if shared:
+        replay = SharedReplayBuffer(maxsize=maxsize,
+                                    spec=transition_spec(observation_dims, action_dims),
+                                    transition_type=Transition)
+        writers = [mp.Process(target=_shared_writer, args=(replay,) + args) for _ in range(num_writers)]
+        for writer in writers:
+            writer.start()
+        for writer in writers:
+            writer.join()
+        assert replay.num_added == maxsize
+        replay.close()
+    else:
+        replay = ReplayBuffer(maxsize=maxsize)
+        queue = mp.Queue(maxsize=64)
+        writers = [mp.Process(target=_queue_writer, args=(queue,) + args) for _ in range(num_writers)]
+        for writer in writers:
+            writer.start()
+        for _ in range(num_writers * num_batches):
+            replay.add_batch(queue.get())
+        for writer in writers:
+            writer.join()
+    return maxsize / (time.perf_counter() - start)
+
+def warm_up_seconds(shared: bool,
+                    env_id: str,
+                    num_steps: int,
+                    num_workers: int) -> float:
+    """Time to fill a replay with the bulk collected warm-up transitions.
+    """
+    start = time.perf_counter()
+    if shared:
+        from utils.lazy import make_env
+        env = make_env(env_id)
+        spec = transition_spec(env.observation_space.shape[0], env.action_space.shape[0])
+        replay = SharedReplayBuffer(maxsize=num_steps, spec=spec, transition_type=Transition)
+        write_warm_up_chunks(replay, env_id, seed=0, num_steps=num_steps, num_workers=num_workers, n_step=3, gamma=0.99)
+        replay.close()
+    else:
+        replay = ReplayBuffer(maxsize=num_steps)
+        for data in iter_warm_up_chunks(env_id, seed=0, num_steps=num_steps, num_workers=num_workers):
+            replay.add_batch(n_step_transitions(data, Transition, n_step=3, gamma=0.99))
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num-writers", type=int, default=4, help="Collector processes.")
+    parser.add_argument("--num-batches", type=int, default=200, help="Batches written per collector.")
+    parser.add_argument("--batch-rows", type=int, default=256, help="Rows per batch.")
+    parser.add_argument("--observation-dims", type=int, nargs="+", default=[24, 4096], help="Observation sizes to compare.")
+    parser.add_argument("--env-id", type=str, default="Pendulum-v1", help="Environment of the warm-up comparison.")
+    parser.add_argument("--warm-up-steps", type=int, default=40000, help="Warm-up steps, 0 to skip.")
+    args = parser.parse_args()
+
+    print("{:<10} {:>8} {:>16} {:>16}".format("obs dims", "writers", "queue rows/s", "shared rows/s"))
+    for observation_dims in args.observation_dims:
+        rates = [rows_per_second(shared, args.num_writers, args.num_batches, args.batch_rows, observation_dims)
+                 for shared in (False, True)]
+        print("{:<10} {:>8} {:>16.0f} {:>16.0f}".format(observation_dims, args.num_writers, *rates))
+
+    if args.warm_up_steps > 0:
+        times = [warm_up_seconds(shared, args.env_id, args.warm_up_steps, args.num_writers) for shared in (False, True)]
+        print("warm-up {} steps on {}: streamed {:.2f}s, shared {:.2f}s".format(args.warm_up_steps, args.env_id, *times))
@@ -0,0 +1,67 @@
+import os
+import sys
+import time
+import argparse
+import subprocess
+import numpy as np
+
+# Optional or heavy dependencies which should only be imported by the features using them.
+OPTIONAL_MODULES = ["wandb", "optuna", "sumo", "gymnasium", "buffers.shared", "buffers.warmup", "utils.replay_client"]
+
+# Imports timed in a fresh process, with the optional modules they loaded.
+IMPORT_STARTUP = """
+import sys, time
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+print(elapsed, *[name for name in {optional!r} if name in sys.modules])
+"""
+
+TARGETS = {
+    "agents.ddpg": "import agents.ddpg",
+    "agents.td3": "import agents.td3",
+    "agents.policy": "import agents.policy",
+    "agent (no logging)": ("from agents.ddpg import DDPG\n"
+                           "from hyperparams.params import PARAMS\n"
+                           "DDPG(**dict(PARAMS[{env_id!r}]['DDPG'], enable_wandb_logging=False))"),
+}
+
+def measure(statement: str,
+            repeats: int):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    code = IMPORT_STARTUP.format(statement=statement, optional=OPTIONAL_MODULES)
+    times = []
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, "-c", code],
+                                cwd=root,
+                                capture_output=True,
+                                text=True,
+                                check=True).stdout.strip().splitlines()[-1].split()
+        times.append(float(output[0]))
+    return np.array(times), ", ".join(output[1:])
+
+def measure_trainer_help(repeats: int) -> np.array:
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "trainer.py", "--help"],
+                       cwd=root,
+                       capture_output=True,
+                       check=True)
+        times.append(time.perf_counter() - start)
+    return np.array(times)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--env-id", type=str, default="Pendulum-v1", help="Environment of the timed agent.")
+    parser.add_argument("--repeats", type=int, default=5, help="Number of timed process starts.")
+    args = parser.parse_args()
+
+    print("Startup time (median of {} runs)".format(args.repeats))
+    for name, statement in TARGETS.items():
+        times, loaded = measure(statement.format(env_id=args.env_id), args.repeats)
+        print("  {:<20} {:.3f}s  optional modules: {}".format(name, np.median(times), loaded or "none"))
+    print("  {:<20} {:.3f}s  (whole process)".format("trainer.py --help", np.median(measure_trainer_help(args.repeats))))
@@ -0,0 +1,73 @@
+import os
+import time
+import torch
+import argparse
+import numpy as np
+
+def switch_pair_us(inference_threads: int,
+                   update_threads: int,
+                   num_calls: int) -> float:
+    """Median cost in microseconds of switching to the update thread count
+    and back, as ThreadPolicy does on every update step.
+    """
+    times = []
+    torch.set_num_threads(inference_threads)
+    for _ in range(num_calls):
+        start = time.perf_counter()
+        torch.set_num_threads(update_threads)
+        torch.set_num_threads(inference_threads)
+        times.append(time.perf_counter() - start)
+    return np.median(times) * 1e6
+
+def step_us(actor: torch.nn.Module,
+            critic: torch.nn.Module,
+            inference_threads: int,
+            update_threads: int,
+            observation_dims: int,
+            batch_size: int,
+            num_calls: int) -> float:
+    """Median time in microseconds of a batch-1 action followed by an update,
+    with the thread counts of the two phases.
+    """
+    single_state = torch.rand(1, observation_dims)
+    batch_states = torch.rand(batch_size, observation_dims)
+    times = []
+    for i in range(num_calls + 10):
+        start = time.perf_counter()
+        torch.set_num_threads(inference_threads)
+        with torch.no_grad():
+            actor(single_state)
+        torch.set_num_threads(update_threads)
+        critic(batch_states, actor(batch_states)).mean().backward()
+        if i >= 10:
+            times.append(time.perf_counter() - start)
+    return np.median(times) * 1e6
+
+
+if __name__ == "__main__":
+
+    from gymnasium.spaces import Box
+    from models.models import SimpleActor, SimpleCritic
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--update-threads", type=int, nargs="+", default=[2, os.cpu_count()], help="Update thread counts to compare.")
+    parser.add_argument("--inference-threads", type=int, default=1, help="Thread count of action selection.")
+    parser.add_argument("--observation-dims", type=int, default=24, help="Observation size.")
+    parser.add_argument("--batch-size", type=int, default=256, help="Batch size of the updates.")
+    parser.add_argument("--num-calls", type=int, default=500, help="Timed calls.")
+    args = parser.parse_args()
+
+    obs_space = Box(low=-1.0, high=1.0, shape=(args.observation_dims,))
+    act_space = Box(low=-1.0, high=1.0, shape=(4,))
+    actor = SimpleActor(observation_type=obs_space, action_type=act_space, hidden_size=256)
+    critic = SimpleCritic(observation_type=obs_space, action_type=act_space, hidden_size=256)
+
+    print("{:>8} {:>8} {:>14} {:>18} {:>18}".format("infer", "update", "switch (us)", "step same (us)", "step switch (us)"))
+    for update_threads in sorted(set(args.update_threads)):
+        same = step_us(actor, critic, update_threads, update_threads, args.observation_dims, args.batch_size, args.num_calls)
+        switched = step_us(actor, critic, args.inference_threads, update_threads, args.observation_dims, args.batch_size, args.num_calls)
+        print("{:>8} {:>8} {:>14.1f} {:>18.1f} {:>18.1f}".format(args.inference_threads,
+                                                                 update_threads,
+                                                                 switch_pair_us(args.inference_threads, update_threads, args.num_calls),
+                                                                 same,
+                                                                 switched))
@@ -0,0 +1,211 @@
+import numpy as np
+from typing import Dict, Iterator, NamedTuple, Optional, Tuple
+from collections import namedtuple
+
+from buffers.replay import ReplayBuffer
+
+# Row of the history replay: one observation of an episode and the n-step
+# transition starting from it. The row after the last step of an episode
+# holds the final observation, with ``valid`` unset.
+HistoryStep = namedtuple('HistoryStep', ['observation',
+                                         'action',
+                                         'n_step_reward',
+                                         'terminated',
+                                         'returns',
+                                         'next_offset',
+                                         'episode_position',
+                                         'valid'])
+
+def stack_observations(observations: np.array) -> np.array:
+    """Concatenates (batch, history_length, *shape) observations along their
+    last axis, oldest first, into (batch, *shape[:-1], history_length * shape[-1]).
+    """
+    stacked = np.moveaxis(observations, 1, -2)
+    return stacked.reshape(stacked.shape[:-2] + (-1,))
+
+class ObservationHistory:
+    """Last ``history_length`` observations of an environment, stacked along
+    the last axis. At the start of an episode the history is filled with the
+    first observation.
+
+    Args:
+        history_length (int): Number of stacked observations.
+    """
+
+    def __init__(self, history_length: int):
+        if history_length < 1:
+            raise ValueError("history_length must be >= 1.")
+        self.__history_length = history_length
+        self.__observations = None
+        self.__index = 0
+
+    @property
+    def history_length(self) -> int:
+        return self.__history_length
+
+    def __stacked(self) -> np.array:
+        order = (self.__index + 1 + np.arange(self.__history_length)) % self.__history_length
+        return stack_observations(self.__observations[None, order])[0]
+
+    def reset(self, obs: np.array) -> np.array:
+        """Starts a new episode and returns its first stacked observation.
+        """
+        if self.__history_length == 1:
+            return obs
+        self.__observations = np.repeat(np.asarray(obs)[None], self.__history_length, axis=0)
+        self.__index = 0
+        return self.__stacked()
+
+    def push(self, obs: np.array) -> np.array:
+        """Appends the next observation of the episode and returns the stack.
+        """
+        if self.__history_length == 1:
+            return obs
+        self.__index = (self.__index + 1) % self.__history_length
+        self.__observations[self.__index] = obs
+        return self.__stacked()
+
+class HistoryReplayBuffer(ReplayBuffer):
+    """Replay of stacked observations which stores every observation once.
+
+    Episodes are stored as consecutive rows, followed by a row holding their
+    final observation. The stacked states and n-step next states of a sampled
+    batch are gathered from the rows preceding them, repeating the first
+    observation of the episode where the history reaches past it. Batches
+    have the same fields as the transitions of ``ReplayBuffer``.
+
+    Args:
+        maxsize (int): Number of rows.
+        history_length (int): Number of stacked observations.
+        n_step (int): Horizon of the n-step transitions.
+        transition_type (type): Namedtuple of the sampled batches.
+    """
+
+    def __init__(self,
+                 maxsize: int,
+                 history_length: int,
+                 n_step: int,
+                 transition_type: type):
+        super().__init__(maxsize=maxsize)
+        self.__history_length = history_length
+        self.__n_step = n_step
+        self.__batch_type = transition_type
+
+    @property
+    def history_length(self) -> int:
+        return self.__history_length
+
+    def __stack_indices(self, indices: np.array) -> np.array:
+        """Rows of the stacked observations ending at ``indices``, without
+        crossing the start of their episode.
+        """
+        position = self.columns['episode_position'][indices]
+        lags = np.arange(self.__history_length - 1, -1, -1)
+        return (indices[:, None] - np.minimum(lags[None, :], position[:, None])) % self.maxsize
+
+    def __sample_indices(self,
+                         batch_size: int,
+                         rng: Optional[np.random.RandomState] = None,
+                         max_tries: int = 100) -> np.array:
+        rng = rng or np.random
+        size = self.replay_size
+        oldest = (self.index - size) % self.maxsize
+        # The history of the oldest rows may already be overwritten
+        skip = self.__history_length - 1 if size == self.maxsize else 0
+        if size <= skip:
+            return np.zeros(0, dtype=np.int64)
+        indices = (oldest + skip + rng.randint(0, size - skip, size=batch_size)) % self.maxsize
+        valid = self.columns['valid']
+        for _ in range(max_tries):
+            invalid = ~valid[indices]
+            if not invalid.any():
+                break
+            indices[invalid] = (oldest + skip + rng.randint(0, size - skip, size=invalid.sum())) % self.maxsize
+        return indices[valid[indices]]
+
+    def sample_batch(self,
+                     batch_size: int,
+                     rng: Optional[np.random.RandomState] = None) -> Tuple[int, NamedTuple]:
+        """Samples a batch of transitions (with replacement), with the rows
+        drawn from ``rng``, or from the global numpy generator if not given.
+
+        Returns:
+            Number of sampled transitions and a transition namedtuple whose
+            fields are arrays with the batch as the leading dimension.
+        """
+        if self.replay_size == 0:
+            return 0, None
+        indices = self.__sample_indices(min(batch_size, self.replay_size), rng)
+        if len(indices) == 0:
+            return 0, None
+        columns = self.columns
+        next_indices = (indices + columns['next_offset'][indices]) % self.maxsize
+        observations = columns['observation']
+        return len(indices), self.__batch_type(state=stack_observations(observations[self.__stack_indices(indices)]),
+                                               action=columns['action'][indices],
+                                               n_step_reward=columns['n_step_reward'][indices],
+                                               n_step_next_state=stack_observations(observations[self.__stack_indices(next_indices)]),
+                                               terminated=columns['terminated'][indices],
+                                               returns=columns['returns'][indices])
+
+    def add_epsiode(self,
+                    transitions: Iterator[NamedTuple]):
+        """Stores the n-step transitions of a whole episode, whose states and
+        next states are single (unstacked) observations.
+        """
+        transitions = list(transitions)
+        num_steps = len(transitions)
+        if num_steps == 0:
+            return
+        steps = np.arange(num_steps)
+        observations = np.stack([t.state for t in transitions] + [transitions[-1].n_step_next_state])
+        action = np.stack([t.action for t in transitions])
+        steps = HistoryStep(observation=observations,
+                            action=np.concatenate([action, np.zeros_like(action[:1])]),
+                            n_step_reward=np.append([t.n_step_reward for t in transitions], 0.0),
+                            terminated=np.append([t.terminated for t in transitions], False),
+                            returns=np.append([t.returns for t in transitions], 0.0),
+                            next_offset=np.append(np.minimum(self.__n_step, num_steps - steps), 0).astype(np.int32),
+                            episode_position=np.arange(num_steps + 1, dtype=np.int32),
+                            valid=np.append(np.ones(num_steps, dtype=bool), False))
+        if num_steps + 1 > self.maxsize:
+            raise ValueError("Episode of {} steps does not fit in a replay of {} rows.".format(num_steps, self.maxsize))
+        super().add_batch(steps)
+
+    def add_batch(self,
+                  batch: NamedTuple):
+        raise NotImplementedError("Batches of transitions have no episode boundaries, add whole episodes instead.")
+
+    def add(self,
+            transition: NamedTuple):
+        raise NotImplementedError("Single transitions have no episode boundaries, add whole episodes instead.")
+
+    def load_state_dict(self,
+                        state: dict,
+                        columns: Dict[str, np.array],
+                        transition_type: Optional[type] = None):
+        """See ``ReplayBuffer.load_state_dict``. The rows are always ``HistoryStep``.
+        """
+        super().load_state_dict(state, columns, HistoryStep)
+
+
+if __name__ == "__main__":
+
+    from agents.base import Transition
+
+    # Two episodes of 3 and 2 steps, with observations [episode, step]
+    replay = HistoryReplayBuffer(maxsize=100, history_length=3, n_step=2, transition_type=Transition)
+    for episode, length in [(1, 3), (2, 2)]:
+        obs = [np.array([episode, step], dtype=np.float32) for step in range(length + 1)]
+        replay.add_epsiode([Transition(state=obs[t],
+                                       action=np.zeros(1, dtype=np.float32),
+                                       n_step_reward=0.0,
+                                       n_step_next_state=obs[min(t + 2, length)],
+                                       terminated=False,
+                                       returns=0.0) for t in range(length)])
+    num_samples, batch = replay.sample_batch(4)
+    print(batch.state)
+    print(batch.n_step_next_state)
+
+    history = ObservationHistory(3)
+    print(history.reset(np.array([0.0, 1.0])), history.push(np.array([2.0, 3.0])))
@@ -0,0 +1,141 @@
+import queue
+import torch
+import threading
+import numpy as np
+from typing import Iterator, NamedTuple, Optional
+
+def batch_to_tensors(batch: NamedTuple,
+                     device: torch.device,
+                     pin_memory: bool = False) -> NamedTuple:
+    """Wraps the arrays of a sampled batch as tensors on ``device``, without
+    copies on the CPU. ``terminated`` is converted to float32.
+    """
+    tensors = []
+    for field, values in zip(batch._fields, batch):
+        tensor = torch.from_numpy(values)
+        if pin_memory:
+            tensor = tensor.pin_memory()
+        tensor = tensor.to(device, non_blocking=pin_memory)
+        if field == 'terminated':
+            tensor = tensor.to(dtype=torch.float32)
+        tensors.append(tensor)
+    return type(batch)(*tensors)
+
+# Marks the end of the batches of a request in the queue.
+_END = object()
+
+class BatchPrefetcher:
+    """Samples the batches of an update phase in a background thread, while
+    the gradient steps run on the batches already sampled.
+
+    The batches of a phase are only sampled once it is requested, so the
+    replay they are drawn from is the one at the start of the phase, and
+    they come in the order of synchronous sampling. Only the batches after
+    the first overlap with the updates, so phases of a single batch are
+    better sampled synchronously. At most ``queue_depth``
+    batches are ready ahead of the update. On CUDA, the batches are copied
+    from pinned memory without blocking.
+
+    Args:
+        replay (ReplayBuffer): Replay to sample from.
+        device (torch.device): Device of the batches.
+        queue_depth (int): Maximum number of ready batches.
+    """
+
+    def __init__(self,
+                 replay,
+                 device: torch.device,
+                 queue_depth: int = 2):
+        if queue_depth < 1:
+            raise ValueError("queue_depth must be >= 1.")
+        self.__replay = replay
+        self.__device = device
+        self.__pin_memory = device.type == 'cuda'
+        self.__requests = queue.Queue()
+        self.__batches = queue.Queue(maxsize=queue_depth)
+        self.__cancel = threading.Event()
+        self.__thread = threading.Thread(target=self.__sample_loop, daemon=True)
+        self.__thread.start()
+
+    def __sample_loop(self):
+        while True:
+            request = self.__requests.get()
+            if request is None:
+                return
+            num_batches, batch_size = request
+            for _ in range(num_batches):
+                if self.__cancel.is_set():
+                    break
+                try:
+                    num_samples, batch = self.__replay.sample_batch(batch_size)
+                    item = batch_to_tensors(batch, self.__device, self.__pin_memory) if num_samples > 0 else None
+                except Exception as error:
+                    item = error
+                self.__batches.put(item)
+            self.__batches.put(_END)
+
+    def batches(self,
+                num_batches: int,
+                batch_size: int) -> Iterator[Optional[NamedTuple]]:
+        """Yields ``num_batches`` tensor batches, or None while the replay is
+        empty. Leaving the loop early discards the remaining batches.
+        """
+        if not self.__thread.is_alive():
+            raise RuntimeError("The prefetcher is closed.")
+        self.__cancel.clear()
+        self.__requests.put((num_batches, batch_size))
+        finished = False
+        try:
+            while True:
+                item = self.__batches.get()
+                if item is _END:
+                    finished = True
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            if not finished:
+                self.__cancel.set()
+                while self.__batches.get() is not _END:
+                    pass
+
+    def close(self):
+        """Stops the sampling thread. The batches of a request that was not
+        iterated to the end are discarded, so the thread cannot stay blocked
+        on a full queue.
+        """
+        if self.__thread.is_alive():
+            self.__cancel.set()
+            self.__requests.put(None)
+            while self.__thread.is_alive():
+                try:
+                    self.__batches.get(timeout=0.01)
+                except queue.Empty:
+                    pass
+            self.__thread.join()
+            # Ends a generator of the discarded request that is resumed or closed later
+            self.__batches.put(_END)
+
+
+if __name__ == "__main__":
+
+    import time
+    from agents.base import Transition
+    from buffers.replay import ReplayBuffer
+
+    replay = ReplayBuffer(maxsize=100000)
+    replay.add_batch(Transition(state=np.random.rand(100000, 24).astype(np.float32),
+                                action=np.random.rand(100000, 4).astype(np.float32),
+                                n_step_reward=np.random.rand(100000).astype(np.float32),
+                                n_step_next_state=np.random.rand(100000, 24).astype(np.float32),
+                                terminated=np.zeros(100000, dtype=bool),
+                                returns=np.random.rand(100000).astype(np.float32)))
+    prefetcher = BatchPrefetcher(replay, torch.device("cpu"), queue_depth=2)
+    start = time.perf_counter()
+    num_batches = sum(1 for batch in prefetcher.batches(1000, 256))
+    print("{} batches in {:.3f}s".format(num_batches, time.perf_counter() - start))
+    for batch in prefetcher.batches(10, 256):
+        break
+    print(next(iter(prefetcher.batches(1, 256))).terminated.dtype)
+    prefetcher.close()
@@ -1,43 +1,155 @@
-import random
-from collections import deque
-from typing import NamedTuple, Iterator
-import gymnasium as gym
+import numpy as np
+from typing import NamedTuple, Iterator, Tuple, Dict, Optional
 from collections import namedtuple
 
 class ReplayBuffer:
+    """Fixed size ring buffer storing transitions column-wise.
 
-    def __init__(self, 
+    The columns are allocated lazily from the first transition added, one
+    array per field of the transition namedtuple. Floating point fields are
+    stored as float32 so that sampled batches can be wrapped with
+    ``torch.from_numpy`` without any further cast or copy.
+    """
+
+    def __init__(self,
                  maxsize: int):
         self.__maxsize = maxsize
-        self.__buffer = deque(maxlen=maxsize)
-        self.__Transition = namedtuple('Transition', ['state', 'action', 'next_state', 'reward', 'done', 'returns'])
-    
+        self.__columns = None
+        self.__Transition = None
+        self.__index = 0
+        self.__size = 0
+        self.__num_added = 0
+
     @property
     def maxsize(self):
         return self.__maxsize
 
     @property
     def replay_size(self):
-        return len(self.__buffer)
+        return self.__size
+
+    @property
+    def index(self):
+        return self.__index
+
+    @property
+    def num_added(self):
+        """Number of transitions added since the buffer was created.
+        """
+        return self.__num_added
+
+    @property
+    def columns(self):
+        return self.__columns
+
+    @property
+    def transition_type(self):
+        return self.__Transition
+
+    def __allocate(self,
+                   transition: NamedTuple):
+        self.__Transition = type(transition)
+        self.__columns = {}
+        for field, value in zip(transition._fields, transition):
+            value = np.asarray(value)
+            dtype = np.float32 if np.issubdtype(value.dtype, np.floating) else value.dtype
+            self.__columns[field] = np.empty((self.__maxsize,) + value.shape, dtype=dtype)
+
+    def sample_batch(self,
+                     batch_size: int,
+                     rng: Optional[np.random.RandomState] = None) -> Tuple[int, NamedTuple]:
+        """Samples a batch of transitions (with replacement), with the indices
+        drawn from ``rng``, or from the global numpy generator if not given.
+
+        Returns:
+            Number of sampled transitions and a transition namedtuple whose
+            fields are arrays with the batch as the leading dimension.
+        """
+        batch_size = min(batch_size, self.__size)
+        if batch_size == 0:
+            return 0, None
+        indices = (rng or np.random).randint(0, self.__size, size=batch_size)
+        return batch_size, self.__Transition(*[column[indices] for column in self.__columns.values()])
 
     def sample(self, batch_size):
-        batch_size = min(batch_size, len(self.__buffer))
-        return batch_size, random.sample(self.__buffer, batch_size)
-    
+        num_samples, batch = self.sample_batch(batch_size)
+        if num_samples == 0:
+            return 0, []
+        return num_samples, [type(batch)(*values) for values in zip(*batch)]
+
     def add_epsiode(self,
                     transitions: Iterator[NamedTuple]):
         for transition in transitions:
-            self.__buffer.append(transition)
-        
-    def add(self, 
+            self.add(transition)
+
+    def add_batch(self,
+                  batch: NamedTuple):
+        """Bulk inserts transitions given as a namedtuple of arrays with the
+        transitions along the leading dimension.
+        """
+        num_transitions = len(batch[0])
+        if num_transitions == 0:
+            return
+        if self.__columns is None:
+            self.__allocate(type(batch)(*[values[0] for values in batch]))
+        # Only the last maxsize transitions survive
+        start = max(0, num_transitions - self.__maxsize)
+        indices = (self.__index + np.arange(start, num_transitions)) % self.__maxsize
+        for field, values in zip(batch._fields, batch):
+            self.__columns[field][indices] = values[start:]
+        self.__index = (self.__index + num_transitions) % self.__maxsize
+        self.__size = min(self.__size + num_transitions, self.__maxsize)
+        self.__num_added += num_transitions
+
+    def add(self,
             transition: NamedTuple):
-        self.__buffer.append(transition)
+        if self.__columns is None:
+            self.__allocate(transition)
+        for field, value in zip(transition._fields, transition):
+            self.__columns[field][self.__index] = value
+        self.__index = (self.__index + 1) % self.__maxsize
+        self.__size = min(self.__size + 1, self.__maxsize)
+        self.__num_added += 1
+
+    def state_dict(self) -> dict:
+        """Ring buffer counters. The columns are saved separately, see
+        ``utils.checkpoint.save_training_snapshot``.
+        """
+        return {'maxsize': self.__maxsize,
+                'index': self.__index,
+                'size': self.__size,
+                'num_added': self.__num_added}
+
+    def load_state_dict(self,
+                        state: dict,
+                        columns: Dict[str, np.array],
+                        transition_type: type):
+        """Restores the buffer from its counters and the first ``size`` rows
+        of every column.
+        """
+        if state['maxsize'] != self.__maxsize:
+            raise ValueError("Replay size mismatch: {} != {}.".format(state['maxsize'], self.__maxsize))
+        self.__Transition = transition_type
+        self.__columns = None
+        if columns:
+            self.__columns = {}
+            for field in transition_type._fields:
+                values = columns[field]
+                self.__columns[field] = np.empty((self.__maxsize,) + values.shape[1:], dtype=values.dtype)
+                self.__columns[field][:len(values)] = values
+        self.__index = state['index']
+        self.__size = state['size']
+        self.__num_added = state['num_added']
 
 
 if __name__ == "__main__":
+
+    import gymnasium as gym
+
     env = gym.make("Pendulum-v1")
 
-    Transition = ReplayBuffer.Transition()
+    Transition = namedtuple('Transition', ['state', 'action', 'next_state', 'reward', 'done'])
+    buffer = ReplayBuffer(maxsize=1000)
 
     state, info = env.reset()
     done = False
@@ -45,20 +157,17 @@ if __name__ == "__main__":
     while not done:
         action = env.action_space.sample()
         next_state, reward, terminated, truncated, info = env.step(action)
-        
+
         if terminated or truncated:
             done = True
-        
+
         transition = Transition(state,
                                 action,
                                 next_state,
                                 reward,
-                                done,
-                                None)
+                                done)
         episode_data.append(transition)
 
-    buffer.add(episode_data, 0)
-    
-        
-       
-        
\ No newline at end of file
+    buffer.add_epsiode(episode_data)
+    num_samples, batch = buffer.sample_batch(32)
+    print(num_samples, batch.state.shape, batch.state.dtype)
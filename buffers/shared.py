@@ -0,0 +1,385 @@
+import time
+import numpy as np
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from typing import Dict, Iterator, NamedTuple, Optional, Tuple
+
+# Byte alignment of the columns in the shared memory block.
+COLUMN_ALIGNMENT = 64
+
+# Slots of the shared counters: rows reserved by the writers, and rows
+# before which every reserved row is written.
+RESERVED, FILLED = 0, 1
+
+# Seconds a writer waits for the rows it would overwrite to be committed.
+RESERVE_TIMEOUT = 60.0
+
+class SharedReplayBuffer:
+    """Ring buffer of transitions in shared memory, written by several
+    processes and sampled by a learner without serializing any transition.
+
+    The columns have fixed shapes and dtypes given by ``spec`` and are laid
+    out, with the counters, in a single ``multiprocessing.shared_memory``
+    block. A writer reserves a range of slots under a lock (``reserve``),
+    fills them without holding it, then commits them (``write``). The fill
+    counter only moves over committed rows, so the learner never samples a
+    row which is being written, even when writers commit out of order. Once
+    the ring is full, a writer may reserve and overwrite the oldest rows while
+    the learner gathers them; such rows are detected after the gather and
+    taken again from the current window, so no sampled transition is torn.
+
+    The buffer is pickled as a handle to the block, e.g. to pass it to the
+    workers of a ``multiprocessing.Pool`` through its initializer. The process
+    creating the buffer owns the block and frees it in ``close``. Unlike
+    ``ReplayBuffer``, it has the interface of a single transition type and
+    does not grow lazily.
+
+    Args:
+        maxsize (int): Number of rows.
+        spec (dict): Shape (without the row dimension) and dtype of every
+            field of ``transition_type``.
+        transition_type (type): Namedtuple of the transitions.
+        context (str): Start method of the writer processes, the default one
+            of ``multiprocessing`` if not given.
+    """
+
+    def __init__(self,
+                 maxsize: int,
+                 spec: Dict[str, Tuple[tuple, type]],
+                 transition_type: type,
+                 context: Optional[str] = None):
+        self.__maxsize = maxsize
+        self.__spec = {field: (tuple(spec[field][0]), np.dtype(spec[field][1])) for field in transition_type._fields}
+        self.__Transition = transition_type
+        self.__lock = mp.get_context(context).Lock()
+        self.__memory = shared_memory.SharedMemory(create=True, size=self.__layout()[1])
+        self.__owner = True
+        self.__map_columns()
+        self.__counters[:] = 0
+        self.__positions[:] = -1
+
+    def __layout(self) -> Tuple[Dict[str, int], int]:
+        """Offsets of the counters and of the columns, and total size in bytes.
+        """
+        offsets = {}
+        size = 0
+        arrays = [('__counters', (), np.dtype(np.int64)), ('__positions', (), np.dtype(np.int64))]
+        arrays += [(field, shape, dtype) for field, (shape, dtype) in self.__spec.items()]
+        for name, shape, dtype in arrays:
+            offsets[name] = size
+            rows = 2 if name == '__counters' else self.__maxsize
+            size += -(-rows * int(np.prod(shape, dtype=np.int64)) * dtype.itemsize // COLUMN_ALIGNMENT) * COLUMN_ALIGNMENT
+        return offsets, max(size, 1)
+
+    def __map_columns(self):
+        offsets, _ = self.__layout()
+        buffer = self.__memory.buf
+        self.__counters = np.ndarray((2,), dtype=np.int64, buffer=buffer, offset=offsets['__counters'])
+        # Absolute position of the transition of every row, set when it is committed
+        self.__positions = np.ndarray((self.__maxsize,), dtype=np.int64, buffer=buffer, offset=offsets['__positions'])
+        self.__columns = {field: np.ndarray((self.__maxsize,) + shape, dtype=dtype, buffer=buffer, offset=offsets[field])
+                          for field, (shape, dtype) in self.__spec.items()}
+
+    def __getstate__(self) -> dict:
+        return {'maxsize': self.__maxsize,
+                'spec': self.__spec,
+                'transition_type': self.__Transition,
+                'lock': self.__lock,
+                'name': self.__memory.name}
+
+    def __setstate__(self, state: dict):
+        self.__maxsize = state['maxsize']
+        self.__spec = state['spec']
+        self.__Transition = state['transition_type']
+        self.__lock = state['lock']
+        self.__memory = shared_memory.SharedMemory(name=state['name'])
+        self.__owner = False
+        self.__map_columns()
+
+    def close(self):
+        """Detaches from the block, which is freed by its owner.
+        """
+        if self.__memory is None:
+            return
+        self.__counters = self.__positions = self.__columns = None
+        self.__memory.close()
+        if self.__owner:
+            self.__memory.unlink()
+        self.__memory = None
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+    @property
+    def maxsize(self):
+        return self.__maxsize
+
+    @property
+    def spec(self) -> Dict[str, Tuple[tuple, np.dtype]]:
+        return self.__spec
+
+    @property
+    def num_added(self):
+        """Number of transitions committed since the buffer was created.
+        """
+        return int(self.__counters[FILLED])
+
+    @property
+    def replay_size(self):
+        """Number of rows which can be sampled: the committed rows, but for
+        the oldest ones whose slots are reserved again by a writer.
+        """
+        reserved, filled = self.__counters[RESERVED], self.__counters[FILLED]
+        return int(filled - max(0, reserved - self.__maxsize))
+
+    @property
+    def index(self):
+        return int(self.__counters[RESERVED] % self.__maxsize)
+
+    @property
+    def columns(self):
+        return self.__columns
+
+    @property
+    def transition_type(self):
+        return self.__Transition
+
+    def reserve(self,
+                num_rows: int,
+                timeout: float = RESERVE_TIMEOUT) -> int:
+        """Reserves the next ``num_rows`` slots. Waits while they would
+        overwrite rows which are not committed yet.
+
+        Args:
+            num_rows (int): Number of slots.
+            timeout (float): Seconds to wait for the rows to be committed.
+
+        Returns:
+            Absolute position of the first slot, to be given to ``write``.
+
+        Raises:
+            TimeoutError: If the rows are still not committed after ``timeout``
+                seconds, e.g. because a writer died between ``reserve`` and
+                ``write``.
+        """
+        if num_rows > self.__maxsize:
+            raise ValueError("Cannot reserve {} rows in a replay of {} rows.".format(num_rows, self.__maxsize))
+        deadline = time.monotonic() + timeout
+        while True:
+            with self.__lock:
+                start = int(self.__counters[RESERVED])
+                filled = int(self.__counters[FILLED])
+                if start + num_rows - self.__maxsize <= filled:
+                    self.__counters[RESERVED] = start + num_rows
+                    return start
+            if time.monotonic() > deadline:
+                raise TimeoutError("The rows from position {} were not committed within {}s, "
+                                   "a writer may have died before its write.".format(filled, timeout))
+            time.sleep(1e-4)
+
+    def write(self,
+              start: int,
+              batch: NamedTuple):
+        """Writes transitions, given as a namedtuple of arrays, to the slots
+        reserved at ``start`` and commits them.
+        """
+        num_rows = len(batch[0])
+        positions = start + np.arange(num_rows)
+        rows = positions % self.__maxsize
+        for field, values in zip(batch._fields, batch):
+            self.__columns[field][rows] = values
+        with self.__lock:
+            self.__positions[rows] = positions
+            # Move the fill counter over the rows committed without gaps
+            filled = int(self.__counters[FILLED])
+            pending = np.arange(filled, int(self.__counters[RESERVED]))
+            gaps = np.flatnonzero(self.__positions[pending % self.__maxsize] != pending)
+            self.__counters[FILLED] = filled + (gaps[0] if len(gaps) else len(pending))
+
+    def add_batch(self,
+                  batch: NamedTuple):
+        """Bulk inserts transitions given as a namedtuple of arrays with the
+        transitions along the leading dimension.
+        """
+        num_transitions = len(batch[0])
+        if num_transitions == 0:
+            return
+        # Only the last maxsize transitions survive
+        start = max(0, num_transitions - self.__maxsize)
+        self.write(self.reserve(num_transitions - start),
+                   type(batch)(*[values[start:] for values in batch]))
+
+    def add(self,
+            transition: NamedTuple):
+        self.add_batch(type(transition)(*[np.asarray(value)[None] for value in transition]))
+
+    def add_epsiode(self,
+                    transitions: Iterator[NamedTuple]):
+        transitions = list(transitions)
+        if transitions:
+            self.add_batch(type(transitions[0])(*[np.stack(values) for values in zip(*transitions)]))
+
+    def __window(self) -> Tuple[int, int]:
+        """Absolute position of the oldest row which can be sampled, and
+        number of such rows.
+        """
+        with self.__lock:
+            reserved, filled = int(self.__counters[RESERVED]), int(self.__counters[FILLED])
+        oldest = max(0, reserved - self.__maxsize)
+        return oldest, filled - oldest
+
+    def __sample(self,
+                 batch_size: int,
+                 draw,
+                 rank: int = 0,
+                 world_size: int = 1) -> Tuple[int, NamedTuple]:
+        oldest, size = self.__window()
+        batch_size = min(batch_size, size)
+        if batch_size <= 0:
+            return 0, None
+        offsets = draw(size, batch_size * world_size)[rank * batch_size:(rank + 1) * batch_size]
+        while True:
+            rows = offsets % size
+            if size < self.__maxsize:
+                rows = (oldest + rows) % self.__maxsize
+            batch = self.__Transition(*[column[rows] for column in self.__columns.values()])
+            # Rows reserved again during the gather may be torn, they are
+            # taken again at the same offsets of the new window
+            positions = oldest + (rows - oldest) % self.__maxsize
+            oldest, size = self.__window()
+            if size <= 0:
+                return 0, None
+            if positions.min() >= oldest:
+                return batch_size, batch
+
+    def sample_batch(self,
+                     batch_size: int,
+                     rng: Optional[np.random.RandomState] = None) -> Tuple[int, NamedTuple]:
+        """Samples a batch of committed transitions (with replacement), see
+        ``ReplayBuffer.sample_batch``.
+
+        The rows are gathered once into arrays of the column dtypes, which
+        ``torch.from_numpy`` wraps without any further copy.
+
+        Returns:
+            Number of sampled transitions and a transition namedtuple whose
+            fields are arrays with the batch as the leading dimension.
+        """
+        return self.__sample(batch_size, lambda size, num_rows: (rng or np.random).randint(0, size, size=num_rows))
+
+    def sample_shard(self,
+                     batch_size: int,
+                     rank: int,
+                     world_size: int,
+                     rng: np.random.Generator) -> Tuple[int, NamedTuple]:
+        """Samples the ``rank``-th shard of ``batch_size`` transitions of a
+        batch of ``batch_size * world_size`` transitions drawn from ``rng``.
+        Processes whose generators are in the same state get the disjoint
+        shards of the same batch. Only the rows of the shard are gathered.
+        """
+        return self.__sample(batch_size, lambda size, num_rows: rng.integers(0, size, size=num_rows), rank, world_size)
+
+    def sample(self, batch_size):
+        num_samples, batch = self.sample_batch(batch_size)
+        if num_samples == 0:
+            return 0, []
+        return num_samples, [self.__Transition(*values) for values in zip(*batch)]
+
+    def state_dict(self) -> dict:
+        """Ring buffer counters, see ``ReplayBuffer.state_dict``. Rows being
+        written are not part of the state.
+        """
+        return {'maxsize': self.__maxsize,
+                'index': self.num_added % self.__maxsize,
+                'size': min(self.num_added, self.__maxsize),
+                'num_added': self.num_added}
+
+    def load_state_dict(self,
+                        state: dict,
+                        columns: Dict[str, np.array],
+                        transition_type: type):
+        """See ``ReplayBuffer.load_state_dict``. No writer may be running.
+        """
+        if state['maxsize'] != self.__maxsize:
+            raise ValueError("Replay size mismatch: {} != {}.".format(state['maxsize'], self.__maxsize))
+        size = state['size']
+        for field in self.__Transition._fields:
+            if size:
+                self.__columns[field][:size] = columns[field]
+        num_added = state['num_added']
+        rows = np.arange(self.__maxsize)
+        self.__positions[:] = np.where(rows < size, num_added - 1 - (num_added - 1 - rows) % self.__maxsize, -1)
+        self.__counters[RESERVED] = num_added
+        self.__counters[FILLED] = num_added
+
+class ShardedSampler:
+    """View of a ``SharedReplayBuffer`` shared by data parallel learners,
+    whose ``sample_batch`` returns the shard of the process.
+
+    Every learner draws the rows of the global batch from a generator seeded
+    with the same ``seed`` and keeps its own slice, so the shards of an update
+    split a single batch of ``batch_size * world_size`` transitions. The
+    learners must sample the same number of batches of the same size, while
+    the replay does not change. The other attributes are those of the replay.
+
+    Args:
+        replay (SharedReplayBuffer): Replay shared by the learners.
+        rank (int): Rank of the learner.
+        world_size (int): Number of learners.
+        seed (int): Seed of the sampling generator, the same for every learner.
+    """
+
+    def __init__(self,
+                 replay: SharedReplayBuffer,
+                 rank: int,
+                 world_size: int,
+                 seed: int):
+        self.__replay = replay
+        self.__rank = rank
+        self.__world_size = world_size
+        self.__rng = np.random.default_rng(seed)
+
+    def __getattr__(self, name: str):
+        return getattr(self.__replay, name)
+
+    def sample_batch(self, batch_size: int) -> Tuple[int, NamedTuple]:
+        return self.__replay.sample_shard(batch_size, self.__rank, self.__world_size, self.__rng)
+
+    def sample(self, batch_size):
+        num_samples, batch = self.sample_batch(batch_size)
+        if num_samples == 0:
+            return 0, []
+        return num_samples, [type(batch)(*values) for values in zip(*batch)]
+
+
+if __name__ == "__main__":
+
+    import time
+    from agents.base import Transition
+
+    def write_rows(replay: SharedReplayBuffer, writer: int, num_batches: int, batch_size: int):
+        for _ in range(num_batches):
+            start = replay.reserve(batch_size)
+            replay.write(start, Transition(state=np.full((batch_size, 3), writer, dtype=np.float32),
+                                           action=np.zeros((batch_size, 1), dtype=np.float32),
+                                           n_step_reward=np.zeros(batch_size, dtype=np.float32),
+                                           n_step_next_state=np.full((batch_size, 3), writer, dtype=np.float32),
+                                           terminated=np.zeros(batch_size, dtype=bool),
+                                           returns=np.zeros(batch_size, dtype=np.float32)))
+
+    spec = {'state': ((3,), np.float32), 'action': ((1,), np.float32), 'n_step_reward': ((), np.float32),
+            'n_step_next_state': ((3,), np.float32), 'terminated': ((), bool), 'returns': ((), np.float32)}
+    replay = SharedReplayBuffer(maxsize=100000, spec=spec, transition_type=Transition)
+    start = time.perf_counter()
+    writers = [mp.Process(target=write_rows, args=(replay, writer, 100, 256)) for writer in range(4)]
+    for writer in writers:
+        writer.start()
+    for writer in writers:
+        writer.join()
+    print("4 writers: {} rows in {:.3f}s".format(replay.num_added, time.perf_counter() - start))
+    num_samples, batch = replay.sample_batch(8)
+    print(num_samples, batch.state[:, 0], np.bincount(replay.columns['state'][:replay.replay_size, 0].astype(int)))
+    replay.close()
@@ -0,0 +1,323 @@
+import os
+import numpy as np
+import multiprocessing as mp
+from typing import Dict, Optional, Callable, Iterator, List, Tuple
+from collections import namedtuple
+from utils.noise import OUNoise
+from utils.lazy import make_env
+from utils.spaces import observation_dtype, as_stored_observation
+
+# Raw one step transitions of the warm-up phase, stored column-wise.
+WARM_UP_FIELDS = ['state', 'action', 'reward', 'next_state', 'terminated', 'truncated']
+
+# Ornstein-Uhlenbeck process of the "noise" warm-up policy, in units of
+# half the action range.
+WARM_UP_NOISE_THETA = 0.15
+WARM_UP_NOISE_SIGMA = 0.3
+
+# Steps collected by a worker per chunk of the streamed warm-up.
+WARM_UP_CHUNK_STEPS = 5000
+
+def sample_warm_up_actions(action_space: "gym.spaces.Box",
+                           num_steps: int,
+                           policy: str,
+                           rng: np.random.Generator) -> np.array:
+    """Samples the actions of a whole chunk at once, without any network.
+
+    Args:
+        action_space (gym.spaces.Box): Action space of the environment.
+        num_steps (int): Number of actions to sample.
+        policy (str): ``random`` samples uniformly within the bounds, ``noise``
+            follows a temporally correlated Ornstein-Uhlenbeck process.
+        rng (np.random.Generator): Random generator of the chunk.
+    """
+    low = action_space.low.astype(np.float32)
+    high = action_space.high.astype(np.float32)
+    shape = (num_steps,) + action_space.shape
+
+    if policy == "random":
+        return rng.uniform(low, high, size=shape).astype(np.float32)
+    elif policy == "noise":
+        process = OUNoise(mu=0.0, theta=WARM_UP_NOISE_THETA, sigma=WARM_UP_NOISE_SIGMA, rng=rng, block_size=max(num_steps, 1))
+        process.reset(size=action_space.shape[0])
+        noise = np.array([process.sample() for _ in range(num_steps)]).reshape(shape)
+        actions = (low + high) / 2 + (high - low) / 2 * np.clip(noise, -1.0, 1.0)
+        return actions.astype(np.float32)
+    raise NotImplementedError("Warm-up policy {} is not implemented yet.".format(policy))
+
+def collect_warm_up_transitions(env_id: str,
+                                seed: int,
+                                num_steps: int,
+                                policy: str = "random") -> Dict[str, np.array]:
+    """Collects transitions with actions sampled in bulk by ``sample_warm_up_actions``.
+
+    The episode running when ``num_steps`` is reached is marked as truncated.
+
+    Args:
+        env_id (str): Environment to collect from.
+        seed (int): Seed of the environment and of the actions.
+        num_steps (int): Number of transitions to collect.
+        policy (str): Warm-up policy, ``random`` or ``noise``.
+    """
+    env = make_env(env_id)
+    state, info = env.reset(seed=seed)
+
+    obs_dtype = observation_dtype(env.observation_space)
+    data = {'state': np.empty((num_steps,) + env.observation_space.shape, dtype=obs_dtype),
+            'action': sample_warm_up_actions(env.action_space, num_steps, policy, np.random.default_rng(seed)),
+            'reward': np.empty(num_steps, dtype=np.float32),
+            'next_state': np.empty((num_steps,) + env.observation_space.shape, dtype=obs_dtype),
+            'terminated': np.empty(num_steps, dtype=bool),
+            'truncated': np.empty(num_steps, dtype=bool)}
+
+    for step in range(num_steps):
+        next_state, reward, terminated, truncated, info = env.step(data['action'][step])
+        data['state'][step] = state
+        data['reward'][step] = reward
+        data['next_state'][step] = next_state
+        data['terminated'][step] = terminated
+        data['truncated'][step] = truncated
+        if terminated or truncated:
+            state, info = env.reset()
+        else:
+            state = next_state
+
+    if num_steps > 0:
+        data['truncated'][-1] = data['truncated'][-1] or not data['terminated'][-1]
+    env.close()
+    return data
+
+def _collect_chunk(args):
+    return collect_warm_up_transitions(*args)
+
+def _warm_up_tasks(env_id: str,
+                   seed: int,
+                   num_steps: int,
+                   policy: str,
+                   chunk_steps: int) -> List[tuple]:
+    """Arguments of ``collect_warm_up_transitions`` for every chunk. Chunk ``i``
+    holds the steps from ``i * chunk_steps`` and is collected with seed
+    ``seed + i``, so the transitions do not depend on the number of workers,
+    and fewer steps are a prefix of more steps.
+    """
+    return [(env_id, seed + i, min(chunk_steps, num_steps - start), policy)
+            for i, start in enumerate(range(0, num_steps, chunk_steps))]
+
+def iter_warm_up_chunks(env_id: str,
+                        seed: int,
+                        num_steps: int,
+                        num_workers: int,
+                        policy: str = "random",
+                        chunk_steps: int = WARM_UP_CHUNK_STEPS) -> Iterator[Dict[str, np.array]]:
+    """Streams the warm-up transitions collected by a pool of processes.
+
+    The steps are split in chunks of ``chunk_steps`` (the last one shorter);
+    chunk ``i`` is collected with seed ``seed + i`` and ends with a truncated
+    episode. At most one worker per chunk is used. The chunks are yielded in
+    order as soon as they are ready, so that they can be inserted in the
+    replay while the remaining chunks are collected.
+    """
+    tasks = _warm_up_tasks(env_id, seed, num_steps, policy, chunk_steps)
+    if num_workers == 1 or len(tasks) == 1:
+        for task in tasks:
+            yield _collect_chunk(task)
+        return
+    with mp.Pool(min(num_workers, len(tasks))) as pool:
+        for chunk in pool.imap(_collect_chunk, tasks):
+            yield chunk
+
+def collect_warm_up_transitions_parallel(env_id: str,
+                                         seed: int,
+                                         num_steps: int,
+                                         num_workers: int,
+                                         policy: str = "random",
+                                         chunk_steps: int = WARM_UP_CHUNK_STEPS) -> Dict[str, np.array]:
+    """Concatenates the chunks of ``iter_warm_up_chunks``.
+    """
+    chunks = list(iter_warm_up_chunks(env_id, seed, num_steps, num_workers, policy, chunk_steps))
+    return {field: np.concatenate([chunk[field] for chunk in chunks]) for field in WARM_UP_FIELDS}
+
+def n_step_transitions(data: Dict[str, np.array],
+                       transition_type: type,
+                       n_step: int,
+                       gamma: float,
+                       normalize_fn: Optional[Callable] = None):
+    """Vectorized version of ``BaseAgent._calculate_n_step_returns`` over the
+    raw transitions of many consecutive episodes.
+
+    Returns:
+        A ``transition_type`` namedtuple whose fields are arrays.
+    """
+    assert n_step > 0, "n-step must be > 1."
+    assert gamma > 0 and gamma <= 1 , "gamma must be between (0, 1]."
+
+    rewards = data['reward'].astype(np.float64)
+    terminated = data['terminated']
+    episode_end = terminated | data['truncated']
+    num_steps = len(rewards)
+
+    # Exclusive end index of the episode of every step
+    ends = np.flatnonzero(episode_end) + 1
+    steps = np.arange(num_steps)
+    end_of_step = ends[np.searchsorted(ends, steps, side='right')]
+    remaining = end_of_step - steps
+    horizon = np.minimum(n_step, remaining)
+
+    n_step_reward = np.zeros(num_steps)
+    for i in range(n_step):
+        valid = i < horizon
+        n_step_reward[valid] += (gamma**i) * rewards[steps[valid] + i]
+
+    returns = np.zeros(num_steps)
+    cum_returns = 0.0
+    for step in reversed(range(num_steps)):
+        if episode_end[step]:
+            cum_returns = 0.0
+        cum_returns = rewards[step] + gamma * cum_returns
+        returns[step] = cum_returns
+
+    states = data['state']
+    n_step_next_states = data['next_state'][steps + horizon - 1]
+    if normalize_fn is not None:
+        states = normalize_fn(states)
+        n_step_next_states = normalize_fn(n_step_next_states)
+
+    return transition_type(state=as_stored_observation(states),
+                           action=data['action'],
+                           n_step_reward=n_step_reward.astype(np.float32),
+                           n_step_next_state=as_stored_observation(n_step_next_states),
+                           terminated=(remaining <= n_step) & terminated[end_of_step - 1],
+                           returns=returns.astype(np.float32))
+
+# Replay the warm-up workers write to, set by the pool initializer.
+_shared_replay = None
+
+def _attach_shared_replay(replay):
+    global _shared_replay
+    _shared_replay = replay
+
+def _write_chunk(args):
+    task, start, n_step, gamma, observation_bounds = args
+    data = collect_warm_up_transitions(*task)
+    normalize_fn = None
+    if observation_bounds is not None:
+        low, high = observation_bounds
+        normalize_fn = lambda obs: np.divide(obs - low, high - low)
+    _shared_replay.write(start, n_step_transitions(data,
+                                                   _shared_replay.transition_type,
+                                                   n_step=n_step,
+                                                   gamma=gamma,
+                                                   normalize_fn=normalize_fn))
+    return len(data['reward'])
+
+def write_warm_up_chunks(replay,
+                         env_id: str,
+                         seed: int,
+                         num_steps: int,
+                         num_workers: int,
+                         n_step: int,
+                         gamma: float,
+                         policy: str = "random",
+                         observation_bounds: Optional[Tuple[np.array, np.array]] = None,
+                         chunk_steps: int = WARM_UP_CHUNK_STEPS) -> int:
+    """Collects the chunks of ``iter_warm_up_chunks`` in a pool of processes
+    which write their n-step transitions straight to a ``SharedReplayBuffer``,
+    instead of sending them back to be inserted.
+
+    The slots of the chunks are reserved in order beforehand, so the replay
+    holds the same rows as with ``iter_warm_up_chunks``, whatever the order in
+    which the workers finish. All the steps must fit in the replay.
+
+    Args:
+        replay (SharedReplayBuffer): Replay to write to.
+        observation_bounds (tuple): Low and high bounds the observations are
+            normalized with, if any.
+
+    Returns:
+        The number of transitions written.
+    """
+    if num_steps > replay.maxsize:
+        raise ValueError("{} warm-up steps do not fit in a replay of {} rows.".format(num_steps, replay.maxsize))
+    tasks = [(task, replay.reserve(task[2]), n_step, gamma, observation_bounds)
+             for task in _warm_up_tasks(env_id, seed, num_steps, policy, chunk_steps)]
+    if num_workers == 1 or len(tasks) == 1:
+        _attach_shared_replay(replay)
+        try:
+            return sum(_write_chunk(task) for task in tasks)
+        finally:
+            _attach_shared_replay(None)
+    with mp.Pool(min(num_workers, len(tasks)), initializer=_attach_shared_replay, initargs=(replay,)) as pool:
+        return sum(pool.imap_unordered(_write_chunk, tasks))
+
+class WarmUpCache:
+    """On-disk cache of warm-up transitions, shared across tuning trials and runs.
+
+    Entries are keyed by environment id, seed, collection policy and chunk
+    size, and stored as uncompressed ``.npz`` archives of the raw one step
+    transitions, so that the n-step returns can be computed for any
+    ``gamma``/``n_step`` when the entry is loaded. Since the chunks do not
+    depend on the number of steps or workers, a request for fewer steps than
+    an entry holds is served from its prefix, which is what a fresh collection
+    would give; a request for more steps replaces the entry.
+
+    Args:
+        cache_dir (str): Directory of the cache entries.
+        num_workers (int): Processes used to collect a missing entry.
+        chunk_steps (int): Steps per chunk, see ``iter_warm_up_chunks``.
+    """
+
+    def __init__(self,
+                 cache_dir: str,
+                 num_workers: int = 1,
+                 chunk_steps: int = WARM_UP_CHUNK_STEPS):
+        self.__cache_dir = cache_dir
+        self.__num_workers = num_workers
+        self.__chunk_steps = chunk_steps
+
+    @property
+    def cache_dir(self) -> str:
+        return self.__cache_dir
+
+    def path(self,
+             env_id: str,
+             seed: int,
+             policy: str) -> str:
+        name = "{}_seed_{}_{}_chunk_{}.npz".format(env_id.replace("/", "_"), seed, policy, self.__chunk_steps)
+        return os.path.join(self.__cache_dir, name)
+
+    def load_or_collect(self,
+                        env_id: str,
+                        seed: int,
+                        num_steps: int,
+                        policy: str = "random") -> Dict[str, np.array]:
+        path = self.path(env_id, seed, policy)
+        if os.path.exists(path):
+            with np.load(path) as archive:
+                if len(archive['reward']) >= num_steps:
+                    data = {field: archive[field][:num_steps] for field in WARM_UP_FIELDS}
+                    # The prefix ends with a truncated episode
+                    if num_steps > 0:
+                        data['truncated'][-1] = data['truncated'][-1] or not data['terminated'][-1]
+                    return data
+
+        data = collect_warm_up_transitions_parallel(env_id, seed, num_steps, self.__num_workers, policy, self.__chunk_steps)
+
+        # Write atomically, concurrent trials might be filling the same entry
+        os.makedirs(self.__cache_dir, exist_ok=True)
+        tmp_path = "{}.{}.tmp.npz".format(path[:-len(".npz")], os.getpid())
+        np.savez(tmp_path, **data)
+        os.replace(tmp_path, path)
+        return data
+
+
+if __name__ == "__main__":
+
+    import time
+    Transition = namedtuple('Transition', ['state', 'action', 'n_step_reward', 'n_step_next_state', 'terminated', 'returns'])
+
+    cache = WarmUpCache(cache_dir="/tmp/warm_up_cache", num_workers=4)
+    start = time.perf_counter()
+    data = cache.load_or_collect("Pendulum-v1", seed=258, num_steps=10000)
+    print("Loaded {} transitions in {:.3f}s".format(len(data['reward']), time.perf_counter() - start))
+    batch = n_step_transitions(data, Transition, n_step=5, gamma=0.9)
+    print(batch.state.shape, batch.n_step_reward[:5])
@@ -0,0 +1,91 @@
+import os
+import csv
+import glob
+import torch
+import argparse
+import numpy as np
+import multiprocessing as mp
+from typing import List
+
+from agents.policy import Policy
+from utils.evaluation import BatchedEvaluator, mean_confidence_interval
+
+COLUMNS = ["checkpoint", "episodes",
+           "reward_mean", "reward_std", "reward_ci95",
+           "length_mean", "length_std", "length_ci95"]
+
+def find_checkpoints(paths: List[str]) -> List[str]:
+    """Expands directories and glob patterns into checkpoint files. The
+    training snapshots of directories (``resume/``) are skipped.
+    """
+    checkpoints = []
+    for path in paths:
+        if os.path.isdir(path):
+            checkpoints.extend(checkpoint for checkpoint in glob.glob(os.path.join(path, "**", "*.pkt"), recursive=True)
+                               if "resume" not in os.path.relpath(checkpoint, path).split(os.sep))
+        else:
+            checkpoints.extend(glob.glob(path))
+    return sorted(set(checkpoints))
+
+def evaluate_checkpoint(args) -> dict:
+    checkpoint, seeds, num_envs = args
+    torch.set_num_threads(1)
+    policy = Policy.load(checkpoint)
+    evaluator = BatchedEvaluator(policy.env_id,
+                                 num_envs=num_envs,
+                                 history_length=policy.history_length,
+                                 action_repeat=policy.action_repeat)
+    rewards, lengths = evaluator.run(policy, seeds)
+    evaluator.close()
+
+    row = {"checkpoint": checkpoint, "episodes": len(seeds)}
+    for name, values in [("reward", rewards), ("length", lengths)]:
+        mean, std, ci = mean_confidence_interval(values)
+        row[name + "_mean"] = mean
+        row[name + "_std"] = std
+        row[name + "_ci95"] = ci
+    return row
+
+def format_table(rows: List[dict]) -> str:
+    header = ["checkpoint", "episodes", "reward (mean ± ci95)", "reward std", "length (mean ± ci95)"]
+    lines = [[os.path.basename(row["checkpoint"]),
+              str(row["episodes"]),
+              "{:.2f} ± {:.2f}".format(row["reward_mean"], row["reward_ci95"]),
+              "{:.2f}".format(row["reward_std"]),
+              "{:.1f} ± {:.1f}".format(row["length_mean"], row["length_ci95"])] for row in rows]
+    widths = [max(len(line[i]) for line in [header] + lines) for i in range(len(header))]
+    return "\n".join("  ".join(value.ljust(width) for value, width in zip(line, widths)) for line in [header] + lines)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("paths", type=str, nargs="+", help="Checkpoint files, directories or glob patterns.")
+    parser.add_argument("--num-episodes", type=int, default=20, help="Episodes per checkpoint.")
+    parser.add_argument("--seed", type=int, default=10000, help="Seed of the first episode. Every checkpoint uses the same seeds.")
+    parser.add_argument("--num-envs", type=int, default=8, help="Environments stepped together per worker.")
+    parser.add_argument("--num-workers", type=int, default=os.cpu_count(), help="Worker processes.")
+    parser.add_argument("--output", type=str, default=None, help="CSV file of the results.")
+    args = parser.parse_args()
+
+    checkpoints = find_checkpoints(args.paths)
+    if not checkpoints:
+        raise FileNotFoundError("No checkpoints found in {}.".format(args.paths))
+
+    seeds = list(range(args.seed, args.seed + args.num_episodes))
+    tasks = [(checkpoint, seeds, args.num_envs) for checkpoint in checkpoints]
+    num_workers = min(args.num_workers, len(tasks))
+    if num_workers == 1:
+        rows = [evaluate_checkpoint(task) for task in tasks]
+    else:
+        with mp.Pool(num_workers) as pool:
+            rows = pool.map(evaluate_checkpoint, tasks)
+
+    rows = sorted(rows, key=lambda row: row["reward_mean"], reverse=True)
+    print(format_table(rows))
+
+    if args.output is not None:
+        with open(args.output, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=COLUMNS)
+            writer.writeheader()
+            writer.writerows(rows)
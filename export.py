@@ -0,0 +1,131 @@
+import os
+import time
+import torch
+import argparse
+import numpy as np
+from typing import Optional
+
+from agents.policy import Policy
+from utils.numpy_policy import NumpyPolicy
+
+class ExportedActor(torch.nn.Module):
+    """Actor with the observation normalization folded in, traced to ONNX.
+    The action scaling is part of the actor itself.
+    """
+
+    def __init__(self, policy: Policy):
+        super().__init__()
+        self.actor = policy.actor
+        self.normalize_observations = policy.normalize_observations
+        self.register_buffer("observation_low", torch.from_numpy(policy.observation_low))
+        self.register_buffer("observation_scale", torch.from_numpy(policy.observation_scale))
+
+    def forward(self, obs: torch.FloatTensor) -> torch.FloatTensor:
+        if self.normalize_observations:
+            obs = (obs - self.observation_low) / self.observation_scale
+        return self.actor(obs)
+
+def export_npz(policy: Policy,
+               path: str):
+    """Writes the actor in the format of ``utils.numpy_policy.NumpyPolicy``.
+    """
+    if not hasattr(policy.actor, 'export_layers'):
+        raise ValueError("{} can not be exported to npz.".format(type(policy.actor).__name__))
+    layers = policy.actor.export_layers()
+    arrays = {'normalize_observations': np.array(policy.normalize_observations),
+              'observation_low': policy.observation_low,
+              'observation_scale': policy.observation_scale,
+              'action_scale': policy.actor.action_scale.detach().cpu().numpy(),
+              'activations': np.array([layer['activation'] for layer in layers])}
+    for i, layer in enumerate(layers):
+        arrays['layer_{}_weight'.format(i)] = layer['weight']
+        arrays['layer_{}_bias'.format(i)] = layer['bias']
+        if 'norm' in layer:
+            arrays['layer_{}_norm_weight'.format(i)] = layer['norm']['weight']
+            arrays['layer_{}_norm_bias'.format(i)] = layer['norm']['bias']
+            arrays['layer_{}_norm_eps'.format(i)] = np.array(layer['norm']['eps'])
+    np.savez(path, **arrays)
+
+def export_onnx(policy: Policy,
+                path: str):
+    """Writes the actor with its normalization to ONNX, with a dynamic batch dimension.
+    """
+    model = ExportedActor(policy).eval()
+    dummy_obs = torch.zeros(1, policy.observation_low.shape[0])
+    torch.onnx.export(model,
+                      (dummy_obs,),
+                      path,
+                      input_names=["observation"],
+                      output_names=["action"],
+                      dynamic_axes={"observation": {0: "batch"}, "action": {0: "batch"}})
+
+def sample_observations(policy: Policy,
+                        num_samples: int) -> np.array:
+    """Observations within the bounds, or standard normal ones for unbounded dimensions.
+    """
+    low = policy.observation_low
+    high = low + policy.observation_scale
+    bounded = np.isfinite(low) & np.isfinite(high)
+    obs = np.random.randn(num_samples, low.shape[0]).astype(np.float32)
+    obs[:, bounded] = np.random.uniform(low[bounded], high[bounded], size=(num_samples, bounded.sum()))
+    return obs
+
+def check_parity(policy: Policy,
+                 npz_path: Optional[str] = None,
+                 onnx_path: Optional[str] = None,
+                 num_samples: int = 1024,
+                 atol: float = 1e-5):
+    """Compares the exported actors against the torch actor.
+    """
+    obs = sample_observations(policy, num_samples)
+    expected = policy(obs)
+
+    if npz_path is not None:
+        start = time.perf_counter()
+        numpy_policy = NumpyPolicy(npz_path)
+        load_time = time.perf_counter() - start
+        error = np.abs(numpy_policy(obs) - expected).max()
+        print("npz: max abs error {:.2e}, load time {:.2f}ms".format(error, load_time * 1000))
+        if error > atol:
+            raise AssertionError("npz actor differs from the torch actor by {:.2e}.".format(error))
+
+    if onnx_path is not None:
+        try:
+            import onnxruntime
+        except ImportError:
+            print("onnx: skipped, onnxruntime is not installed")
+            return
+        session = onnxruntime.InferenceSession(onnx_path)
+        error = np.abs(session.run(["action"], {"observation": obs})[0] - expected).max()
+        print("onnx: max abs error {:.2e}".format(error))
+        if error > atol:
+            raise AssertionError("ONNX actor differs from the torch actor by {:.2e}.".format(error))
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--checkpoint", type=str, required=True, help="Checkpoint to export.")
+    parser.add_argument("--output-dir", type=str, default="exported", help="Directory of the exported actor.")
+    parser.add_argument("--format", type=str, default="all", choices=["all", "onnx", "npz"], help="Export format.")
+    parser.add_argument("--check", action="store_true", help="Check the exported actors against the torch actor.")
+    args = parser.parse_args()
+
+    policy = Policy.load(args.checkpoint)
+    os.makedirs(args.output_dir, exist_ok=True)
+    name = os.path.splitext(os.path.basename(args.checkpoint))[0]
+
+    npz_path = None
+    if args.format in ["all", "npz"]:
+        npz_path = os.path.join(args.output_dir, name + ".npz")
+        export_npz(policy, npz_path)
+        print("Exported {}".format(npz_path))
+
+    onnx_path = None
+    if args.format in ["all", "onnx"]:
+        onnx_path = os.path.join(args.output_dir, name + ".onnx")
+        export_onnx(policy, onnx_path)
+        print("Exported {}".format(onnx_path))
+
+    if args.check:
+        check_parity(policy, npz_path, onnx_path)
@@ -1,14 +1,30 @@
 import torch
 import torch.nn as nn
-from gymnasium.spaces import Box
+from utils.lazy import lazy_import
+
+# Loaded once a model is built
+spaces = lazy_import("gymnasium.spaces")
+
+# Keys of the actor/critic params which configure their training rather than
+# the network, and are not passed to the model.
+TRAINING_PARAMS = ('lr', 'loss_fn')
+
+def model_kwargs(params: dict) -> dict:
+    return {key: value for key, value in params.items() if key not in TRAINING_PARAMS}
 
 class BaseModel(nn.Module):
 
     def __init__(self,
-                 observation_type: Box,
-                 action_type: Box):
+                 observation_type: "spaces.Box",
+                 action_type: "spaces.Box"):
         super(BaseModel, self).__init__()
     
+    def trainable_parameters(self):
+        """Parameters updated by the optimizer of the model. Modules shared
+        with another model (e.g. an encoder) are trained by their owner.
+        """
+        return self.parameters()
+
     @property
     def actor(self,):
         raise NotImplementedError()
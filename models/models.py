@@ -2,18 +2,23 @@ import torch
 import torch.nn as nn
 import numpy as np
 from models.base import BaseModel
-from gymnasium.spaces import Box
+from utils.lazy import lazy_import
+from utils.registry import MODELS
+
+# Loaded once a model is built
+spaces = lazy_import("gymnasium.spaces")
 
 def fanin_init(size, fanin=None):
     fanin = fanin or size[0]
     v = 1. / np.sqrt(fanin)
     return torch.Tensor(size).uniform_(-v, v)
 
+@MODELS.register
 class SimpleCritic(BaseModel):
 
     def __init__(self,
-                 observation_type: Box,
-                 action_type: Box,
+                 observation_type: "spaces.Box",
+                 action_type: "spaces.Box",
                  hidden_size: int,
                  **kwargs):
         
@@ -50,11 +55,12 @@ class SimpleCritic(BaseModel):
         x = self.fc3(self.activation(self.fc2(self.activation(self.fc1(x)))))
         return x
 
+@MODELS.register
 class SimpleActor(BaseModel):
 
     def __init__(self,
-                 observation_type: Box,
-                 action_type: Box,
+                 observation_type: "spaces.Box",
+                 action_type: "spaces.Box",
                  hidden_size: int,
                  **kwargs):
         
@@ -64,10 +70,11 @@ class SimpleActor(BaseModel):
         self.__observation_dims = observation_type.shape[0]
         self.__action_dims = action_type.shape[0]
 
-        # Action Lower Bound
-        self._action_lower_bound = torch.FloatTensor(action_type.low)
-        self._action_upper_bound = torch.FloatTensor(action_type.high)
-        assert torch.equal(-self._action_lower_bound, self._action_upper_bound)
+        # Action bounds. The buffer follows the module across devices, and is
+        # left out of the state dict as it is derived from the action space.
+        action_lower_bound = torch.FloatTensor(action_type.low)
+        self.register_buffer("_action_upper_bound", torch.FloatTensor(action_type.high), persistent=False)
+        assert torch.equal(-action_lower_bound, self._action_upper_bound)
         
         self.fc1 = nn.Linear(out_features=hidden_size, in_features=observation_type.shape[0])
         self.fc2 = nn.Linear(out_features=hidden_size, in_features=hidden_size)
@@ -89,13 +96,24 @@ class SimpleActor(BaseModel):
     @property
     def action_dims(self):
         return self.__action_dims
+
+    @property
+    def action_scale(self) -> torch.FloatTensor:
+        return self._action_upper_bound
+
+    def export_layers(self) -> list:
+        """Linear layers of the network and the activation following each of
+        them, as numpy arrays. Used to export the actor, see ``export.py``.
+        """
+        return [{'weight': layer.weight.detach().cpu().numpy(),
+                 'bias': layer.bias.detach().cpu().numpy(),
+                 'activation': activation} for layer, activation in [(self.fc1, 'relu'),
+                                                                     (self.fc2, 'relu'),
+                                                                     (self.fc3, 'tanh')]]
     
     def forward(self,
                 states: torch.FloatTensor):
         
-        if self._action_upper_bound.device != states.device:
-            self._action_upper_bound = self._action_upper_bound.device()
-        
         x = states.view(-1, self.__observation_dims)
         x = self.fc3(self.activation(self.fc2(self.activation(self.fc1(x)))))
         # Let the model learn the interpolation function from [-1, 1] to [action_high, action_low]
@@ -103,6 +121,354 @@ class SimpleActor(BaseModel):
         return x
 
 
+ACTIVATIONS = {
+    'relu': nn.ReLU,
+    'tanh': nn.Tanh,
+    'elu': nn.ELU,
+    'silu': nn.SiLU,
+}
+
+def build_hidden_layers(in_features: int,
+                        hidden_size: int,
+                        num_hidden_layers: int,
+                        layer_norm: bool):
+    """Linear layers of the hidden part of an MLP, and the LayerNorm (or
+    identity) applied to the output of each of them.
+    """
+    if num_hidden_layers < 1:
+        raise ValueError("At least one hidden layer is required.")
+    sizes = [in_features] + [hidden_size] * num_hidden_layers
+    layers = nn.ModuleList([nn.Linear(in_features=sizes[i], out_features=sizes[i + 1]) for i in range(num_hidden_layers)])
+    norms = nn.ModuleList([nn.LayerNorm(hidden_size) if layer_norm else nn.Identity() for _ in range(num_hidden_layers)])
+    return layers, norms
+
+def get_activation(activation: str) -> nn.Module:
+    if activation not in ACTIVATIONS:
+        raise ValueError("Unknown activation {}. Available: {}.".format(activation, ", ".join(ACTIVATIONS)))
+    return ACTIVATIONS[activation]()
+
+@MODELS.register
+class MLPCritic(BaseModel):
+    """Critic of ``num_hidden_layers`` fully connected layers of
+    ``hidden_size`` units, each optionally followed by a LayerNorm.
+
+    The first layer is split into a state and an action part, whose outputs
+    are summed by a single ``addmm``. This is the same function as a layer on
+    the concatenated input, without allocating the concatenation at every call.
+    """
+
+    def __init__(self,
+                 observation_type: "spaces.Box",
+                 action_type: "spaces.Box",
+                 hidden_size: int = 256,
+                 num_hidden_layers: int = 2,
+                 activation: str = 'relu',
+                 layer_norm: bool = False):
+
+        super(MLPCritic, self).__init__(observation_type=observation_type,
+                                        action_type=action_type)
+
+        self.__observation_dims = observation_type.shape[0]
+        self.__action_dims = action_type.shape[0]
+
+        self.hidden, self.norms = build_hidden_layers(self.__observation_dims,
+                                                      hidden_size,
+                                                      num_hidden_layers,
+                                                      layer_norm)
+        self.action_input = nn.Linear(out_features=hidden_size, in_features=self.__action_dims, bias=False)
+        self.output = nn.Linear(out_features=1, in_features=hidden_size)
+        self.activation = get_activation(activation)
+        self.init_weights(init_w=3e-3)
+
+    def init_weights(self, init_w):
+        # Fan-in of the first layer covers the state and the action inputs
+        fanin = self.__observation_dims + self.__action_dims
+        self.hidden[0].weight.data = fanin_init(self.hidden[0].weight.data.size(), fanin)
+        self.action_input.weight.data = fanin_init(self.action_input.weight.data.size(), fanin)
+        for layer in self.hidden[1:]:
+            layer.weight.data = fanin_init(layer.weight.data.size())
+        self.output.weight.data.uniform_(-init_w, init_w)
+
+    @property
+    def observation_dims(self):
+        return self.__observation_dims
+
+    @property
+    def action_dims(self):
+        return self.__action_dims
+
+    def forward(self,
+                states: torch.FloatTensor,
+                actions: torch.FloatTensor):
+
+        x = torch.addmm(self.hidden[0](states), actions, self.action_input.weight.t())
+        x = self.activation(self.norms[0](x))
+        for layer, norm in zip(self.hidden[1:], self.norms[1:]):
+            x = self.activation(norm(layer(x)))
+        return self.output(x)
+
+@MODELS.register
+class MLPActor(BaseModel):
+    """Actor of ``num_hidden_layers`` fully connected layers of
+    ``hidden_size`` units, each optionally followed by a LayerNorm, with a
+    tanh output scaled to the action bounds.
+    """
+
+    def __init__(self,
+                 observation_type: "spaces.Box",
+                 action_type: "spaces.Box",
+                 hidden_size: int = 256,
+                 num_hidden_layers: int = 2,
+                 activation: str = 'relu',
+                 layer_norm: bool = False):
+
+        super(MLPActor, self).__init__(observation_type,
+                                       action_type)
+
+        self.__observation_dims = observation_type.shape[0]
+        self.__action_dims = action_type.shape[0]
+        self.__activation_name = activation
+
+        # Action bounds, see SimpleActor
+        action_lower_bound = torch.FloatTensor(action_type.low)
+        self.register_buffer("_action_upper_bound", torch.FloatTensor(action_type.high), persistent=False)
+        if not torch.equal(-action_lower_bound, self._action_upper_bound):
+            raise ValueError("The action bounds must be symmetric.")
+
+        self.hidden, self.norms = build_hidden_layers(self.__observation_dims,
+                                                      hidden_size,
+                                                      num_hidden_layers,
+                                                      layer_norm)
+        self.output = nn.Linear(out_features=self.__action_dims, in_features=hidden_size)
+        self.activation = get_activation(activation)
+        self.tanh = nn.Tanh()
+        self.init_weights(init_w=3e-3)
+
+    def init_weights(self, init_w):
+        for layer in self.hidden:
+            layer.weight.data = fanin_init(layer.weight.data.size())
+        self.output.weight.data.uniform_(-init_w, init_w)
+
+    @property
+    def observation_dims(self):
+        return self.__observation_dims
+
+    @property
+    def action_dims(self):
+        return self.__action_dims
+
+    @property
+    def action_scale(self) -> torch.FloatTensor:
+        return self._action_upper_bound
+
+    def export_layers(self) -> list:
+        """See ``SimpleActor.export_layers``. The LayerNorm of a layer, if
+        any, is applied between the layer and its activation.
+        """
+        layers = []
+        for layer, norm in zip(self.hidden, self.norms):
+            layers.append({'weight': layer.weight.detach().cpu().numpy(),
+                           'bias': layer.bias.detach().cpu().numpy(),
+                           'activation': self.__activation_name})
+            if isinstance(norm, nn.LayerNorm):
+                layers[-1]['norm'] = {'weight': norm.weight.detach().cpu().numpy(),
+                                      'bias': norm.bias.detach().cpu().numpy(),
+                                      'eps': norm.eps}
+        layers.append({'weight': self.output.weight.detach().cpu().numpy(),
+                       'bias': self.output.bias.detach().cpu().numpy(),
+                       'activation': 'tanh'})
+        return layers
+
+    def forward(self,
+                states: torch.FloatTensor):
+
+        x = states.view(-1, self.__observation_dims)
+        for layer, norm in zip(self.hidden, self.norms):
+            x = self.activation(norm(layer(x)))
+        return self.tanh(self.output(x)) * self._action_upper_bound
+
+
+class ConvEncoder(nn.Module):
+    """Convolutional encoder of uint8 frames of shape (height, width, channels).
+
+    The frames are converted to float and scaled to [0, 1] on the device of
+    the encoder, so that they are transferred as uint8. The features are the
+    tanh of a LayerNorm, as in SAC-AE.
+
+    With ``cache_features``, the features computed without gradients are
+    kept until the next call, and returned again when the same input tensor
+    is encoded with unchanged weights. The target of an update encodes the
+    next states once for the target actor and the target critic(s).
+
+    Args:
+        observation_type (Box): Space of the frames.
+        num_filters (int): Channels of every convolution.
+        num_conv_layers (int): Number of 3x3 convolutions, the first with stride 2.
+        feature_dim (int): Dimensions of the features.
+        cache_features (bool): Reuse the features of the last gradient-free call.
+    """
+
+    def __init__(self,
+                 observation_type: "spaces.Box",
+                 num_filters: int = 32,
+                 num_conv_layers: int = 4,
+                 feature_dim: int = 50,
+                 cache_features: bool = True):
+        super(ConvEncoder, self).__init__()
+        height, width, channels = observation_type.shape
+        self.__config = {'num_filters': num_filters,
+                         'num_conv_layers': num_conv_layers,
+                         'feature_dim': feature_dim}
+        self.__cache_features = cache_features
+        self.__cache = None
+
+        self.convs = nn.ModuleList([nn.Conv2d(channels if i == 0 else num_filters,
+                                              num_filters,
+                                              kernel_size=3,
+                                              stride=2 if i == 0 else 1) for i in range(num_conv_layers)])
+        self.activation = nn.ReLU()
+        with torch.no_grad():
+            conv_output = self.__conv(torch.zeros(1, channels, height, width))
+        self.fc = nn.Linear(conv_output.shape[1], feature_dim)
+        self.norm = nn.LayerNorm(feature_dim)
+
+    @property
+    def config(self) -> dict:
+        return dict(self.__config)
+
+    @property
+    def feature_dim(self) -> int:
+        return self.__config['feature_dim']
+
+    def __conv(self, x: torch.FloatTensor) -> torch.FloatTensor:
+        for conv in self.convs:
+            x = self.activation(conv(x))
+        return x.flatten(start_dim=1)
+
+    def __cache_key(self, obs: torch.Tensor):
+        return (obs._version,) + tuple(param._version for param in self.parameters())
+
+    def forward(self, obs: torch.Tensor) -> torch.FloatTensor:
+        use_cache = self.__cache_features and not torch.is_grad_enabled() and not torch.is_inference_mode_enabled()
+        if use_cache and self.__cache is not None:
+            cached_obs, key, features = self.__cache
+            if cached_obs is obs and key == self.__cache_key(obs):
+                return features
+
+        x = obs if obs.dim() == 4 else obs.unsqueeze(0)
+        x = x.permute(0, 3, 1, 2).float() / 255.0
+        features = torch.tanh(self.norm(self.fc(self.__conv(x))))
+
+        if use_cache:
+            # Kept in float32, so that it can be reused with or without autocast
+            features = features.float()
+            self.__cache = (obs, self.__cache_key(obs), features)
+        return features
+
+    def __getstate__(self):
+        # The cached tensors are not part of the module state
+        state = self.__dict__.copy()
+        state['_ConvEncoder__cache'] = None
+        return state
+
+def feature_space(encoder: ConvEncoder) -> "spaces.Box":
+    return spaces.Box(low=-1.0, high=1.0, shape=(encoder.feature_dim,), dtype=np.float32)
+
+@MODELS.register
+class PixelCritic(BaseModel):
+    """MLPCritic on the features of a ConvEncoder, which the critic owns and
+    trains. The encoder is shared with the PixelActor of the agent.
+    """
+
+    def __init__(self,
+                 observation_type: "spaces.Box",
+                 action_type: "spaces.Box",
+                 num_filters: int = 32,
+                 num_conv_layers: int = 4,
+                 feature_dim: int = 50,
+                 cache_features: bool = True,
+                 hidden_size: int = 256,
+                 num_hidden_layers: int = 2,
+                 activation: str = 'relu',
+                 layer_norm: bool = False):
+
+        super(PixelCritic, self).__init__(observation_type=observation_type,
+                                          action_type=action_type)
+        self.encoder = ConvEncoder(observation_type,
+                                   num_filters=num_filters,
+                                   num_conv_layers=num_conv_layers,
+                                   feature_dim=feature_dim,
+                                   cache_features=cache_features)
+        self.head = MLPCritic(feature_space(self.encoder),
+                              action_type,
+                              hidden_size=hidden_size,
+                              num_hidden_layers=num_hidden_layers,
+                              activation=activation,
+                              layer_norm=layer_norm)
+
+    def forward(self,
+                states: torch.Tensor,
+                actions: torch.FloatTensor):
+        return self.head(self.encoder(states), actions)
+
+@MODELS.register
+class PixelActor(BaseModel):
+    """MLPActor on the features of a ConvEncoder.
+
+    In the agents, the actor runs on the encoder of the critic, passed as
+    ``encoder``, and the actor loss does not reach the encoder. On its own
+    (e.g. when loaded for inference) the actor builds an encoder of the
+    same configuration.
+    """
+
+    def __init__(self,
+                 observation_type: "spaces.Box",
+                 action_type: "spaces.Box",
+                 encoder: ConvEncoder = None,
+                 num_filters: int = 32,
+                 num_conv_layers: int = 4,
+                 feature_dim: int = 50,
+                 cache_features: bool = True,
+                 hidden_size: int = 256,
+                 num_hidden_layers: int = 2,
+                 activation: str = 'relu',
+                 layer_norm: bool = False):
+
+        super(PixelActor, self).__init__(observation_type,
+                                         action_type)
+        config = {'num_filters': num_filters,
+                  'num_conv_layers': num_conv_layers,
+                  'feature_dim': feature_dim}
+        if encoder is None:
+            encoder = ConvEncoder(observation_type, cache_features=cache_features, **config)
+        elif encoder.config != config:
+            raise ValueError("Encoder configuration {} of the actor does not match the shared encoder {}.".format(config,
+                                                                                                                 encoder.config))
+        self.encoder = encoder
+        self.head = MLPActor(feature_space(self.encoder),
+                             action_type,
+                             hidden_size=hidden_size,
+                             num_hidden_layers=num_hidden_layers,
+                             activation=activation,
+                             layer_norm=layer_norm)
+
+    @property
+    def action_scale(self) -> torch.FloatTensor:
+        return self.head.action_scale
+
+    # The agents pass the encoder of the critic
+    shares_critic_encoder = True
+
+    def trainable_parameters(self):
+        return self.head.parameters()
+
+    def forward(self,
+                states: torch.Tensor):
+        with torch.no_grad():
+            features = self.encoder(states)
+        return self.head(features)
+
+
 
 if __name__ == "__main__":
 
@@ -113,23 +479,34 @@ if __name__ == "__main__":
     device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
     print("Testing with {} device".format(device))
 
+    observation_type = spaces.Box(low=-1.0, high=1.0, shape=(obs_dims,), dtype=np.float32)
+    action_type = spaces.Box(low=-2.0, high=2.0, shape=(action_dims,), dtype=np.float32)
     random_obs = torch.rand(200, obs_dims).to(device)
     random_act = torch.rand(200, action_dims).to(device)
-    
 
     # Test Critic
-    critic = SimpleCritic(observation_dims=obs_dims,
-                          action_dims=action_dims,
-                          hidden_size=hidden_size,
-                          activation='relu').to(device)
+    critic = SimpleCritic(observation_type=observation_type,
+                          action_type=action_type,
+                          hidden_size=hidden_size).to(device)
+    out = critic(random_obs, random_act)
 
+    critic = MLPCritic(observation_type=observation_type,
+                       action_type=action_type,
+                       hidden_size=hidden_size,
+                       num_hidden_layers=3,
+                       layer_norm=True).to(device)
     out = critic(random_obs, random_act)
-    
 
     # Test actor
-    actor = SimpleActor(observation_dims=obs_dims,
-                        action_dims=action_dims,
-                        hidden_size=hidden_size,
-                        activation='tanh').to(device)
+    actor = SimpleActor(observation_type=observation_type,
+                        action_type=action_type,
+                        hidden_size=hidden_size).to(device)
     out = actor(random_obs)
 
+    actor = MLPActor(observation_type=observation_type,
+                     action_type=action_type,
+                     hidden_size=hidden_size,
+                     activation='elu',
+                     layer_norm=True).to(device)
+    out = actor(random_obs)
+    print(out.shape, out.abs().max().item() <= 2.0)
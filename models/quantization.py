@@ -0,0 +1,88 @@
+import copy
+import torch
+import warnings
+import torch.nn as nn
+from typing import Optional
+
+def quantize_actor(actor: nn.Module,
+                   inplace: bool = False) -> nn.Module:
+    """CPU copy of the actor with its ``nn.Linear`` layers dynamically quantized
+    to int8. The activations are quantized on the fly, so no calibration data
+    is needed. With ``inplace``, the actor itself is moved and quantized.
+    """
+    if not inplace:
+        actor = copy.deepcopy(actor)
+    actor = actor.cpu().eval()
+    with warnings.catch_warnings():
+        # The eager mode quantization API is marked as deprecated in recent torch versions
+        warnings.simplefilter("ignore", UserWarning)
+        warnings.simplefilter("ignore", DeprecationWarning)
+        return torch.ao.quantization.quantize_dynamic(actor, {nn.Linear}, dtype=torch.qint8, inplace=True)
+
+class QuantizedActor:
+    """Keeps an int8 copy of an actor for batch-1 inference on CPU.
+
+    The copy is refreshed from the float32 weights every ``sync_interval``
+    update phases of the actor, or at the end of every episode by default.
+    A refresh copies and quantizes the whole actor, which costs more than
+    a few batch-1 forward passes, so refreshing after every update can
+    cost more than the quantized inference saves.
+
+    Args:
+        actor (nn.Module): Float32 actor trained by the agent.
+        sync_interval (int): Number of update phases between two refreshes,
+            or None to refresh at the end of every episode.
+    """
+
+    def __init__(self,
+                 actor: nn.Module,
+                 sync_interval: Optional[int] = None):
+        if sync_interval is not None and sync_interval < 1:
+            raise ValueError("sync_interval must be >= 1.")
+        self.__actor = actor
+        self.__sync_interval = sync_interval
+        self.__num_updates = 0
+        self.refresh()
+
+    @property
+    def module(self) -> nn.Module:
+        return self.__module
+
+    def refresh(self):
+        self.__refresh()
+
+    def __refresh(self, source_state: Optional[dict] = None):
+        source = copy.deepcopy(self.__actor).cpu()
+        if source_state is not None:
+            source.load_state_dict(source_state)
+        # The float32 weights of the copy, saved in the training snapshots.
+        # Quantizing replaces the layers of the copy, not these tensors.
+        self.__source_state = source.state_dict()
+        self.__module = quantize_actor(source, inplace=True)
+
+    def state_dict(self) -> dict:
+        """Update counter and float32 weights the copy was quantized from, so
+        that a resumed run acts with the same copy until its next refresh.
+        """
+        return {'num_updates': self.__num_updates,
+                'source': self.__source_state}
+
+    def load_state_dict(self, state: dict):
+        self.__num_updates = state['num_updates']
+        self.__refresh(state['source'])
+
+    def step(self):
+        """Counts an update phase of the actor, refreshing the copy when due.
+        """
+        self.__num_updates += 1
+        if self.__sync_interval is not None and self.__num_updates % self.__sync_interval == 0:
+            self.refresh()
+
+    def end_episode(self):
+        """Refreshes the copy at the end of an episode, without ``sync_interval``.
+        """
+        if self.__sync_interval is None:
+            self.refresh()
+
+    def __call__(self, states: torch.FloatTensor) -> torch.FloatTensor:
+        return self.__module(states.cpu())
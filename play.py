@@ -1,33 +1,15 @@
-import torch
 import argparse
-from agents.ddpg import DDPG, DDPG_DEFAULT_PARAMS
-from agents.td3 import TD3, TD3_DEFAULT_PARAMS
+from agents.policy import Policy
 
 if __name__ == "__main__":
-    
+
     parser = argparse.ArgumentParser()
     parser.add_argument("--checkpoint", type=str, required=True, help="Checkpoint to load.")
+    parser.add_argument("--num-episodes", type=int, default=10, help="Number of episodes to play.")
+    parser.add_argument("--no-render", action="store_true", help="Do not render the environment.")
+    parser.add_argument("--quantize", action="store_true", help="Run an int8 quantized actor.")
     args = parser.parse_args()
 
-    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-    state = torch.load(args.checkpoint, map_location=device)
-    algo = state["algo"]
-    hyperparams = state['hyper_params']
-    
-    if algo == "DDPG":
-        
-        hyperparams['enable_wandb_logging'] = False
-        hyperparams['render'] = True
-        agent = DDPG(**hyperparams)
-        agent.load_checkpoint(args.checkpoint)
-        agent.learn_evaluate_callback(num_episodes=10, render=True)
-
-    elif algo == "TD3":
-        hyperparams['enable_wandb_logging'] = False
-        hyperparams['render'] = True
-        agent = TD3(**hyperparams)
-        agent.load_checkpoint(args.checkpoint)
-        agent.learn_evaluate_callback(num_episodes=10, render=True)
-        
-    else:
-        raise NotImplementedError()
+    # Only the actor is built, the training agent is not needed to play.
+    policy = Policy.load(args.checkpoint, quantize=args.quantize)
+    policy.play(num_episodes=args.num_episodes, render=not args.no_render)
@@ -0,0 +1,138 @@
+import os
+import json
+import argparse
+import threading
+import socketserver
+import numpy as np
+from collections import namedtuple
+
+from buffers.replay import ReplayBuffer
+from utils.policy_client import send_frame, STATUS_OK, STATUS_ERROR
+from utils.replay_client import (recv_message_frame, encode_message, decode_message,
+                                 SUBSCRIBE, INSERT, SAMPLE, INFO, TABLES)
+
+class ReplayTable:
+    """Named replay of the server, shared by the learners subscribed to it.
+    """
+
+    def __init__(self, maxsize: int):
+        self.replay = ReplayBuffer(maxsize=maxsize)
+        self.lock = threading.Lock()
+        self.row_type = None
+
+    def info(self) -> dict:
+        return {'maxsize': self.replay.maxsize,
+                'size': self.replay.replay_size,
+                'index': self.replay.index,
+                'num_added': self.replay.num_added}
+
+    def insert(self, arrays: dict):
+        with self.lock:
+            if self.row_type is None:
+                self.row_type = namedtuple('Row', list(arrays))
+            elif list(arrays) != list(self.row_type._fields):
+                raise ValueError("Fields {} do not match the table fields {}.".format(list(arrays), list(self.row_type._fields)))
+            columns = self.replay.columns
+            if columns is not None:
+                for field, values in arrays.items():
+                    if values.shape[1:] != columns[field].shape[1:]:
+                        raise ValueError("Shape {} of {} does not match the table shape {}.".format(values.shape[1:], field, columns[field].shape[1:]))
+            self.replay.add_batch(self.row_type(**arrays))
+
+    def sample(self, batch_size: int, seed: int) -> dict:
+        with self.lock:
+            batch_size = min(batch_size, self.replay.replay_size)
+            if batch_size == 0:
+                return {}
+            rows = np.random.default_rng(seed).integers(0, self.replay.replay_size, size=batch_size)
+            return {field: column[rows] for field, column in self.replay.columns.items()}
+
+class ReplayServer:
+    """Holds the replay tables, keyed by name.
+    """
+
+    def __init__(self):
+        self.__tables = {}
+        self.__lock = threading.Lock()
+
+    def table(self, name: str) -> ReplayTable:
+        table = self.__tables.get(name)
+        if table is None:
+            raise KeyError("Unknown table {}.".format(name))
+        return table
+
+    def subscribe(self, name: str, maxsize: int) -> dict:
+        """Creates a table, or returns the one of the same name.
+        """
+        with self.__lock:
+            if name not in self.__tables:
+                self.__tables[name] = ReplayTable(maxsize)
+            table = self.__tables[name]
+        if table.replay.maxsize != maxsize:
+            raise ValueError("Table {} has {} rows, not {}.".format(name, table.replay.maxsize, maxsize))
+        return table.info()
+
+    def tables(self) -> dict:
+        with self.__lock:
+            return {name: table.info() for name, table in self.__tables.items()}
+
+    def handle(self, kind: int, payload: bytearray) -> bytes:
+        header, arrays = decode_message(payload)
+        if kind == SUBSCRIBE:
+            return encode_message(self.subscribe(header['table'], header['maxsize']))
+        elif kind == INSERT:
+            table = self.table(header['table'])
+            table.insert(arrays)
+            return encode_message({})
+        elif kind == SAMPLE:
+            batch = self.table(header['table']).sample(header['batch_size'], header['seed'])
+            num_samples = len(next(iter(batch.values()))) if batch else 0
+            return encode_message({'num_samples': num_samples}, batch)
+        elif kind == INFO:
+            return encode_message(self.table(header['table']).info())
+        elif kind == TABLES:
+            return encode_message(self.tables())
+        raise ValueError("Unknown request kind {}.".format(kind))
+
+def make_handler(server: ReplayServer):
+
+    class Handler(socketserver.BaseRequestHandler):
+
+        def handle(self):
+            while True:
+                try:
+                    kind, payload = recv_message_frame(self.request)
+                except ConnectionError:
+                    return
+                try:
+                    send_frame(self.request, STATUS_OK, server.handle(kind, payload))
+                except Exception as error:
+                    send_frame(self.request, STATUS_ERROR, str(error).encode("utf-8"))
+
+    return Handler
+
+class ThreadingUnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--socket", type=str, required=True, help="Unix socket to listen on.")
+    args = parser.parse_args()
+
+    if os.path.exists(args.socket):
+        os.remove(args.socket)
+    replay_server = ReplayServer()
+    server = ThreadingUnixServer(args.socket, make_handler(replay_server))
+
+    print("Serving replay tables on {}".format(args.socket))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+        print(json.dumps(replay_server.tables(), indent=2))
@@ -0,0 +1,222 @@
+import os
+import json
+import time
+import queue
+import torch
+import argparse
+import threading
+import socketserver
+import numpy as np
+from collections import deque
+from typing import Optional
+
+from agents.policy import Policy
+from utils.policy_client import (recv_frame, send_frame, ACT, STATS, RELOAD,
+                                 STATUS_OK, STATUS_ERROR)
+
+class PendingRequest:
+    """Observation waiting for its batch, and the slot of its result.
+    """
+
+    def __init__(self, observation: np.array):
+        self.observation = observation
+        self.arrival = time.perf_counter()
+        self.action = None
+        self.error = None
+        self.done = threading.Event()
+
+class PolicyServer:
+    """Serves the actions of a policy to concurrent clients.
+
+    Requests are queued by the connection threads and grouped by a single
+    batching thread: the first request opens a batch, which is run as one
+    forward pass once ``max_batch_size`` observations are waiting or
+    ``max_wait_ms`` have passed. Checkpoints are hot-swapped by building the
+    new policy aside and replacing the reference between two batches.
+
+    Any client may request a reload, so the checkpoints are loaded without
+    unpickling arbitrary objects, and reloads are restricted to the files of
+    ``checkpoint_dir``.
+
+    Args:
+        checkpoint (str): Checkpoint of the policy.
+        max_batch_size (int): Maximum number of observations per forward pass.
+        max_wait_ms (float): Maximum time the first request of a batch waits for others.
+        quantize (bool): Serve an int8 quantized actor.
+        checkpoint_dir (str): Directory of the checkpoints which can be
+            reloaded, the directory of ``checkpoint`` if not given.
+    """
+
+    def __init__(self,
+                 checkpoint: str,
+                 max_batch_size: int = 64,
+                 max_wait_ms: float = 1.0,
+                 quantize: bool = False,
+                 checkpoint_dir: Optional[str] = None):
+        self.__max_batch_size = max_batch_size
+        self.__max_wait = max_wait_ms / 1000
+        self.__quantize = quantize
+        if checkpoint_dir is None:
+            checkpoint_dir = os.path.dirname(os.path.abspath(checkpoint))
+        self.__checkpoint_dir = os.path.realpath(checkpoint_dir)
+        self.__policy = Policy.load(checkpoint, quantize=quantize, weights_only=True)
+        self.__checkpoint = checkpoint
+        self.__queue = queue.Queue()
+        self.__latencies = deque(maxlen=10000)
+        self.__batch_sizes = deque(maxlen=10000)
+        self.__reload_lock = threading.Lock()
+        self.__batcher = threading.Thread(target=self.__batch_loop, daemon=True)
+        self.__batcher.start()
+
+    @property
+    def observation_shape(self) -> tuple:
+        return self.__policy.observation_low.shape
+
+    def __next_batch(self):
+        batch = [self.__queue.get()]
+        deadline = batch[0].arrival + self.__max_wait
+        while len(batch) < self.__max_batch_size:
+            timeout = deadline - time.perf_counter()
+            try:
+                batch.append(self.__queue.get(timeout=timeout) if timeout > 0 else self.__queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def __batch_loop(self):
+        while True:
+            batch = self.__next_batch()
+            policy = self.__policy
+            try:
+                actions = policy(np.concatenate([request.observation for request in batch]))
+                start = 0
+                for request in batch:
+                    request.action = actions[start:start + len(request.observation)]
+                    start += len(request.observation)
+            except Exception as error:
+                for request in batch:
+                    request.error = error
+            self.__batch_sizes.append(len(batch))
+            for request in batch:
+                request.done.set()
+
+    def act(self, observation: np.array) -> np.array:
+        """Blocks until the actions of the observations are computed.
+        """
+        request = PendingRequest(observation.reshape((-1,) + self.observation_shape))
+        self.__queue.put(request)
+        request.done.wait()
+        self.__latencies.append(time.perf_counter() - request.arrival)
+        if request.error is not None:
+            raise request.error
+        return request.action
+
+    def reload(self, checkpoint: str) -> dict:
+        """Swaps to another checkpoint, without interrupting the requests.
+        ``checkpoint`` is a path inside the checkpoint directory, relative
+        to it or absolute.
+        """
+        path = os.path.realpath(os.path.join(self.__checkpoint_dir, checkpoint))
+        if os.path.commonpath([path, self.__checkpoint_dir]) != self.__checkpoint_dir:
+            raise ValueError("Only the checkpoints of {} can be reloaded.".format(self.__checkpoint_dir))
+        with self.__reload_lock:
+            policy = Policy.load(path, quantize=self.__quantize, weights_only=True)
+            if policy.observation_low.shape != self.__policy.observation_low.shape:
+                raise ValueError("Observation dimensions of {} do not match.".format(checkpoint))
+            self.__policy = policy
+            self.__checkpoint = checkpoint
+        return {"checkpoint": checkpoint}
+
+    def stats(self) -> dict:
+        """Latency percentiles (microseconds) and batch sizes of the recent requests.
+        """
+        latencies = np.array(self.__latencies) * 1e6
+        batch_sizes = np.array(self.__batch_sizes)
+        stats = {"checkpoint": self.__checkpoint,
+                 "requests": int(len(latencies)),
+                 "mean_batch_size": float(batch_sizes.mean()) if len(batch_sizes) else 0.0}
+        if len(latencies):
+            for q in [50, 90, 99]:
+                stats["p{}_us".format(q)] = float(np.percentile(latencies, q))
+        return stats
+
+    def handle(self, kind: int, payload: bytes) -> bytes:
+        if kind == ACT:
+            observation = np.frombuffer(payload, dtype="<f4")
+            observation_size = int(np.prod(self.observation_shape))
+            if len(observation) == 0 or len(observation) % observation_size != 0:
+                raise ValueError("Expected a multiple of {} observation values, got {}.".format(observation_size,
+                                                                                                len(observation)))
+            return self.act(observation).astype("<f4").tobytes()
+        elif kind == STATS:
+            return json.dumps(self.stats()).encode("utf-8")
+        elif kind == RELOAD:
+            return json.dumps(self.reload(payload.decode("utf-8"))).encode("utf-8")
+        raise ValueError("Unknown request kind {}.".format(kind))
+
+def make_handler(server: PolicyServer):
+
+    class Handler(socketserver.BaseRequestHandler):
+
+        def handle(self):
+            while True:
+                try:
+                    kind, payload = recv_frame(self.request)
+                except ConnectionError:
+                    return
+                try:
+                    send_frame(self.request, STATUS_OK, server.handle(kind, payload))
+                except Exception as error:
+                    send_frame(self.request, STATUS_ERROR, str(error).encode("utf-8"))
+
+    return Handler
+
+class ThreadingUnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+class ThreadingTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--checkpoint", type=str, required=True, help="Checkpoint to serve.")
+    parser.add_argument("--socket", type=str, default=None, help="Unix socket to listen on.")
+    parser.add_argument("--port", type=int, default=None, help="Localhost TCP port to listen on, used when no socket is given.")
+    parser.add_argument("--max-batch-size", type=int, default=64, help="Maximum observations per forward pass.")
+    parser.add_argument("--max-wait-ms", type=float, default=1.0, help="Maximum wait of a request for its batch.")
+    parser.add_argument("--threads", type=int, default=1, help="Torch intra-op threads.")
+    parser.add_argument("--quantize", action="store_true", help="Serve an int8 quantized actor.")
+    parser.add_argument("--checkpoint-dir", type=str, default=None,
+                        help="Directory of the checkpoints which can be reloaded, that of --checkpoint by default.")
+    args = parser.parse_args()
+
+    torch.set_num_threads(args.threads)
+    policy_server = PolicyServer(args.checkpoint,
+                                 max_batch_size=args.max_batch_size,
+                                 max_wait_ms=args.max_wait_ms,
+                                 quantize=args.quantize,
+                                 checkpoint_dir=args.checkpoint_dir)
+
+    if args.socket is not None:
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+        server = ThreadingUnixServer(args.socket, make_handler(policy_server))
+        address = args.socket
+    elif args.port is not None:
+        server = ThreadingTCPServer(("127.0.0.1", args.port), make_handler(policy_server))
+        address = "127.0.0.1:{}".format(args.port)
+    else:
+        raise ValueError("Either --socket or --port is required.")
+
+    print("Serving {} on {}".format(args.checkpoint, address))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.socket is not None and os.path.exists(args.socket):
+            os.remove(args.socket)
@@ -0,0 +1,60 @@
+import pytest
+import numpy as np
+from gymnasium.spaces import Box
+from agents.policy import Policy
+from models.models import SimpleActor, MLPActor
+from utils.numpy_policy import NumpyPolicy
+from export import export_npz, export_onnx, check_parity, sample_observations
+
+OBSERVATION_SPACE = Box(low=np.array([-1.0, -1.0, -8.0], dtype=np.float32),
+                        high=np.array([1.0, 1.0, 8.0], dtype=np.float32))
+ACTION_SPACE = Box(low=np.array([-2.0], dtype=np.float32),
+                   high=np.array([2.0], dtype=np.float32))
+
+ACTORS = {
+    'simple': lambda: SimpleActor(observation_type=OBSERVATION_SPACE, action_type=ACTION_SPACE, hidden_size=64),
+    'mlp_layer_norm': lambda: MLPActor(observation_type=OBSERVATION_SPACE, action_type=ACTION_SPACE, hidden_size=64,
+                                       num_hidden_layers=3, activation='elu', layer_norm=True),
+}
+
+def make_policy(actor_name: str,
+                normalize_observations: bool) -> Policy:
+    return Policy(actor=ACTORS[actor_name](),
+                  env_id="Pendulum-v1",
+                  observation_low=OBSERVATION_SPACE.low,
+                  observation_high=OBSERVATION_SPACE.high,
+                  normalize_observations=normalize_observations)
+
+@pytest.mark.parametrize("actor_name", list(ACTORS))
+@pytest.mark.parametrize("normalize_observations", [False, True])
+def test_npz_parity(actor_name, normalize_observations, tmp_path):
+    policy = make_policy(actor_name, normalize_observations)
+    npz_path = str(tmp_path / "actor.npz")
+    export_npz(policy, npz_path)
+    check_parity(policy, npz_path=npz_path)
+
+    # A single observation gives a batch of one action
+    obs = sample_observations(policy, 1)[0]
+    assert NumpyPolicy(npz_path)(obs).shape == (1, ACTION_SPACE.shape[0])
+
+def test_npz_parity_detects_a_mismatch(tmp_path):
+    policy = make_policy('simple', normalize_observations=False)
+    npz_path = str(tmp_path / "actor.npz")
+    export_npz(policy, npz_path)
+    with np.load(npz_path) as archive:
+        arrays = dict(archive)
+    output_bias = 'layer_{}_bias'.format(len(arrays['activations']) - 1)
+    arrays[output_bias] = arrays[output_bias] + 1e-2
+    np.savez(npz_path, **arrays)
+    with pytest.raises(AssertionError):
+        check_parity(policy, npz_path=npz_path)
+
+@pytest.mark.parametrize("actor_name", list(ACTORS))
+@pytest.mark.parametrize("normalize_observations", [False, True])
+def test_onnx_parity(actor_name, normalize_observations, tmp_path):
+    pytest.importorskip("onnx")
+    pytest.importorskip("onnxruntime")
+    policy = make_policy(actor_name, normalize_observations)
+    onnx_path = str(tmp_path / "actor.onnx")
+    export_onnx(policy, onnx_path)
+    check_parity(policy, onnx_path=onnx_path)
@@ -0,0 +1,52 @@
+import pytest
+import torch
+from agents.ddpg import DDPG
+from agents.td3 import TD3
+from hyperparams.params import PARAMS
+
+AGENTS = {'DDPG': DDPG, 'TD3': TD3}
+
+def run(agent_name: str,
+        directory,
+        monkeypatch,
+        num_training_episodes: int,
+        resume: str = None,
+        **options):
+    """Learns Pendulum for a few episodes, with the checkpoints and the
+    snapshots written below ``directory``.
+    """
+    params = dict(PARAMS['Pendulum-v1'][agent_name])
+    params.update(enable_wandb_logging=False,
+                  num_training_episodes=num_training_episodes,
+                  warm_up_iters=300,
+                  evaluation_freq_episodes=2,
+                  num_test_episodes=1,
+                  snapshot_freq_episodes=2,
+                  **options)
+    directory.mkdir()
+    monkeypatch.chdir(directory)
+    agent = AGENTS[agent_name](**params)
+    agent.learn(resume=resume)
+    return agent
+
+@pytest.mark.parametrize("agent_name, options", [
+    ('DDPG', {'prefetch_depth': 0}),
+    ('DDPG', {'prefetch_depth': 2}),
+    ('DDPG', {'quantized_inference': True}),
+    ('DDPG', {'quantized_inference': True, 'quantize_sync_interval': 7}),
+    ('DDPG', {'shared_replay': True}),
+    ('TD3', {}),
+])
+def test_resume_matches_uninterrupted_run(agent_name, options, tmp_path, monkeypatch):
+    uninterrupted = run(agent_name, tmp_path / "uninterrupted", monkeypatch, 4, **options)
+    interrupted = run(agent_name, tmp_path / "interrupted", monkeypatch, 2, **options)
+    resumed = run(agent_name, tmp_path / "resumed", monkeypatch, 4,
+                  resume=str(tmp_path / "interrupted" / interrupted.snapshot_dir), **options)
+
+    assert resumed.replay.num_added == uninterrupted.replay.num_added
+    assert resumed.max_mean_test_reward == uninterrupted.max_mean_test_reward
+    expected = uninterrupted.training_state()
+    state = resumed.training_state()
+    for name in ['actor', 'actor_target']:
+        for key, value in expected[name].items():
+            assert torch.equal(state[name][key], value), "{}.{} differs".format(name, key)
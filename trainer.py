@@ -1,84 +1,52 @@
-import torch
-import optuna
 import argparse
-import importlib
-from optuna.samplers import TPESampler
-from optuna.pruners import MedianPruner
-
-from agents.ddpg import DDPG, DDPG_DEFAULT_PARAMS, sample_ddpg_params
-from agents.td3 import TD3, TD3_DEFAULT_PARAMS
-from agents.base import BASE_AGENT_DEFAULT_PARAMS
 
 from hyperparams.params import PARAMS
 
-from utils.optuna_callbacks import TrialEvaluationCallback
-
-                
-def objective(op_trial: optuna.Trial):
-
-    kawags = DDPG_DEFAULT_PARAMS.copy()
-    
-    # Sample Hyper-parameters for the trial
-    kawags.update(sample_ddpg_params(op_trial))
-
-
-    # Create the DDPG learning and start training
-    agent = DDPG(**kawags)
-    
-    # Create a callback function
-    eval_callback = TrialEvaluationCallback(op_trial)
-
-    # Start Learning
-    agent.learn(eval_callback=eval_callback)
-
-    return eval_callback.last_mean_reward
-
-
 
 if __name__ == "__main__":
     
     parser = argparse.ArgumentParser()
     parser.add_argument("--env-id", type=str, required=True, help="Environment ID")
     parser.add_argument("--algo", type=str, required=True, choices=["DDPG", "TD3"], help="Algorithm to use for training.")
+    parser.add_argument("--num-learners", type=int, default=1, help="Number of data parallel learner processes.")
+    parser.add_argument("--num-seeds", type=int, default=1, help="Number of seeds trained together in a single process.")
+    parser.add_argument("--resume", type=str, default=None, help="Snapshot directory of a previous run to resume from.")
     args = parser.parse_args()
-
-    tune = False
-
-    if tune:
-
-        N_STARTUP_TRIALS = 5
-        N_EVALUATIONS = 2
-        N_TRIALS = 30
-        TIMEOUT_MINS = 15
-
-        # Set pytorch num threads to 1 for faster training.
-        torch.set_num_threads(1)
-
-        # Intialize sampling and pruning algorithms 
-        sampler = TPESampler(n_startup_trials=N_STARTUP_TRIALS)
-        pruner = MedianPruner(n_startup_trials=N_STARTUP_TRIALS, n_warmup_steps=N_EVALUATIONS)
-
-        # Create a study
-        study = optuna.create_study(sampler=sampler, pruner=pruner, direction="maximize")
-        study.optimize(objective, n_trials=N_TRIALS, timeout=TIMEOUT_MINS*60)
+    if args.resume is not None and args.num_learners > 1:
+        parser.error("--resume is not supported with --num-learners > 1")
+    if args.num_seeds > 1 and args.num_learners > 1:
+        parser.error("--num-seeds > 1 is not supported with --num-learners > 1")
+    if args.resume is not None and args.num_seeds > 1:
+        parser.error("--resume is not supported with --num-seeds > 1")
+
+    # The agents pull in torch, so they are imported once the arguments are valid.
+    if args.algo == "DDPG":
+        from agents.ddpg import DDPG as Agent, DDPG_DEFAULT_PARAMS as DEFAULT_PARAMS
+    elif args.algo == "TD3":
+        from agents.td3 import TD3 as Agent, TD3_DEFAULT_PARAMS as DEFAULT_PARAMS
+
+    if args.env_id in PARAMS and args.algo in PARAMS[args.env_id].keys():
+        PARAM_DICT = PARAMS[args.env_id][args.algo]
+        
+    else:
+        print("Existing Hyperparams for {} for {} not found. Using default values.".format(args.env_id,
+                                                                                           args.algo))
+        PARAM_DICT = DEFAULT_PARAMS
     
+    if args.num_learners > 1:
+        from agents.distributed import launch_data_parallel
+        launch_data_parallel(args.algo, PARAM_DICT, world_size=args.num_learners)
+
+    elif args.num_seeds > 1:
+        from agents.multi_seed import MultiSeedDDPG, MultiSeedTD3
+        MultiSeed = MultiSeedDDPG if args.algo == "DDPG" else MultiSeedTD3
+        seeds = [PARAM_DICT['seed'] + i for i in range(args.num_seeds)]
+        results = MultiSeed(PARAM_DICT, seeds).learn()
+        for seed in results:
+            print("Seed: {}, Best Mean Test Reward: {:.2f}".format(seed, results[seed]))
+
     else:
+        agent = Agent(**PARAM_DICT)
 
-        if args.env_id in PARAMS and args.algo in PARAMS[args.env_id].keys():
-            PARAM_DICT = PARAMS[args.env_id][args.algo]
-            
-        else:
-            print("Existing Hyperparams for {} for {} not found. Using default values.".format(args.env_id,
-                                                                                               args.algo))
-            if args.algo == "DDPG":
-                PARAM_DICT = DDPG_DEFAULT_PARAMS
-            elif args.algo == "TD3":    
-                PARAM_DICT = TD3_DEFAULT_PARAMS
-        
-        if args.algo == "DDPG":
-            agent = DDPG(**PARAM_DICT)
-        elif args.algo == "TD3":
-            agent = TD3(**PARAM_DICT)
-        
         # Start learning
-        agent.learn()
+        agent.learn(resume=args.resume)
@@ -0,0 +1,197 @@
+import os
+import optuna
+import argparse
+import functools
+from typing import List, Optional
+import multiprocessing as mp
+from optuna.samplers import TPESampler
+from optuna.pruners import MedianPruner, HyperbandPruner, SuccessiveHalvingPruner
+from optuna.study import MaxTrialsCallback
+from optuna.trial import TrialState
+from optuna.storages import RDBStorage, JournalStorage, RetryFailedTrialCallback
+try:
+    from optuna.storages.journal import JournalFileBackend
+except ImportError:
+    from optuna.storages import JournalFileStorage as JournalFileBackend
+
+from agents.ddpg import DDPG, DDPG_DEFAULT_PARAMS, sample_ddpg_params
+from hyperparams.params import PARAMS
+from utils.optuna_callbacks import TrialEvaluationCallback
+
+
+def get_storage(storage: str):
+    """Creates the study storage from its url.
+
+    Args:
+        storage (str): Either an ``sqlite:///`` url or the path of a journal file.
+    """
+    if storage.startswith("sqlite:///"):
+        # Trials of crashed workers are marked as failed and retried once the heartbeat expires.
+        return RDBStorage(url=storage,
+                          engine_kwargs={"connect_args": {"timeout": 60}},
+                          heartbeat_interval=60,
+                          grace_period=180,
+                          failed_trial_callback=RetryFailedTrialCallback(max_retry=1))
+    return JournalStorage(JournalFileBackend(storage))
+
+def to_decisions(env_steps: int,
+                 action_repeat: int) -> int:
+    """Steps of ``learn`` covering ``env_steps`` environment steps. With action
+    repeat, ``learn`` counts decisions of ``action_repeat`` environment steps.
+    """
+    return -(-env_steps // action_repeat)
+
+def get_pruner(args: argparse.Namespace,
+               action_repeat: int = 1):
+    """Creates the pruner. The multi-fidelity pruners use the steps of ``learn``
+    as resource, the environment steps of the arguments divided by ``action_repeat``.
+    """
+    if args.pruner == "hyperband":
+        return HyperbandPruner(min_resource=to_decisions(args.min_steps, action_repeat),
+                               max_resource=to_decisions(args.max_steps, action_repeat),
+                               reduction_factor=args.reduction_factor)
+    elif args.pruner == "sha":
+        return SuccessiveHalvingPruner(min_resource=to_decisions(args.min_steps, action_repeat),
+                                       reduction_factor=args.reduction_factor)
+    return MedianPruner(n_startup_trials=args.n_startup_trials, n_warmup_steps=args.n_warmup_evaluations)
+
+def available_cores() -> List[int]:
+    """Cores the process may run on, which under a cgroup or an affinity mask
+    are not necessarily 0 to cpu_count - 1.
+    """
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count()))
+
+def objective(op_trial: optuna.Trial,
+              base_params: dict,
+              study_name: str,
+              thread_policy: dict,
+              max_steps: Optional[int] = None,
+              evaluation_freq_steps: Optional[int] = None):
+
+    kawags = base_params.copy()
+
+    # Sample Hyper-parameters for the trial
+    kawags.update(sample_ddpg_params(op_trial))
+    kawags['enable_wandb_logging'] = False
+    kawags['thread_policy'] = thread_policy
+
+    # Create the DDPG learning and start training
+    agent = DDPG(**kawags)
+    agent._checkpoint_prefix = "checkpoints/tuning/{}/trial_{}/".format(study_name, op_trial.number)
+
+    # Create a callback function
+    eval_callback = TrialEvaluationCallback(op_trial)
+
+    # Start Learning
+    agent.learn(eval_callback=eval_callback,
+                max_steps=max_steps,
+                evaluation_freq_steps=evaluation_freq_steps)
+
+    if eval_callback.is_pruned:
+        raise optuna.TrialPruned()
+
+    return eval_callback.last_mean_reward
+
+def worker(worker_index: int,
+           args: argparse.Namespace,
+           base_params: dict):
+    """Pulls trials from the shared study until the trial budget is used up.
+    """
+    thread_policy = {'inference_threads': 1,
+                     'update_threads': args.threads_per_worker,
+                     'interop_threads': 1}
+    if args.pin_cores:
+        # Each worker owns a disjoint set of cores, checked to fit when parsing the arguments.
+        thread_policy['cpu_affinity'] = available_cores()[worker_index * args.threads_per_worker:
+                                                          (worker_index + 1) * args.threads_per_worker]
+
+    action_repeat = base_params.get('action_repeat', 1)
+    storage = get_storage(args.storage)
+    finished_states = (TrialState.COMPLETE, TrialState.PRUNED)
+    num_trials = len(optuna.load_study(study_name=args.study_name, storage=storage).trials)
+    # Offset the sampler seed, so that resumed sessions do not repeat the same trials.
+    study = optuna.load_study(study_name=args.study_name,
+                              storage=storage,
+                              sampler=TPESampler(n_startup_trials=args.n_startup_trials, seed=base_params['seed'] + worker_index + num_trials),
+                              pruner=get_pruner(args, action_repeat))
+
+    # Step budgeted trials are evaluated on a grid of steps. The arguments
+    # are environment steps, learn counts decisions.
+    max_steps = None
+    evaluation_freq_steps = None
+    if args.pruner in ["hyperband", "sha"]:
+        max_steps = to_decisions(args.max_steps, action_repeat)
+        evaluation_freq_steps = to_decisions(args.evaluation_freq_steps or args.min_steps, action_repeat)
+
+    # The trial budget is counted over all workers and previous sessions of the study.
+    if len(study.get_trials(deepcopy=False, states=finished_states)) >= args.n_trials:
+        return
+    study.optimize(functools.partial(objective,
+                                     base_params=base_params,
+                                     study_name=args.study_name,
+                                     thread_policy=thread_policy,
+                                     max_steps=max_steps,
+                                     evaluation_freq_steps=evaluation_freq_steps),
+                   timeout=args.timeout_mins * 60 if args.timeout_mins else None,
+                   callbacks=[MaxTrialsCallback(args.n_trials, states=finished_states)])
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--env-id", type=str, required=True, help="Environment ID")
+    parser.add_argument("--algo", type=str, default="DDPG", choices=["DDPG"], help="Algorithm to tune.")
+    parser.add_argument("--storage", type=str, default="sqlite:///optuna.db", help="sqlite:/// url or journal file path of the study.")
+    parser.add_argument("--study-name", type=str, default=None, help="Name of the study. Existing studies are resumed.")
+    parser.add_argument("--n-trials", type=int, default=30, help="Total number of finished trials of the study.")
+    parser.add_argument("--n-workers", type=int, default=1, help="Number of worker processes.")
+    parser.add_argument("--threads-per-worker", type=int, default=1, help="Torch threads of every worker.")
+    parser.add_argument("--pin-cores", action="store_true", help="Pin every worker to its own cores.")
+    parser.add_argument("--timeout-mins", type=float, default=None, help="Stop starting new trials after this many minutes.")
+    parser.add_argument("--n-startup-trials", type=int, default=5, help="Trials before the sampler and pruner kick in.")
+    parser.add_argument("--n-warmup-evaluations", type=int, default=2, help="Evaluations of a trial before it can be pruned.")
+    parser.add_argument("--pruner", type=str, default="median", choices=["median", "hyperband", "sha"], help="Pruning algorithm.")
+    parser.add_argument("--min-steps", type=int, default=int(50e3), help="Environment steps of the first rung (hyperband/sha).")
+    parser.add_argument("--max-steps", type=int, default=int(1e6), help="Environment step budget of a trial (hyperband/sha).")
+    parser.add_argument("--reduction-factor", type=int, default=3, help="Reduction factor between rungs (hyperband/sha).")
+    parser.add_argument("--evaluation-freq-steps", type=int, default=None, help="Environment steps between evaluations (hyperband/sha). Defaults to --min-steps.")
+    parser.add_argument("--warm-up-cache-dir", type=str, default=None, help="Share the warm-up transitions of the trials through this cache directory.")
+    args = parser.parse_args()
+    if args.pin_cores and args.n_workers * args.threads_per_worker > len(available_cores()):
+        parser.error("--pin-cores needs {} x {} cores, but only {} are available.".format(args.n_workers,
+                                                                                         args.threads_per_worker,
+                                                                                         len(available_cores())))
+
+    if args.study_name is None:
+        args.study_name = "{}-{}".format(args.algo, args.env_id.replace("/", "_"))
+
+    if args.env_id in PARAMS and args.algo in PARAMS[args.env_id].keys():
+        base_params = PARAMS[args.env_id][args.algo]
+    else:
+        base_params = DDPG_DEFAULT_PARAMS.copy()
+        base_params['env_id'] = args.env_id
+    if args.warm_up_cache_dir is not None:
+        base_params = dict(base_params, warm_up_cache_dir=args.warm_up_cache_dir)
+
+    # Create the study once, the workers load it
+    optuna.create_study(study_name=args.study_name,
+                        storage=get_storage(args.storage),
+                        direction="maximize",
+                        load_if_exists=True)
+
+    if args.n_workers == 1:
+        worker(0, args, base_params)
+    else:
+        processes = [mp.Process(target=worker, args=(i, args, base_params)) for i in range(args.n_workers)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+    study = optuna.load_study(study_name=args.study_name, storage=get_storage(args.storage))
+    print("Best trial: {}".format(study.best_trial.number))
+    print("Best value: {:.2f}".format(study.best_value))
+    for param, value in study.best_params.items():
+        print("  {}: {}".format(param, value))
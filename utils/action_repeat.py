@@ -0,0 +1,26 @@
+import numpy as np
+from typing import Tuple
+
+def step_repeated(env: "gym.Env",
+                  action: np.array,
+                  action_repeat: int,
+                  gamma: float = 1.0) -> Tuple[np.array, float, float, bool, bool, dict, int]:
+    """Applies an action for ``action_repeat`` environment steps, or until the
+    end of the episode.
+
+    Returns:
+        Last observation, sum of the rewards, sum of the rewards discounted
+        by ``gamma`` from the first step, terminated and truncated flags,
+        last info and number of environment steps.
+    """
+    reward_sum = 0.0
+    discounted_reward = 0.0
+    discount = 1.0
+    for num_steps in range(1, action_repeat + 1):
+        observation, reward, terminated, truncated, info = env.step(action)
+        reward_sum += reward
+        discounted_reward += discount * reward
+        discount *= gamma
+        if terminated or truncated:
+            break
+    return observation, reward_sum, discounted_reward, terminated, truncated, info, num_steps
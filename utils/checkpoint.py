@@ -0,0 +1,276 @@
+import os
+import queue
+import torch
+import shutil
+import threading
+import numpy as np
+from typing import Optional, Callable, Any, List, Tuple, Dict, Set
+
+# Rows of every replay column stored per chunk file of a training snapshot.
+REPLAY_CHUNK_ROWS = 1 << 16
+
+def to_cpu(obj: Any) -> Any:
+    """Copies every tensor of a (nested) state dict to CPU memory.
+
+    The copy is detached from the live training state, so that it can be
+    serialized while the networks and optimizers keep being updated.
+    """
+    if isinstance(obj, torch.Tensor):
+        return obj.detach().to("cpu", copy=True)
+    if isinstance(obj, dict):
+        return {key: to_cpu(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(to_cpu(value) for value in obj)
+    return obj
+
+class CheckpointManager:
+    """Writes checkpoints on a background thread with a retention policy.
+
+    ``save`` only snapshots the state to CPU memory and queues it. The writer
+    thread serializes it to a temporary file which is atomically renamed, so
+    that a crash never leaves a partial checkpoint behind, then removes the
+    checkpoints which are neither among the ``keep_top_k`` best scores nor the
+    latest one, and finally hands the file to ``log_artifact_fn``.
+
+    Args:
+        directory (str): Directory of the checkpoints.
+        keep_top_k (int): Number of best scoring checkpoints kept on disk.
+        log_artifact_fn (Callable): Called with the name, path and metadata of
+            every checkpoint saved with ``log_artifact=True``.
+    """
+
+    def __init__(self,
+                 directory: str,
+                 keep_top_k: int = 3,
+                 log_artifact_fn: Optional[Callable[[str, str, dict], None]] = None):
+        if keep_top_k < 1:
+            raise ValueError("keep_top_k must be >= 1.")
+        self.__directory = directory
+        self.__keep_top_k = keep_top_k
+        self.__log_artifact_fn = log_artifact_fn
+        # (score, path) of the checkpoints on disk, in the order they were written
+        self.__checkpoints: List[Tuple[float, str]] = []
+        self.__error = None
+        self.__queue = queue.Queue()
+        self.__thread = threading.Thread(target=self.__writer, daemon=True)
+        self.__thread.start()
+
+    @property
+    def directory(self) -> str:
+        return self.__directory
+
+    @property
+    def checkpoints(self) -> List[str]:
+        """Paths of the checkpoints kept on disk, oldest first.
+        """
+        return [path for _, path in self.__checkpoints]
+
+    def __raise_pending_error(self):
+        if self.__error is not None:
+            error, self.__error = self.__error, None
+            raise RuntimeError("Writing a checkpoint failed.") from error
+
+    def __retain(self):
+        latest = self.__checkpoints[-1]
+        best = sorted(self.__checkpoints, key=lambda checkpoint: checkpoint[0], reverse=True)[:self.__keep_top_k]
+        keep = set(best) | {latest}
+        for checkpoint in self.__checkpoints:
+            if checkpoint not in keep and os.path.exists(checkpoint[1]):
+                os.remove(checkpoint[1])
+        self.__checkpoints = [checkpoint for checkpoint in self.__checkpoints if checkpoint in keep]
+
+    def __write(self,
+                name: str,
+                state: dict,
+                score: float,
+                metadata: dict,
+                log_artifact: bool):
+        os.makedirs(self.__directory, exist_ok=True)
+        path = os.path.join(self.__directory, name)
+        tmp_path = path + ".tmp"
+        torch.save(state, tmp_path)
+        os.replace(tmp_path, path)
+
+        self.__checkpoints = [checkpoint for checkpoint in self.__checkpoints if checkpoint[1] != path]
+        self.__checkpoints.append((score, path))
+        self.__retain()
+
+        if log_artifact and self.__log_artifact_fn is not None:
+            self.__log_artifact_fn(name, path, metadata)
+
+    def __writer(self):
+        while True:
+            item = self.__queue.get()
+            try:
+                if item is None:
+                    return
+                self.__write(*item)
+            except Exception as error:
+                self.__error = error
+            finally:
+                self.__queue.task_done()
+
+    def save(self,
+             name: str,
+             state: dict,
+             score: float,
+             metadata: Optional[dict] = None,
+             log_artifact: bool = False):
+        """Snapshots the state to CPU memory and queues it for writing.
+
+        Args:
+            name (str): File name of the checkpoint in the directory.
+            state (dict): State to save. Tensors are copied before returning.
+            score (float): Score used by the retention policy.
+            metadata (dict): Metadata of the artifact.
+            log_artifact (bool): Hand the checkpoint to ``log_artifact_fn`` once written.
+        """
+        self.__raise_pending_error()
+        self.__queue.put((name, to_cpu(state), score, metadata or {}, log_artifact))
+
+    def flush(self):
+        """Blocks until all the queued checkpoints are written and logged.
+        """
+        self.__queue.join()
+        self.__raise_pending_error()
+
+    def close(self):
+        """Flushes the queue and stops the writer thread.
+        """
+        if self.__thread.is_alive():
+            self.__queue.put(None)
+            self.__thread.join()
+        self.__raise_pending_error()
+
+
+class TrainingSnapshotWriter:
+    """Writes full training snapshots from which learning can be resumed.
+
+    A snapshot is a directory holding ``state.pkt`` (everything but the
+    replay) and the replay columns dumped in chunks of ``chunk_rows`` rows,
+    one ``.npy`` file per column and chunk. Chunks untouched since the
+    previous snapshot are hard linked instead of written again. The snapshot
+    is built in a temporary directory, renamed, and only then published by
+    atomically replacing the ``latest`` pointer file, so a preempted write
+    leaves the previous snapshot intact.
+
+    Args:
+        directory (str): Directory of the snapshots.
+        chunk_rows (int): Rows of every replay chunk file.
+    """
+
+    def __init__(self,
+                 directory: str,
+                 chunk_rows: int = REPLAY_CHUNK_ROWS):
+        self.__directory = directory
+        self.__chunk_rows = chunk_rows
+        self.__previous_replay_state = None
+        self.__previous_snapshot = None
+
+    @property
+    def directory(self) -> str:
+        return self.__directory
+
+    def __dirty_chunks(self,
+                       replay_state: dict) -> Optional[Set[int]]:
+        """Chunks written since the previous snapshot, None if all of them.
+        """
+        previous = self.__previous_replay_state
+        if previous is None or previous['maxsize'] != replay_state['maxsize']:
+            return None
+        num_added = replay_state['num_added'] - previous['num_added']
+        if num_added >= replay_state['maxsize']:
+            return None
+        dirty = set()
+        start = previous['index']
+        while num_added > 0:
+            end = min(start + num_added, replay_state['maxsize'])
+            dirty.update(range(start // self.__chunk_rows, (end - 1) // self.__chunk_rows + 1))
+            num_added -= end - start
+            start = 0
+        return dirty
+
+    def save(self,
+             name: str,
+             state: dict,
+             replay_state: dict,
+             columns: Optional[Dict[str, np.array]]):
+        """Writes a snapshot and publishes it as the latest one.
+
+        Args:
+            name (str): Name of the snapshot directory.
+            state (dict): Training state, saved with ``torch.save``.
+            replay_state (dict): Counters of the replay, see ``ReplayBuffer.state_dict``.
+            columns (dict): Replay columns, only the first ``size`` rows are saved.
+        """
+        snapshot_dir = os.path.join(self.__directory, name)
+        tmp_dir = snapshot_dir + ".tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        shutil.rmtree(snapshot_dir, ignore_errors=True)
+        os.makedirs(os.path.join(tmp_dir, "replay"))
+
+        dirty = self.__dirty_chunks(replay_state)
+        size = replay_state['size']
+        for field, column in (columns or {}).items():
+            for chunk, start in enumerate(range(0, size, self.__chunk_rows)):
+                file_name = os.path.join("replay", "{}_{:05d}.npy".format(field, chunk))
+                path = os.path.join(tmp_dir, file_name)
+                if dirty is not None and chunk not in dirty and self.__previous_snapshot is not None:
+                    previous_path = os.path.join(self.__previous_snapshot, file_name)
+                    if os.path.exists(previous_path):
+                        try:
+                            os.link(previous_path, path)
+                        except OSError:
+                            shutil.copyfile(previous_path, path)
+                        continue
+                np.save(path, column[start:min(start + self.__chunk_rows, size)])
+
+        state = dict(state, replay=dict(replay_state, fields=list(columns or {}), chunk_rows=self.__chunk_rows))
+        torch.save(state, os.path.join(tmp_dir, "state.pkt"))
+        os.replace(tmp_dir, snapshot_dir)
+
+        # Publish the snapshot
+        pointer = os.path.join(self.__directory, "latest")
+        with open(pointer + ".tmp", "w") as f:
+            f.write(name)
+        os.replace(pointer + ".tmp", pointer)
+
+        if self.__previous_snapshot is not None and self.__previous_snapshot != snapshot_dir:
+            shutil.rmtree(self.__previous_snapshot, ignore_errors=True)
+        self.__previous_snapshot = snapshot_dir
+        self.__previous_replay_state = replay_state
+
+def load_training_snapshot(directory: str,
+                           map_location: Optional[torch.device] = None) -> Tuple[dict, Dict[str, np.array]]:
+    """Loads the latest snapshot written by ``TrainingSnapshotWriter``.
+
+    Returns:
+        The training state and the replay columns.
+    """
+    with open(os.path.join(directory, "latest")) as f:
+        snapshot_dir = os.path.join(directory, f.read().strip())
+    state = torch.load(os.path.join(snapshot_dir, "state.pkt"), map_location=map_location, weights_only=False)
+
+    replay_state = state['replay']
+    num_chunks = -(-replay_state['size'] // replay_state['chunk_rows'])
+    columns = {}
+    for field in replay_state['fields']:
+        columns[field] = np.concatenate([np.load(os.path.join(snapshot_dir, "replay", "{}_{:05d}.npy".format(field, chunk)))
+                                         for chunk in range(num_chunks)])
+    return state, columns
+
+
+if __name__ == "__main__":
+
+    import time
+    import tempfile
+
+    model = torch.nn.Linear(256, 256)
+    with tempfile.TemporaryDirectory() as directory:
+        manager = CheckpointManager(directory, keep_top_k=2)
+        start = time.perf_counter()
+        for step, score in enumerate([1.0, 3.0, 2.0, 0.5, 4.0, 0.1]):
+            manager.save("checkpoint_{}.pkt".format(step), {"model": model.state_dict()}, score)
+        print("Queued in {:.2f}ms".format((time.perf_counter() - start) * 1000))
+        manager.close()
+        print(sorted(os.listdir(directory)))
@@ -0,0 +1,167 @@
+import numpy as np
+from typing import Callable, List, Optional, Tuple
+from utils.lazy import make_env
+from buffers.history import ObservationHistory
+from utils.action_repeat import step_repeated
+
+# Two-sided 95% quantile of the normal distribution.
+Z_95 = 1.959963984540054
+
+# Two-sided 95% quantiles of Student's t distribution, from 1 to 30 degrees of freedom.
+T_95 = (12.706204736174698, 4.302652729749464, 3.182446305284263, 2.7764451051977934, 2.570581835636314,
+        2.446911851144969, 2.364624251592785, 2.306004135204166, 2.2621571628540993, 2.2281388519649385,
+        2.200985160082949, 2.1788128296634177, 2.1603686564610127, 2.1447866879169273, 2.131449545559323,
+        2.1199052992210112, 2.1098155778331806, 2.10092204024096, 2.093024054408263, 2.0859634472658364,
+        2.079613844727662, 2.0738730679040147, 2.0686576104190406, 2.0638985616280205, 2.059538552753294,
+        2.055529438642871, 2.0518305164802833, 2.048407141795244, 2.045229642132703, 2.0422724563012373)
+
+def t_quantile_95(df: int) -> float:
+    """Two-sided 95% quantile of Student's t distribution with ``df`` degrees
+    of freedom. Tabulated up to 30, and beyond from the Cornish-Fisher
+    expansion around the normal quantile, accurate to 1e-6 there.
+    """
+    if df < 1:
+        raise ValueError("df must be >= 1.")
+    if df <= len(T_95):
+        return T_95[df - 1]
+    z = Z_95
+    return (z + (z**3 + z) / (4 * df)
+            + (5 * z**5 + 16 * z**3 + 3 * z) / (96 * df**2)
+            + (3 * z**7 + 19 * z**5 + 17 * z**3 - 15 * z) / (384 * df**3)
+            + (79 * z**9 + 776 * z**7 + 1482 * z**5 - 1920 * z**3 - 945 * z) / (92160 * df**4))
+
+def mean_confidence_interval(values: np.array,
+                             z: Optional[float] = None) -> Tuple[float, float, float]:
+    """Mean, standard deviation and half-width of the 95% confidence interval
+    of the mean. The interval uses the Student t quantile of ``len(values) - 1``
+    degrees of freedom, unless another quantile ``z`` is given: with the few
+    episodes of an evaluation, the normal quantile makes it too narrow.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) < 2:
+        return float(values.mean()), 0.0, float("inf")
+    if z is None:
+        z = t_quantile_95(len(values) - 1)
+    std = values.std(ddof=1)
+    return float(values.mean()), float(std), float(z * std / np.sqrt(len(values)))
+
+class BatchedEvaluator:
+    """Runs evaluation episodes on several environments in lockstep, so that
+    the policy is queried once per step for all of them.
+
+    Every episode is reset with its own seed, which makes the results of a
+    seed set independent of the number of environments.
+
+    Args:
+        env_id (str): Environment to evaluate on.
+        num_envs (int): Number of environments stepped together.
+        history_length (int): Number of observations stacked for the policy.
+        action_repeat (int): Environment steps every action is applied for.
+        observation_fn (Callable): Applied to every observation before it is
+            stacked, e.g. the normalization of the agent.
+    """
+
+    def __init__(self,
+                 env_id: str,
+                 num_envs: int = 8,
+                 history_length: int = 1,
+                 action_repeat: int = 1,
+                 observation_fn: Optional[Callable[[np.array], np.array]] = None):
+        self.__envs = [make_env(env_id) for _ in range(num_envs)]
+        self.__histories = [ObservationHistory(history_length) for _ in range(num_envs)]
+        self.__action_repeat = action_repeat
+        self.__observation_fn = observation_fn
+
+    @property
+    def num_envs(self) -> int:
+        return len(self.__envs)
+
+    def __process(self, observation: np.array) -> np.array:
+        if self.__observation_fn is None:
+            return observation
+        return self.__observation_fn(observation)
+
+    def run(self,
+            policy_fn: Callable[[np.array], np.array],
+            seeds: List[int]) -> Tuple[np.array, np.array]:
+        """Runs one episode per seed.
+
+        Args:
+            policy_fn (Callable): Maps a batch of (stacked) observations to a
+                (batch, action_dims) array of actions.
+            seeds (list[int]): Seeds of the episodes.
+
+        Returns:
+            Cumulative reward and length of the episodes, in the order of the seeds.
+        """
+        rewards = np.zeros(len(seeds))
+        lengths = np.zeros(len(seeds), dtype=np.int64)
+        episodes = [None] * self.num_envs
+        observations = [None] * self.num_envs
+        next_episode = 0
+
+        def start(index: int):
+            nonlocal next_episode
+            if next_episode < len(seeds):
+                episodes[index] = next_episode
+                observation, info = self.__envs[index].reset(seed=seeds[next_episode])
+                observations[index] = self.__histories[index].reset(self.__process(observation))
+                next_episode += 1
+            else:
+                episodes[index] = None
+
+        for index in range(self.num_envs):
+            start(index)
+
+        while True:
+            active = [index for index in range(self.num_envs) if episodes[index] is not None]
+            if not active:
+                break
+            actions = policy_fn(np.stack([observations[index] for index in active]))
+            for row, index in enumerate(active):
+                observation, reward, _, terminated, truncated, info, num_steps = step_repeated(self.__envs[index],
+                                                                                              actions[row],
+                                                                                              self.__action_repeat)
+                rewards[episodes[index]] += reward
+                lengths[episodes[index]] += num_steps
+                observations[index] = self.__histories[index].push(self.__process(observation))
+                if terminated or truncated:
+                    start(index)
+
+        return rewards, lengths
+
+    def run_adaptive(self,
+                     policy_fn: Callable[[np.array], np.array],
+                     seeds: List[int],
+                     min_episodes: int,
+                     ci_tolerance: float,
+                     best_mean: float = -float("inf")) -> Tuple[np.array, np.array]:
+        """Runs batches of ``num_envs`` episodes until the mean is known well
+        enough, or is clearly below ``best_mean``.
+
+        After every batch, once ``min_episodes`` episodes are done, stops when
+        the half-width of the 95% confidence interval (Student t, see
+        ``mean_confidence_interval``) is within ``ci_tolerance`` of the
+        absolute mean (at least 1), or when the upper end of the interval is
+        below ``best_mean``. At most one episode per seed is run.
+
+        Returns:
+            Cumulative reward and length of the episodes which were run.
+        """
+        rewards = np.zeros(0)
+        lengths = np.zeros(0, dtype=np.int64)
+        while len(rewards) < len(seeds):
+            batch_seeds = seeds[len(rewards):len(rewards) + self.num_envs]
+            batch_rewards, batch_lengths = self.run(policy_fn, batch_seeds)
+            rewards = np.concatenate([rewards, batch_rewards])
+            lengths = np.concatenate([lengths, batch_lengths])
+
+            if len(rewards) >= min_episodes:
+                mean, std, ci = mean_confidence_interval(rewards)
+                if ci <= ci_tolerance * max(abs(mean), 1.0) or mean + ci < best_mean:
+                    break
+        return rewards, lengths
+
+    def close(self):
+        for env in self.__envs:
+            env.close()
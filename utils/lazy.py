@@ -0,0 +1,51 @@
+import sys
+import types
+import importlib
+
+# Packages registering environments under a namespace of their own. They are
+# imported by ``make_env`` only for the environments of that namespace.
+ENV_NAMESPACES = {
+    'sumo': 'sumo',
+}
+
+class LazyModule(types.ModuleType):
+    """Stands for a module which is imported on the first attribute access.
+
+    Args:
+        name (str): Absolute name of the module.
+    """
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.__dict__['_lazy_module'] = None
+
+    def _load(self) -> types.ModuleType:
+        module = self.__dict__['_lazy_module']
+        if module is None:
+            module = importlib.import_module(self.__name__)
+            self.__dict__['_lazy_module'] = module
+        return module
+
+    def __getattr__(self, attr: str):
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+def lazy_import(name: str) -> types.ModuleType:
+    """Returns the module if it is already imported, a lazy module otherwise.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    return LazyModule(name)
+
+# Loaded once an environment is created
+gym = lazy_import("gymnasium")
+
+def make_env(env_id: str, **kwargs) -> "gym.Env":
+    """``gym.make``, importing the package of namespaced environments first.
+    """
+    namespace = env_id.split('/')[0] if '/' in env_id else None
+    if namespace in ENV_NAMESPACES:
+        importlib.import_module(ENV_NAMESPACES[namespace])
+    return gym.make(env_id, **kwargs)
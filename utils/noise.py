@@ -1,68 +1,152 @@
 import numpy as np
+from typing import Optional
+from utils.registry import NOISES
 
 class Noise:
+    """Base class of the exploration noise processes.
+
+    The noise is drawn from the ``np.random.Generator`` of the process in
+    pregenerated blocks of ``block_size`` steps, so that the generator is
+    called once every ``block_size`` samples instead of at every step.
+
+    With ``num_envs`` set in ``reset``, samples have shape
+    ``(num_envs, size)`` for vectorized collection, otherwise ``(size,)``.
+
+    Args:
+        rng (np.random.Generator): Random generator of the process.
+        block_size (int): Number of steps drawn at once.
+    """
+
+    def __init__(self,
+                 rng: Optional[np.random.Generator] = None,
+                 block_size: int = 4096):
+        self._rng = rng if rng is not None else np.random.default_rng()
+        self._block_size = block_size
+        self._size = None
+        self._num_envs = None
+        self._block = None
+        self._block_index = 0
+
+    @property
+    def shape(self) -> tuple:
+        if self._num_envs is None:
+            return (self._size,)
+        return (self._num_envs, self._size)
+
+    def seed(self, seed: int):
+        self._rng = np.random.default_rng(seed)
+        self._block = None
 
-    def __init__(self):
-        pass
-    
     def reset(self,
-              size: int):
-        self._size = size
+              size: int,
+              num_envs: Optional[int] = None,
+              mask: Optional[np.array] = None):
+        """Resets the process.
+
+        Args:
+            size (int): Dimensions of the action.
+            num_envs (int): Number of environments sampled together.
+            mask (np.array): Boolean mask of the environments to reset. All
+                of them by default.
+        """
+        if size != self._size or num_envs != self._num_envs:
+            self._size = size
+            self._num_envs = num_envs
+            self._block = None
+
+    def _draw_block(self, shape: tuple) -> np.array:
+        """Draws the random increments of ``shape[0]`` steps.
+        """
+        raise NotImplementedError()
 
-    def sample(self):
+    def _next_increment(self) -> np.array:
+        """Next step of the block, which is refilled when used up. The
+        returned array is a view of the block.
+        """
+        if self._block is None or self._block_index == self._block_size:
+            self._block = self._draw_block((self._block_size,) + self.shape)
+            self._block.flags.writeable = False
+            self._block_index = 0
+        sample = self._block[self._block_index]
+        self._block_index += 1
+        return sample
+
+    def sample(self) -> np.array:
         raise NotImplementedError()
 
 
+@NOISES.register
 class NormalNoise(Noise):
 
     def __init__(self,
                  mu: float,
-                 sigma: float):
-        super().__init__()
+                 sigma: float,
+                 rng: Optional[np.random.Generator] = None,
+                 block_size: int = 4096):
+        super().__init__(rng=rng, block_size=block_size)
         self.__sigma = sigma
         self.__mu = mu
 
-    def reset(self, 
-              size: int):
-        super().reset(size=size)
-    
-    def sample(self):
-        return np.random.normal(self.__mu,
-                                self.__sigma,
-                                size=self._size)
-
-class OUNoise:
-    """Ornstein-Uhlenbeck process."""
-
-    def __init__(self, mu=0., theta=0.15, sigma=0.2):
-        """Initialize parameters and noise process."""
-        #self.mu = mu * np.ones(size)
+    def _draw_block(self, shape: tuple) -> np.array:
+        return self._rng.normal(self.__mu, self.__sigma, size=shape)
+
+    def sample(self) -> np.array:
+        """Returns a read-only view of the pregenerated block."""
+        return self._next_increment()
+
+@NOISES.register
+class OUNoise(Noise):
+    """Ornstein-Uhlenbeck process, with one state per environment."""
+
+    def __init__(self,
+                 mu: float = 0.,
+                 theta: float = 0.15,
+                 sigma: float = 0.2,
+                 rng: Optional[np.random.Generator] = None,
+                 block_size: int = 4096):
+        super().__init__(rng=rng, block_size=block_size)
         self.mu = mu
         self.theta = theta
         self.sigma = sigma
+        self.state = None
+
+    def _draw_block(self, shape: tuple) -> np.array:
+        return self.sigma * self._rng.standard_normal(size=shape)
 
     def reset(self,
-              size: int):
+              size: int,
+              num_envs: Optional[int] = None,
+              mask: Optional[np.array] = None):
         """Reset the internal state (= noise) to mean (mu)."""
-        self.state = self.mu * np.ones(size)
-        self.size = size
-
-    def sample(self):
+        reshaped = size != self._size or num_envs != self._num_envs
+        super().reset(size=size, num_envs=num_envs, mask=mask)
+        if reshaped or mask is None or self.state is None:
+            self.state = np.full(self.shape, self.mu, dtype=np.float64)
+        else:
+            self.state[np.asarray(mask, dtype=bool)] = self.mu
+
+    def sample(self) -> np.array:
         """Update internal state and return it as a noise sample."""
-        x = self.state
-        dx = self.theta * (self.mu * np.ones(self.size) - x) + self.sigma * np.array([np.random.randn() for i in range(len(x))])
-        self.state = x + dx
-        return self.state
+        self.state += self.theta * (self.mu - self.state) + self._next_increment()
+        return self.state.copy()
 
 if __name__ == "__main__":
 
-    obj = NormalNoise(mu=0.0, sigma=1.0)
-    obj.reset(size=10)
-    print(obj.sample())
+    import time
 
-    obj = OUNoise(mu=0.0, sigma=1.0, theta=0.15)
+    rng = np.random.default_rng(0)
+    obj = NormalNoise(mu=0.0, sigma=1.0, rng=rng)
     obj.reset(size=10)
     print(obj.sample())
 
-
-
+    obj = OUNoise(mu=0.0, sigma=1.0, theta=0.15, rng=rng)
+    obj.reset(size=4, num_envs=3)
+    obj.sample()
+    obj.reset(size=4, num_envs=3, mask=np.array([True, False, False]))
+    print(obj.state)
+
+    obj.reset(size=6)
+    start = time.perf_counter()
+    for _ in range(100000):
+        obj.sample()
+    print("OU sample: {:.2f}us".format((time.perf_counter() - start) * 10))
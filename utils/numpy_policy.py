@@ -0,0 +1,84 @@
+import numpy as np
+
+# Self-contained runtime of the actors exported by export.py. Only depends on
+# numpy, so that it can be copied next to a controller on its own.
+
+ACTIVATIONS = {
+    'relu': lambda x: np.maximum(x, 0.0, out=x),
+    'tanh': lambda x: np.tanh(x, out=x),
+    'elu': lambda x: np.where(x > 0, x, np.expm1(np.minimum(x, 0.0))),
+    'silu': lambda x: x / (1.0 + np.exp(-x)),
+    'identity': lambda x: x,
+}
+
+class NumpyPolicy:
+    """Runs an actor exported to the ``.npz`` format.
+
+    The archive holds the observation normalization (``normalize_observations``,
+    ``observation_low``, ``observation_scale``), the linear layers
+    (``layer_<i>_weight``, ``layer_<i>_bias``), the optional LayerNorm of each
+    of them (``layer_<i>_norm_weight``, ``layer_<i>_norm_bias``,
+    ``layer_<i>_norm_eps``), the activation following each of them
+    (``activations``) and the scale of the actions (``action_scale``).
+
+    Args:
+        path (str): Path of the ``.npz`` archive.
+    """
+
+    def __init__(self, path: str):
+        with np.load(path, allow_pickle=False) as archive:
+            self.__normalize_observations = bool(archive['normalize_observations'])
+            self.__observation_low = archive['observation_low'].astype(np.float32)
+            self.__observation_scale = archive['observation_scale'].astype(np.float32)
+            self.__action_scale = archive['action_scale'].astype(np.float32)
+            activations = [str(activation) for activation in archive['activations']]
+            # Weights are stored transposed, so that a layer is x @ W + b
+            self.__layers = [(np.ascontiguousarray(archive['layer_{}_weight'.format(i)].T, dtype=np.float32),
+                              archive['layer_{}_bias'.format(i)].astype(np.float32),
+                              self.__load_norm(archive, i),
+                              ACTIVATIONS[activation]) for i, activation in enumerate(activations)]
+
+    @staticmethod
+    def __load_norm(archive, index: int):
+        if 'layer_{}_norm_weight'.format(index) not in archive.files:
+            return None
+        return (archive['layer_{}_norm_weight'.format(index)].astype(np.float32),
+                archive['layer_{}_norm_bias'.format(index)].astype(np.float32),
+                float(archive['layer_{}_norm_eps'.format(index)]))
+
+    @property
+    def observation_dims(self) -> int:
+        return self.__layers[0][0].shape[0]
+
+    @property
+    def action_dims(self) -> int:
+        return self.__layers[-1][0].shape[1]
+
+    def __call__(self, obs: np.array) -> np.array:
+        """Deterministic actions of a single or a batch of observations.
+
+        Returns:
+            Actions of shape (batch, action_dims).
+        """
+        x = np.asarray(obs, dtype=np.float32).reshape(-1, self.observation_dims)
+        if self.__normalize_observations:
+            x = (x - self.__observation_low) / self.__observation_scale
+        for weight, bias, norm, activation in self.__layers:
+            x = x @ weight + bias
+            if norm is not None:
+                norm_weight, norm_bias, eps = norm
+                x = (x - x.mean(axis=1, keepdims=True)) / np.sqrt(x.var(axis=1, keepdims=True) + eps)
+                x = x * norm_weight + norm_bias
+            x = activation(x)
+        return x * self.__action_scale
+
+
+if __name__ == "__main__":
+
+    import sys
+    import time
+
+    start = time.perf_counter()
+    policy = NumpyPolicy(sys.argv[1])
+    action = policy(np.zeros(policy.observation_dims, dtype=np.float32))
+    print("Cold start: {:.2f}ms, action: {}".format((time.perf_counter() - start) * 1000, action))
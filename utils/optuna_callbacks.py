@@ -1,9 +1,12 @@
-import optuna
+from typing import Optional
+from utils.lazy import lazy_import
+
+optuna = lazy_import("optuna")
 
 class TrialEvaluationCallback:
 
     def __init__(self,
-                 op_trial: optuna.Trial):
+                 op_trial: "optuna.Trial"):
         
         self.__op_trial = op_trial
         self.__eval_index = 0
@@ -27,14 +30,24 @@ class TrialEvaluationCallback:
         return self.__last_mean_reward
     
     def step(self,
-             eval_value):
+             eval_value,
+             step: Optional[int] = None):
+        """Reports an evaluation to optuna.
+
+        The trial is not stopped by raising here; the learner checks
+        ``is_pruned`` after the call and stops cleanly, after which the
+        objective raises ``optuna.TrialPruned``.
+
+        Args:
+            eval_value: Mean evaluation reward.
+            step (int): Step of the intermediate value. Defaults to the index of the evaluation.
+        """
         
         # Report the result to optuna
         self.__eval_index += 1
-        self.op_trial.report(eval_value, self.eval_index)
+        self.op_trial.report(eval_value, self.eval_index if step is None else step)
         self.__last_mean_reward = eval_value
 
         # Prune trial if needed
         if self.op_trial.should_prune():
             self.__is_pruned = True
-            raise optuna.exceptions.TrialPruned()
\ No newline at end of file
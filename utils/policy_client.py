@@ -0,0 +1,139 @@
+import sys
+import json
+import time
+import socket
+import struct
+import argparse
+import threading
+from array import array
+from typing import List, Optional
+
+# Wire format shared with serve.py. Every frame is a header followed by
+# `length` bytes of payload. Observations and actions are little-endian
+# float32 arrays, the other payloads are utf-8.
+#   request:  <kind: uint8><length: uint32><payload>
+#   response: <status: uint8><length: uint32><payload>
+HEADER = struct.Struct("<BI")
+ACT = 1
+STATS = 2
+RELOAD = 3
+STATUS_OK = 0
+STATUS_ERROR = 1
+
+def recv_exactly(sock: socket.socket, num_bytes: int) -> bytes:
+    buffer = bytearray()
+    while len(buffer) < num_bytes:
+        chunk = sock.recv(num_bytes - len(buffer))
+        if not chunk:
+            raise ConnectionError("Connection closed by the peer.")
+        buffer.extend(chunk)
+    return bytes(buffer)
+
+def recv_frame(sock: socket.socket):
+    kind, length = HEADER.unpack(recv_exactly(sock, HEADER.size))
+    return kind, recv_exactly(sock, length)
+
+def send_frame(sock: socket.socket, kind: int, payload: bytes):
+    sock.sendall(HEADER.pack(kind, len(payload)) + payload)
+
+def to_float32_bytes(values: List[float]) -> bytes:
+    data = array("f", values)
+    if sys.byteorder != "little":
+        data.byteswap()
+    return data.tobytes()
+
+def from_float32_bytes(payload: bytes) -> List[float]:
+    data = array("f")
+    data.frombytes(payload)
+    if sys.byteorder != "little":
+        data.byteswap()
+    return data.tolist()
+
+class PolicyClient:
+    """Client of the policy server, using the standard library only.
+
+    Args:
+        socket_path (str): Unix socket of the server.
+        port (int): Localhost TCP port of the server, used when no socket path is given.
+    """
+
+    def __init__(self,
+                 socket_path: Optional[str] = None,
+                 port: Optional[int] = None):
+        if socket_path is not None:
+            self.__sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.__sock.connect(socket_path)
+        elif port is not None:
+            self.__sock = socket.create_connection(("127.0.0.1", port))
+            self.__sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        else:
+            raise ValueError("Either a socket path or a port is required.")
+
+    def __request(self, kind: int, payload: bytes) -> bytes:
+        send_frame(self.__sock, kind, payload)
+        status, response = recv_frame(self.__sock)
+        if status != STATUS_OK:
+            raise RuntimeError(response.decode("utf-8"))
+        return response
+
+    def act(self, observation: List[float]) -> List[float]:
+        """Action of a single observation, or of several concatenated ones.
+        """
+        return from_float32_bytes(self.__request(ACT, to_float32_bytes(observation)))
+
+    def stats(self) -> dict:
+        return json.loads(self.__request(STATS, b"").decode("utf-8"))
+
+    def reload(self, checkpoint: str) -> dict:
+        """Asks the server to swap to another checkpoint.
+        """
+        return json.loads(self.__request(RELOAD, checkpoint.encode("utf-8")).decode("utf-8"))
+
+    def close(self):
+        self.__sock.close()
+
+def percentile(values: List[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q / 100 * len(values)))]
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--socket", type=str, default=None, help="Unix socket of the server.")
+    parser.add_argument("--port", type=int, default=None, help="Localhost TCP port of the server.")
+    parser.add_argument("--obs-dims", type=int, required=True, help="Observation dimensions.")
+    parser.add_argument("--requests", type=int, default=1000, help="Requests per client.")
+    parser.add_argument("--concurrency", type=int, default=4, help="Number of concurrent clients.")
+    args = parser.parse_args()
+
+    latencies = []
+    lock = threading.Lock()
+
+    def run_client():
+        client = PolicyClient(args.socket, args.port)
+        local_latencies = []
+        for i in range(args.requests):
+            observation = [((i + j) % 7) / 7.0 for j in range(args.obs_dims)]
+            start = time.perf_counter()
+            client.act(observation)
+            local_latencies.append((time.perf_counter() - start) * 1e6)
+        client.close()
+        with lock:
+            latencies.extend(local_latencies)
+
+    threads = [threading.Thread(target=run_client) for _ in range(args.concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    print("Client: {} requests in {:.2f}s ({:.0f} req/s)".format(len(latencies), elapsed, len(latencies) / elapsed))
+    print("Client latency (us): p50 {:.0f}, p90 {:.0f}, p99 {:.0f}".format(percentile(latencies, 50),
+                                                                          percentile(latencies, 90),
+                                                                          percentile(latencies, 99)))
+    client = PolicyClient(args.socket, args.port)
+    print("Server: {}".format(client.stats()))
+    client.close()
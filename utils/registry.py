@@ -0,0 +1,44 @@
+import importlib
+from typing import Callable, Dict, List
+
+class Registry:
+    """Maps names to classes, in place of attribute lookups on modules.
+
+    Classes register themselves with the ``register`` decorator. The modules
+    of the built-in entries are imported on the first lookup only.
+
+    Args:
+        kind (str): Name of the entries, used in error messages.
+        modules (list[str]): Modules of the built-in entries.
+    """
+
+    def __init__(self,
+                 kind: str,
+                 modules: List[str]):
+        self.__kind = kind
+        self.__modules = list(modules)
+        self.__entries: Dict[str, type] = {}
+
+    def register(self, cls: type) -> type:
+        if cls.__name__ in self.__entries and self.__entries[cls.__name__] is not cls:
+            raise ValueError("{} {} is already registered.".format(self.__kind, cls.__name__))
+        self.__entries[cls.__name__] = cls
+        return cls
+
+    def __load_modules(self):
+        while self.__modules:
+            importlib.import_module(self.__modules.pop(0))
+
+    def get(self, name: str) -> type:
+        if name not in self.__entries:
+            self.__load_modules()
+        if name not in self.__entries:
+            raise KeyError("Unknown {} {}. Available: {}.".format(self.__kind, name, ", ".join(self.names())))
+        return self.__entries[name]
+
+    def names(self) -> List[str]:
+        self.__load_modules()
+        return sorted(self.__entries)
+
+MODELS = Registry("model", ["models.models"])
+NOISES = Registry("noise", ["utils.noise"])
@@ -0,0 +1,190 @@
+import json
+import socket
+import struct
+import threading
+import numpy as np
+from typing import Dict, Iterator, NamedTuple, Optional, Tuple
+
+from utils.policy_client import HEADER, send_frame, STATUS_OK
+
+# Requests of replay_server.py, framed as in utils.policy_client. Every
+# payload is a message: <header length: uint32><json header><array bytes>,
+# where the header lists the name, dtype and shape of the arrays, which are
+# little-endian and concatenated in that order.
+SUBSCRIBE = 1
+INSERT = 2
+SAMPLE = 3
+INFO = 4
+TABLES = 5
+
+MESSAGE_HEADER = struct.Struct("<I")
+
+def encode_message(header: dict,
+                   arrays: Optional[Dict[str, np.array]] = None) -> bytes:
+    arrays = {name: np.ascontiguousarray(values, dtype=np.asarray(values).dtype.newbyteorder("<"))
+              for name, values in (arrays or {}).items()}
+    header = dict(header, arrays=[[name, values.dtype.str, list(values.shape)] for name, values in arrays.items()])
+    encoded = json.dumps(header).encode("utf-8")
+    return b"".join([MESSAGE_HEADER.pack(len(encoded)), encoded] + [values.tobytes() for values in arrays.values()])
+
+def decode_message(payload: bytearray) -> Tuple[dict, Dict[str, np.array]]:
+    """Inverse of ``encode_message``. The arrays are views of ``payload``.
+    """
+    length, = MESSAGE_HEADER.unpack_from(payload)
+    offset = MESSAGE_HEADER.size + length
+    header = json.loads(bytes(payload[MESSAGE_HEADER.size:offset]).decode("utf-8"))
+    arrays = {}
+    for name, dtype, shape in header.pop("arrays"):
+        dtype = np.dtype(dtype)
+        count = int(np.prod(shape, dtype=np.int64))
+        arrays[name] = np.frombuffer(payload, dtype=dtype, count=count, offset=offset).reshape(shape)
+        offset += count * dtype.itemsize
+    return header, arrays
+
+def recv_payload(sock: socket.socket, num_bytes: int) -> bytearray:
+    """Receives into a writable buffer, so that the decoded arrays can be
+    wrapped by ``torch.from_numpy``.
+    """
+    buffer = bytearray(num_bytes)
+    view = memoryview(buffer)
+    received = 0
+    while received < num_bytes:
+        count = sock.recv_into(view[received:])
+        if count == 0:
+            raise ConnectionError("Connection closed by the peer.")
+        received += count
+    return buffer
+
+def recv_message_frame(sock: socket.socket) -> Tuple[int, bytearray]:
+    kind, length = HEADER.unpack(bytes(recv_payload(sock, HEADER.size)))
+    return kind, recv_payload(sock, length)
+
+class ReplayClient:
+    """Replay buffer backed by a table of the replay server, with the
+    interface of ``buffers.replay.ReplayBuffer``.
+
+    Subscribing creates the table, or joins it when another learner already
+    did, in which case the transitions of all the learners are sampled
+    together. The rows to sample are drawn by the server from a seed drawn
+    from the generator given to ``sample_batch``, or from the global numpy
+    generator, so a table written by a single learner is sampled
+    reproducibly. Thread safe.
+
+    Args:
+        socket_path (str): Unix socket of the server.
+        table (str): Name of the table.
+        maxsize (int): Number of rows of the table.
+        transition_type (type): Namedtuple of the transitions.
+    """
+
+    def __init__(self,
+                 socket_path: str,
+                 table: str,
+                 maxsize: int,
+                 transition_type: type):
+        self.__sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.__sock.connect(socket_path)
+        self.__lock = threading.Lock()
+        self.__table = table
+        self.__Transition = transition_type
+        self.__maxsize = self.__request(SUBSCRIBE, {'table': table, 'maxsize': maxsize})[0]['maxsize']
+
+    def __request(self,
+                  kind: int,
+                  header: dict,
+                  arrays: Optional[Dict[str, np.array]] = None) -> Tuple[dict, Dict[str, np.array]]:
+        with self.__lock:
+            send_frame(self.__sock, kind, encode_message(header, arrays))
+            status, response = recv_message_frame(self.__sock)
+        if status != STATUS_OK:
+            raise RuntimeError(bytes(response).decode("utf-8"))
+        return decode_message(response)
+
+    @property
+    def table(self) -> str:
+        return self.__table
+
+    @property
+    def maxsize(self):
+        return self.__maxsize
+
+    @property
+    def transition_type(self):
+        return self.__Transition
+
+    def info(self) -> dict:
+        """Size, index and number of transitions added to the table.
+        """
+        return self.__request(INFO, {'table': self.__table})[0]
+
+    @property
+    def replay_size(self):
+        return self.info()['size']
+
+    @property
+    def index(self):
+        return self.info()['index']
+
+    @property
+    def num_added(self):
+        return self.info()['num_added']
+
+    @property
+    def columns(self):
+        raise NotImplementedError("The columns of a replay server table stay in the server.")
+
+    def sample_batch(self,
+                     batch_size: int,
+                     rng: Optional[np.random.RandomState] = None) -> Tuple[int, NamedTuple]:
+        """Samples a batch of transitions (with replacement), with the seed of
+        the server draw taken from ``rng``, or from the global numpy generator
+        if not given.
+
+        Returns:
+            Number of sampled transitions and a transition namedtuple whose
+            fields are arrays with the batch as the leading dimension.
+        """
+        header, arrays = self.__request(SAMPLE, {'table': self.__table,
+                                                 'batch_size': batch_size,
+                                                 'seed': int((rng or np.random).randint(2**31))})
+        if header['num_samples'] == 0:
+            return 0, None
+        return header['num_samples'], self.__Transition(**arrays)
+
+    def sample(self, batch_size):
+        num_samples, batch = self.sample_batch(batch_size)
+        if num_samples == 0:
+            return 0, []
+        return num_samples, [self.__Transition(*values) for values in zip(*batch)]
+
+    def add_batch(self,
+                  batch: NamedTuple):
+        """Bulk inserts transitions given as a namedtuple of arrays with the
+        transitions along the leading dimension.
+        """
+        if len(batch[0]) == 0:
+            return
+        # Stored as float32 by the table anyway
+        arrays = {field: np.asarray(values) for field, values in batch._asdict().items()}
+        arrays = {field: values.astype(np.float32) if np.issubdtype(values.dtype, np.floating) else values
+                  for field, values in arrays.items()}
+        self.__request(INSERT, {'table': self.__table}, arrays)
+
+    def add(self,
+            transition: NamedTuple):
+        self.add_batch(type(transition)(*[np.asarray(value)[None] for value in transition]))
+
+    def add_epsiode(self,
+                    transitions: Iterator[NamedTuple]):
+        transitions = list(transitions)
+        if transitions:
+            self.add_batch(type(transitions[0])(*[np.stack(values) for values in zip(*transitions)]))
+
+    def state_dict(self) -> dict:
+        raise NotImplementedError("Replay server tables are not saved in the training snapshots.")
+
+    def load_state_dict(self, *args, **kwargs):
+        raise NotImplementedError("Replay server tables are not saved in the training snapshots.")
+
+    def close(self):
+        self.__sock.close()
@@ -0,0 +1,194 @@
+import os
+import copy
+import time
+import torch
+import warnings
+import numpy as np
+from contextlib import contextmanager
+from typing import Optional, List, Dict
+from utils.spaces import observation_dtype
+
+def random_observations(observation_space: "gymnasium.spaces.Box",
+                        num_observations: int,
+                        device: torch.device) -> torch.Tensor:
+    """Random observations of the shape and storage type of the space, e.g.
+    uint8 frames for pixel observations.
+    """
+    shape = (num_observations,) + tuple(observation_space.shape)
+    if observation_dtype(observation_space) == np.uint8:
+        return torch.randint(0, 256, shape, dtype=torch.uint8, device=device)
+    return torch.rand(shape, device=device)
+
+class ThreadPolicy:
+    """Controls how many threads PyTorch uses while collecting and while learning.
+
+    Batch-1 inference in ``get_action`` gains nothing from a large intra-op
+    thread pool, while the batched updates might. The policy switches the
+    intra-op thread count when the agent changes phase and optionally pins
+    the process to a set of cores, so that several trainers can share a
+    machine without oversubscribing it.
+
+    When both phases use the same thread count, it is set once and the
+    phases never switch. Otherwise, agents updating at every step switch
+    twice per step. A switch pair costs about a microsecond, against
+    milliseconds for the step itself (benchmarks/bench_thread_switch.py).
+
+    Args:
+        inference_threads (int): Intra-op threads used for action selection.
+        update_threads (int): Intra-op threads used for the updates. Defaults
+            to the number of available cores.
+        interop_threads (int): Inter-op threads. Can only be set once per process.
+        cpu_affinity (list[int]): Cores the process is pinned to.
+        auto_tune (bool): Probe the thread counts at the start of learning and
+            keep the fastest ones.
+        auto_tune_repeats (int): Number of timed repetitions per candidate.
+    """
+
+    def __init__(self,
+                 inference_threads: int = 1,
+                 update_threads: Optional[int] = None,
+                 interop_threads: Optional[int] = None,
+                 cpu_affinity: Optional[List[int]] = None,
+                 auto_tune: bool = False,
+                 auto_tune_repeats: int = 20):
+        self.__cpu_affinity = cpu_affinity
+        self.__interop_threads = interop_threads
+        self.__inference_threads = inference_threads
+        self.__update_threads = update_threads or self.num_available_cores()
+        self.__auto_tune = auto_tune
+        self.__auto_tune_repeats = auto_tune_repeats
+        self.__current_threads = None
+
+    @classmethod
+    def from_params(cls, params: Optional[dict]):
+        return cls(**(params or {}))
+
+    @property
+    def inference_threads(self) -> int:
+        return self.__inference_threads
+
+    @property
+    def update_threads(self) -> int:
+        return self.__update_threads
+
+    @property
+    def is_switching(self) -> bool:
+        """Whether the thread count changes between inference and updates.
+        """
+        return self.__inference_threads != self.__update_threads
+
+    @property
+    def is_auto_tune_enabled(self) -> bool:
+        return self.__auto_tune
+
+    def num_available_cores(self) -> int:
+        if self.__cpu_affinity is not None:
+            return len(self.__cpu_affinity)
+        if hasattr(os, "sched_getaffinity"):
+            return len(os.sched_getaffinity(0))
+        return os.cpu_count()
+
+    def apply(self) -> None:
+        """Applies the process wide settings (affinity and inter-op threads).
+        """
+        if self.__cpu_affinity is not None:
+            if hasattr(os, "sched_setaffinity"):
+                os.sched_setaffinity(0, self.__cpu_affinity)
+            else:
+                warnings.warn("CPU affinity is not supported on this platform.")
+
+        if self.__interop_threads is not None \
+            and torch.get_num_interop_threads() != self.__interop_threads:
+            try:
+                torch.set_num_interop_threads(self.__interop_threads)
+            except RuntimeError:
+                warnings.warn("Inter-op threads can only be set before any parallel work has started.")
+
+        if not self.is_switching:
+            self.__switch(self.__update_threads)
+
+    def __switch(self, num_threads: int) -> None:
+        if self.__current_threads != num_threads:
+            torch.set_num_threads(num_threads)
+            self.__current_threads = num_threads
+
+    @contextmanager
+    def inference(self):
+        """Context for action selection.
+        """
+        if self.is_switching:
+            self.__switch(self.__inference_threads)
+        yield
+
+    @contextmanager
+    def update(self):
+        """Context for the network updates.
+        """
+        if self.is_switching:
+            self.__switch(self.__update_threads)
+        yield
+
+    def __time(self, fn, num_threads: int) -> float:
+        self.__switch(num_threads)
+        fn()
+        start = time.perf_counter()
+        for _ in range(self.__auto_tune_repeats):
+            fn()
+        return (time.perf_counter() - start) / self.__auto_tune_repeats
+
+    def tune(self,
+             actor: torch.nn.Module,
+             critic: torch.nn.Module,
+             observation_space: "gymnasium.spaces.Box",
+             batch_size: int,
+             device: torch.device) -> Dict[str, Dict[int, float]]:
+        """Picks the fastest thread counts for batch-1 inference and for the updates.
+
+        The probe runs on copies of the networks, so the weights of the agent
+        are not touched.
+
+        Returns:
+            Seconds per call for every candidate thread count of each phase.
+        """
+        actor = copy.deepcopy(actor)
+        critic = copy.deepcopy(critic)
+        single_state = random_observations(observation_space, 1, device)
+        batch_states = random_observations(observation_space, batch_size, device)
+
+        def inference():
+            with torch.no_grad():
+                actor(single_state)
+
+        def update():
+            actor.zero_grad()
+            critic.zero_grad()
+            critic(batch_states, actor(batch_states)).mean().backward()
+
+        max_threads = self.num_available_cores()
+        candidates = sorted(set([2**i for i in range(max_threads.bit_length()) if 2**i <= max_threads] + [max_threads]))
+        timings = {'inference': {}, 'update': {}}
+        for num_threads in candidates:
+            timings['inference'][num_threads] = self.__time(inference, num_threads)
+            timings['update'][num_threads] = self.__time(update, num_threads)
+
+        self.__inference_threads = min(timings['inference'], key=timings['inference'].get)
+        self.__update_threads = min(timings['update'], key=timings['update'].get)
+        if not self.is_switching:
+            self.__switch(self.__update_threads)
+        return timings
+
+
+if __name__ == "__main__":
+
+    from gymnasium.spaces import Box
+    from models.models import SimpleActor, SimpleCritic
+
+    obs_space = Box(low=-1.0, high=1.0, shape=(17,))
+    act_space = Box(low=-1.0, high=1.0, shape=(6,))
+    actor = SimpleActor(observation_type=obs_space, action_type=act_space, hidden_size=256)
+    critic = SimpleCritic(observation_type=obs_space, action_type=act_space, hidden_size=256)
+
+    policy = ThreadPolicy(auto_tune=True)
+    timings = policy.tune(actor, critic, observation_space=obs_space, batch_size=256, device=torch.device("cpu"))
+    print(timings)
+    print("Inference threads: {}, Update threads: {}".format(policy.inference_threads, policy.update_threads))
@@ -0,0 +1,28 @@
+import numpy as np
+from utils.lazy import lazy_import
+
+gym = lazy_import("gymnasium")
+
+def is_pixel_space(space: "gym.Space") -> bool:
+    """Image observations, i.e. uint8 boxes of shape (height, width, channels).
+    """
+    return isinstance(space, gym.spaces.Box) and space.dtype == np.uint8 and len(space.shape) == 3
+
+def observation_dtype(space: "gym.Space") -> type:
+    """Storage type of the observations. Frames stay uint8, and are only
+    converted to float on the device of the networks.
+    """
+    return np.uint8 if is_pixel_space(space) else np.float32
+
+def as_stored_observation(obs: np.array) -> np.array:
+    obs = np.asarray(obs)
+    return obs if obs.dtype == np.uint8 else obs.astype(np.float32)
+
+def stack_space(space: "gym.spaces.Box", history_length: int) -> "gym.spaces.Box":
+    """Space of ``history_length`` observations concatenated along their last axis.
+    """
+    if history_length == 1:
+        return space
+    return gym.spaces.Box(low=np.concatenate([space.low] * history_length, axis=-1),
+                          high=np.concatenate([space.high] * history_length, axis=-1),
+                          dtype=space.dtype)